@@ -1,47 +1,72 @@
-from typing import List, Optional
 import asyncio
-
-from fastapi import FastAPI, BackgroundTasks, Depends
-from pydantic import BaseModel, HttpUrl
-
-from db import get_db
-from models import Mirror
-from services.mirrors import (
-    collect_mirrors_for_all,
-    collect_mirrors_for_batch,
+import base64
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field, HttpUrl
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings
+from db import (
+    ReadSessionLocal,
+    dispose_async_engines,
+    get_async_read_db,
+    get_db,
+    get_read_db,
+    init_db,
 )
-
+from merchants_loader import get_merchants
+from models import CollectionJob, Mirror
+from services.changes import fetch_changes
+from services.history import history_query
+from services.jobs import enqueue_job, job_to_dict
+from services.mirrors import collect_mirrors_for_batch
+from services.mirrors_export import iter_mirrors_csv, iter_mirrors_ndjson
+from services.scheduler import plan
+
+from services.browser_pool import get_browser_pool
+from services.http_clients import close_http_clients, init_http_clients
+from services.redirect_cache import get_redirect_cache
+from services.search_cache import get_search_cache
+from services.throttle import throttle_snapshot
 from services.browser_resolver import resolve_url as resolve_single_url
 from services.interactive_collector import resolve_urls_for_merchant
 from services.interactive_full import collect_mirrors_interactive_for_merchant
 
-
-# =======================
-#  СОЗДАЕМ ПРИЛОЖЕНИЕ
-# =======================
-
-app = FastAPI(title="Merchant mirrors API", version="0.6.0")
+settings = get_settings()
 
 
 # =======================
-#  УТИЛИТА: запуск async в BackgroundTasks
+#  СОЗДАЕМ ПРИЛОЖЕНИЕ
 # =======================
 
-def run_async(coro):
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     """
-    BackgroundTasks не await-ит корутины.
-    Поэтому мы запускаем async-код через asyncio.run().
+    Общие ресурсы процесса: пул браузеров Playwright и httpx-клиенты
+    живут всё время работы приложения и закрываются при остановке.
     """
+    init_db()
+
+    browser_pool = get_browser_pool()
+    await browser_pool.start()
+    await init_http_clients()
     try:
-        asyncio.run(coro)
-    except RuntimeError:
-        # Если loop уже существует (редко), используем новый loop вручную
-        loop = asyncio.new_event_loop()
-        try:
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(coro)
-        finally:
-            loop.close()
+        yield
+    finally:
+        await close_http_clients()
+        await browser_pool.stop()
+        await dispose_async_engines()
+
+
+app = FastAPI(title="Merchant mirrors API", version="0.6.0", lifespan=lifespan)
 
 
 # =====================================
@@ -52,12 +77,14 @@ class ResolveUrlRequest(BaseModel):
     url: HttpUrl
     wait_seconds: int = 8
     click_texts: List[str] | None = None
+    country: str | None = None  # пресет текстов кнопок, если click_texts не заданы
 
 
 class ResolveUrlResponse(BaseModel):
     start_url: str
     final_url: str
     redirects: List[str]
+    cta: str | None = None  # текст нажатой кнопки
     ok: bool
     error: str | None = None
 
@@ -67,6 +94,9 @@ class ResolveUrlBatchRequest(BaseModel):
     urls: List[HttpUrl]
     wait_seconds: int = 8
     click_texts: List[str] | None = None
+    country: str | None = None
+    # None — значение из настроек; больше потолка — 422, а не сотни страниц браузера
+    concurrency: int | None = Field(None, ge=1, le=settings.RESOLVE_BATCH_MAX_CONCURRENCY)
 
 
 class ResolveUrlBatchResponseItem(BaseModel):
@@ -74,6 +104,8 @@ class ResolveUrlBatchResponseItem(BaseModel):
     start_url: str
     final_url: str | None
     redirects: List[str]
+    tier: str | None = None
+    cta: str | None = None
     ok: bool
     error: str | None = None
 
@@ -89,15 +121,17 @@ async def resolve_url_endpoint(req: ResolveUrlRequest):
     отслеживает редиректы и пытается нажать типовые кнопки.
     """
     try:
-        final_url, redirects = await resolve_single_url(
+        final_url, redirects, cta = await resolve_single_url(
             url=str(req.url),
             wait_seconds=req.wait_seconds,
             click_texts=req.click_texts,
+            country=req.country,
         )
         return ResolveUrlResponse(
             start_url=str(req.url),
             final_url=final_url,
             redirects=redirects,
+            cta=cta,
             ok=True,
             error=None,
         )
@@ -119,12 +153,15 @@ async def resolve_url_endpoint(req: ResolveUrlRequest):
 async def resolve_url_batch_endpoint(req: ResolveUrlBatchRequest):
     """
     Прогоняет список URL одного мерчанта через Playwright.
+    URL резолвятся параллельно (concurrency), порядок ответа = порядок запроса.
     """
     results = await resolve_urls_for_merchant(
         merchant=req.merchant,
         urls=[str(u) for u in req.urls],
         click_texts=req.click_texts,
         wait_seconds=req.wait_seconds,
+        concurrency=req.concurrency,
+        country=req.country,
     )
     return results
 
@@ -141,6 +178,7 @@ class CollectInteractiveRequest(BaseModel):
     limit: int = 10
     click_texts: List[str] | None = None
     wait_seconds: int = 8
+    bypass_cache: bool = False  # True — не брать редиректы из кэша
 
 
 @app.post(
@@ -151,7 +189,7 @@ async def collect_mirrors_interactive_endpoint(req: CollectInteractiveRequest):
     """
     Полный интерактивный сбор зеркал для одного мерчанта:
       1. Поиск доменов через Serper.dev
-      2. Прогонка каждого URL через Playwright (клики, редиректы)
+      2. Резолв каждого URL: httpx, при необходимости Playwright (клики, редиректы)
       3. Возвращаем финальный список зеркал
     """
     results = await collect_mirrors_interactive_for_merchant(
@@ -162,6 +200,7 @@ async def collect_mirrors_interactive_endpoint(req: CollectInteractiveRequest):
         limit=req.limit,
         click_texts=req.click_texts,
         wait_seconds=req.wait_seconds,
+        bypass_cache=req.bypass_cache,
     )
 
     return {
@@ -187,10 +226,11 @@ class BatchItem(BaseModel):
 
 class CollectBatchRequest(BaseModel):
     items: List[BatchItem]
+    bypass_cache: bool = False  # True — не брать редиректы из кэша
 
 
 class CollectAllRequest(BaseModel):
-    merchants: Optional[List[str]] = None  # сейчас в mirrors.py не используется
+    merchants: Optional[List[str]] = None  # None — все из merchants_config.json
     limit: int = 10
 
 
@@ -199,16 +239,55 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/cache/stats", summary="Cache Stats")
+def cache_stats():
+    """
+    Счётчики попаданий/промахов кэшей (с момента старта процесса).
+    """
+    return {
+        "search": get_search_cache().snapshot(),
+        "redirect": get_redirect_cache().snapshot(),
+    }
+
+
+@app.get("/metrics", summary="Prometheus Metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/throttle/stats", summary="Throttle Stats")
+def throttle_stats():
+    """
+    Лимиты исходящих запросов: повторы, 429, отключённые breaker-ом хосты.
+    """
+    return throttle_snapshot()
+
+
 @app.post(
     "/collect_mirrors_all_async",
     summary="Collect Mirrors All Async",
 )
 def collect_mirrors_all_async_endpoint(
     req: CollectAllRequest,
-    background_tasks: BackgroundTasks,
+    db=Depends(get_db),
 ):
-    background_tasks.add_task(run_async, collect_mirrors_for_all(limit=req.limit))
-    return {"ok": True}
+    """
+    Ставит задание в очередь; выполняет его отдельный процесс worker.py.
+    Статус — GET /jobs/{job_id}.
+    """
+    unknown = get_merchants().unknown(req.merchants)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown merchants: {', '.join(unknown)}")
+
+    job = enqueue_job(
+        db,
+        "all",
+        {
+            "limit": req.limit,
+            "merchants": req.merchants,
+        },
+    )
+    return {"ok": True, "job_id": job.id}
 
 
 @app.post(
@@ -217,19 +296,52 @@ def collect_mirrors_all_async_endpoint(
 )
 def collect_mirrors_batch_endpoint(
     req: CollectBatchRequest,
-    background_tasks: BackgroundTasks,
+    db=Depends(get_db),
 ):
     max_limit = max((item.limit for item in req.items), default=10)
 
-    background_tasks.add_task(
-        run_async,
-        collect_mirrors_for_batch(
-            items=req.items,
-            limit=max_limit,
-            follow_redirects=True,
-        ),
+    job = enqueue_job(
+        db,
+        "batch",
+        {
+            "items": [item.model_dump() for item in req.items],
+            "limit": max_limit,
+            "follow_redirects": True,
+            "bypass_cache": req.bypass_cache,
+        },
     )
-    return {"ok": True}
+    return {"ok": True, "job_id": job.id}
+
+
+@app.get(
+    "/jobs/{job_id}",
+    summary="Job Status",
+)
+def get_job_endpoint(job_id: int, db=Depends(get_read_db)):
+    job = db.get(CollectionJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job_to_dict(job)
+
+
+@app.get(
+    "/scheduler/plan",
+    summary="Recrawl Plan",
+)
+def scheduler_plan_endpoint(
+    limit: int = Query(50, ge=1, le=1000),
+    db=Depends(get_read_db),
+):
+    """
+    Очередь перепроверок глазами планировщика (scheduler.py):
+    задачи от самой просроченной, score >= 1 — пора собирать.
+    """
+    tasks = plan(db)
+    return {
+        "due": sum(1 for task in tasks if task.is_due),
+        "total": len(tasks),
+        "tasks": [task.to_dict() for task in tasks[:limit]],
+    }
 
 
 @app.post(
@@ -242,6 +354,7 @@ async def collect_mirrors_batch_sync_endpoint(req: CollectBatchRequest):
         items=req.items,
         limit=max_limit,
         follow_redirects=True,
+        bypass_cache=req.bypass_cache,
     )
     return result
 
@@ -250,36 +363,173 @@ async def collect_mirrors_batch_sync_endpoint(req: CollectBatchRequest):
 #  /mirrors: фильтры + сортировка по свежести
 # =======================================
 
+def _encode_cursor(mirror: Mirror) -> str:
+    raw = json.dumps([mirror.last_seen_at.isoformat(), mirror.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        seen_at, mirror_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(seen_at), int(mirror_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
 @app.get(
     "/mirrors",
     summary="List Mirrors",
 )
-def list_mirrors(
+async def list_mirrors(
+    response: Response,
     limit: int = 100,
     offset: int = 0,
+    after: Optional[str] = None,
     country: Optional[str] = None,
     merchant: Optional[str] = None,
-    db=Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
     """
     Примеры:
       /mirrors?limit=100
       /mirrors?country=in&limit=100
       /mirrors?country=ar&merchant=stake&limit=100
-      /mirrors?country=ar&limit=100&offset=100
+      /mirrors?country=ar&limit=100&after=<X-Next-Cursor предыдущей страницы>
+
+    Курсор следующей страницы приходит в заголовке X-Next-Cursor
+    (нет заголовка — страниц больше нет). С after страница берётся
+    по индексу (last_seen_at, id), поэтому глубина не влияет на скорость;
+    offset оставлен для совместимости и с after не используется.
     """
-    query = db.query(Mirror)
+    query = select(Mirror)
 
     if country:
-        query = query.filter(Mirror.country == country)
+        query = query.where(Mirror.country == country)
 
     if merchant:
-        query = query.filter(Mirror.merchant == merchant)
+        query = query.where(Mirror.merchant == merchant)
+
+    if after:
+        seen_at, mirror_id = _decode_cursor(after)
+        query = query.where(tuple_(Mirror.last_seen_at, Mirror.id) < (seen_at, mirror_id))
+    elif offset:
+        query = query.offset(offset)
 
     mirrors = (
-        query.order_by(Mirror.last_seen_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
+        await db.scalars(
+            query.order_by(Mirror.last_seen_at.desc(), Mirror.id.desc()).limit(limit)
+        )
+    ).all()
+
+    if mirrors and len(mirrors) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(mirrors[-1])
+
     return mirrors
+
+
+@app.get(
+    "/mirrors/history",
+    summary="Redirect History",
+)
+async def mirror_history(
+    source: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """
+    Куда вёл редиректор: интервалы [first_seen_at, last_seen_at]
+    с одной и той же целью, от старых к новым.
+    source — домен или полный URL.
+
+    Примеры:
+      /mirrors/history?source=stake-go.com
+      /mirrors/history?source=stake-go.com&since=2025-01-01T00:00:00&until=2025-01-08T00:00:00
+    """
+    rows = await db.execute(history_query(source, since=since, until=until, limit=limit))
+    return [dict(row) for row in rows.mappings()]
+
+
+@app.get(
+    "/mirrors/export",
+    summary="Export Mirrors",
+)
+def export_mirrors(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    country: Optional[str] = None,
+    merchant: Optional[str] = None,
+    since: Optional[datetime] = None,
+):
+    """
+    Потоковая выгрузка всей таблицы (или её среза) в NDJSON или CSV.
+    since — только записи с last_seen_at >= since.
+
+    Примеры:
+      /mirrors/export
+      /mirrors/export?format=csv&country=in
+      /mirrors/export?merchant=stake&since=2025-01-01T00:00:00
+    """
+    filters = {"country": country, "merchant": merchant, "since": since}
+
+    if format == "csv":
+        return StreamingResponse(
+            iter_mirrors_csv(**filters),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="mirrors.csv"'},
+        )
+
+    return StreamingResponse(
+        iter_mirrors_ndjson(**filters),
+        media_type="application/x-ndjson",
+    )
+
+
+# Максимальное ожидание long-poll и шаг опроса БД (пишет отдельный воркер,
+# поэтому узнать о новых записях можно только из самой таблицы)
+_CHANGES_MAX_WAIT = 60
+_CHANGES_POLL_INTERVAL = 1.0
+
+
+def _load_changes(since_seq: int, limit: int) -> List[dict]:
+    db = ReadSessionLocal()
+    try:
+        return fetch_changes(db, since_seq, limit)
+    finally:
+        db.close()
+
+
+@app.get(
+    "/mirrors/changes",
+    summary="Mirror Changes Feed",
+)
+async def mirror_changes(
+    since_seq: int = 0,
+    limit: int = Query(500, ge=1, le=5000),
+    wait: int = Query(0, ge=0, le=_CHANGES_MAX_WAIT),
+):
+    """
+    Инкрементальная лента: новые зеркала и смены final_domain после since_seq.
+    Клиент хранит last_seq из ответа и передаёт его в следующий запрос.
+
+    wait > 0 — long-poll: если изменений пока нет, ждём до wait секунд
+    и отвечаем, как только они появятся.
+
+    Примеры:
+      /mirrors/changes?since_seq=0
+      /mirrors/changes?since_seq=1234&wait=30
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+
+    while True:
+        changes = await run_in_threadpool(_load_changes, since_seq, limit)
+        if changes or loop.time() >= deadline:
+            break
+        await asyncio.sleep(min(_CHANGES_POLL_INTERVAL, deadline - loop.time()))
+
+    return {
+        "changes": changes,
+        "last_seq": changes[-1]["seq"] if changes else since_seq,
+    }
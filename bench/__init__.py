@@ -0,0 +1,6 @@
+# bench/__init__.py
+"""
+Офлайн-бенчмарк конвейера сбора: поддельный Serper и синтетическая
+ферма редиректов (bench/farm.py), прогон сценариев и отчёт
+(bench/__main__.py). Запуск: python -m bench --help
+"""
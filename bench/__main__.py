@@ -0,0 +1,551 @@
+# bench/__main__.py
+"""
+Офлайн-бенчмарк: сбор, резолв и /mirrors против фермы из bench/farm.py.
+
+Запуск:
+    python -m bench                                   # все сценарии, масштаб по умолчанию
+    python -m bench --merchants 50 --keywords 4 --results 10 --no-browser
+    python -m bench --scenarios resolve --resolve-urls 500 --out new.json --compare old.json
+
+Ферма поднимается отдельным процессом и работает как HTTP-прокси,
+поэтому код сбора ходит в «сеть» как обычно; подменяется только
+resolve_tiered — обёрткой-таймером для точных перцентилей.
+БД — временный SQLite (или --db), кэши выключены (--with-caches — включить),
+лимиты throttle сняты (--keep-limits — оставить из настроек).
+Любую настройку из config.py можно задать через переменные окружения,
+например REDIRECT_CONCURRENCY=32 python -m bench.
+
+Отчёт (JSON) на каждый сценарий: пропускная способность, p50/p95/p99
+задержки одного элемента, пиковый RSS (процесс + Chromium), скорость
+записи в БД. В отчёт попадает коммит, так что прогоны на разных
+коммитах можно сравнить через --compare.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .farm import SERPER_HOST, FarmConfig, add_farm_arguments, farm_config_from_args
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = ("collect", "resolve", "api")
+
+COUNTRIES = ["in", "br", "tr", "bd", "ru"]
+KEYWORDS = ["casino", "bet", "login", "app", "mirror", "bonus", "apk", "register"]
+
+
+# ---------- окружение ----------
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_port(port: int, proc: subprocess.Popen, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"farm exited with code {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("farm did not start in time")
+
+
+def start_farm(config: FarmConfig, port: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "bench.farm", "--port", str(port), *config.to_args()],
+        cwd=ROOT,
+    )
+    try:
+        _wait_port(port, proc)
+    except Exception:
+        proc.kill()
+        raise
+    return proc
+
+
+def configure_env(args: argparse.Namespace, port: int, db_path: Path) -> None:
+    """
+    Настройки читаются при первом импорте config.py,
+    поэтому окружение готовим до импорта кода сбора.
+    """
+    proxy = f"http://127.0.0.1:{port}"
+    forced = {
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "SERPER_API_KEY": "bench",
+        "SERPER_URL": f"http://{SERPER_HOST}/search",
+        "HTTP_PROXY": proxy,
+        "http_proxy": proxy,
+        "NO_PROXY": "127.0.0.1,localhost",
+        "no_proxy": "127.0.0.1,localhost",
+        "BROWSER_PROXY": proxy,
+        "SEARCH_CACHE_ENABLED": "1" if args.with_caches else "0",
+        "REDIRECT_CACHE_ENABLED": "1" if args.with_caches else "0",
+        "WORKER_METRICS_PORT": "0",
+    }
+    if args.no_browser:
+        forced["TIERED_ESCALATION_ENABLED"] = "0"
+    os.environ.update(forced)
+
+    if not args.keep_limits:
+        for name in ("SERPER_RATE_PER_SECOND", "SERPER_BURST", "HOST_RATE_PER_SECOND", "HOST_BURST"):
+            os.environ.setdefault(name, "100000")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+# ---------- измерения ----------
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class Probe:
+    """
+    Замер одного сценария: время стены, задержки элементов
+    и пиковый RSS (опрос раз в 50 мс, вместе с дочерним Chromium).
+    """
+
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self.peak_rss_mb = 0.0
+        self.started = 0.0
+        self.wall = 0.0
+        self._sampler: Optional[asyncio.Task] = None
+
+    def _sample(self) -> None:
+        from services.browser_pool import _children_rss_mb
+
+        self.peak_rss_mb = max(self.peak_rss_mb, _rss_mb() + (_children_rss_mb() or 0.0))
+
+    async def _sample_forever(self) -> None:
+        while True:
+            self._sample()
+            await asyncio.sleep(0.05)
+
+    async def __aenter__(self) -> "Probe":
+        self._sampler = asyncio.create_task(self._sample_forever())
+        self.started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.wall = time.perf_counter() - self.started
+        self._sampler.cancel()
+        self._sample()
+
+    def timed(self, fn: Callable) -> Callable:
+        """Обёртка корутины, которая пишет её время в latencies (отменённые не считаем)."""
+
+        async def wrapper(*a, **kw):
+            started = time.perf_counter()
+            result = await fn(*a, **kw)
+            self.latencies.append(time.perf_counter() - started)
+            return result
+
+        return wrapper
+
+    def report(self, items: int, **extra: Any) -> Dict[str, Any]:
+        return {
+            "wall_seconds": round(self.wall, 3),
+            "items": items,
+            "throughput_per_s": round(items / self.wall, 2) if self.wall else None,
+            "latency_ms": latency_summary(self.latencies),
+            "peak_rss_mb": round(self.peak_rss_mb, 1),
+            **extra,
+        }
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentile по ближайшему рангу; values отсортирован."""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    ms = lambda v: round(v * 1000, 2)  # noqa: E731
+    return {
+        "count": len(ordered),
+        "mean": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        "p50": ms(percentile(ordered, 50)),
+        "p95": ms(percentile(ordered, 95)),
+        "p99": ms(percentile(ordered, 99)),
+        "max": ms(ordered[-1]) if ordered else 0.0,
+    }
+
+
+def _db_write_stats() -> Dict[str, float]:
+    """Сумма и число записей в гистограмме DB_WRITE_LATENCY (с начала процесса)."""
+    from prometheus_client import REGISTRY
+
+    stats = {}
+    for op in ("upsert", "commit"):
+        total = REGISTRY.get_sample_value("mirrors_db_write_seconds_sum", {"op": op}) or 0.0
+        count = REGISTRY.get_sample_value("mirrors_db_write_seconds_count", {"op": op}) or 0.0
+        stats[op] = (total, count)
+    return stats
+
+
+def _db_write_delta(before: Dict, after: Dict) -> Dict[str, Any]:
+    result = {}
+    for op, (total, count) in after.items():
+        d_total = total - before[op][0]
+        d_count = count - before[op][1]
+        result[f"{op}_count"] = int(d_count)
+        result[f"{op}_mean_ms"] = round(d_total / d_count * 1000, 2) if d_count else 0.0
+    return result
+
+
+# ---------- сценарии ----------
+
+
+def _keywords(count: int) -> List[str]:
+    return [KEYWORDS[i] if i < len(KEYWORDS) else f"kw{i}" for i in range(count)]
+
+
+async def run_collect(args: argparse.Namespace) -> Dict[str, Any]:
+    """collect_mirrors_for_batch по --merchants × --keywords, --results URL на keyword."""
+    from services import mirrors
+
+    items = [
+        {
+            "merchant": f"brand{i}",
+            "country": COUNTRIES[i % len(COUNTRIES)],
+            "keywords": _keywords(args.keywords),
+        }
+        for i in range(args.merchants)
+    ]
+
+    original = mirrors.resolve_tiered
+    before = _db_write_stats()
+    async with Probe() as probe:
+        mirrors.resolve_tiered = probe.timed(original)
+        try:
+            result = await mirrors.collect_mirrors_for_batch(
+                items=items,
+                limit=args.results * args.keywords,
+                follow_redirects=True,
+                bypass_cache=not args.with_caches,
+            )
+        finally:
+            mirrors.resolve_tiered = original
+
+    written = result["created"] + result["updated"]
+    return probe.report(
+        len(probe.latencies),
+        unit="url",
+        created=result["created"],
+        updated=result["updated"],
+        db_rows_per_s=round(written / probe.wall, 2) if probe.wall else None,
+        db_writes=_db_write_delta(before, _db_write_stats()),
+    )
+
+
+async def run_resolve(args: argparse.Namespace, farm: FarmConfig) -> Dict[str, Any]:
+    """resolve_urls_for_merchant на --resolve-urls URL из выдачи фермы."""
+    from services import interactive_collector
+
+    urls: List[str] = []
+    page = 0
+    while len(urls) < args.resolve_urls:
+        urls.extend(farm.results(f"brand0 resolve{page}", 10))
+        page += 1
+    urls = urls[: args.resolve_urls]
+
+    # Без браузера остаётся только tiered: http-уровень, эскалация выключена
+    tiered = args.tiered or args.no_browser
+
+    originals = (interactive_collector.resolve_tiered, interactive_collector.resolve_url)
+    async with Probe() as probe:
+        interactive_collector.resolve_tiered = probe.timed(originals[0])
+        interactive_collector.resolve_url = probe.timed(originals[1])
+        try:
+            results = await interactive_collector.resolve_urls_for_merchant(
+                "brand0",
+                urls,
+                use_cache=args.with_caches,
+                tiered=tiered,
+                country="in",
+            )
+        finally:
+            interactive_collector.resolve_tiered, interactive_collector.resolve_url = originals
+
+    tiers: Dict[str, int] = {}
+    for item in results:
+        tiers[item["tier"] or "error"] = tiers.get(item["tier"] or "error", 0) + 1
+    return probe.report(
+        len(results),
+        unit="url",
+        tiered=tiered,
+        errors=sum(1 for item in results if not item["ok"]),
+        tiers=tiers,
+    )
+
+
+def _seed_rows(count: int, existing: int) -> Dict[str, Any]:
+    """Досыпает синтетические строки mirrors до count через bulk_upsert_mirrors."""
+    from config import get_settings
+    from db import SessionLocal
+    from services.mirrors import bulk_upsert_mirrors
+
+    batch_size = max(1, get_settings().DB_WRITE_BATCH_SIZE)
+    missing = max(0, count - existing)
+    started = time.perf_counter()
+    written = 0
+    for start in range(0, missing, batch_size):
+        rows = []
+        for i in range(start, min(missing, start + batch_size)):
+            merchant = f"brand{i % 50}"
+            host = f"{merchant}-s{i}.com"
+            rows.append(
+                {
+                    "merchant": merchant,
+                    "country": COUNTRIES[i % len(COUNTRIES)],
+                    "keyword": KEYWORDS[i % len(KEYWORDS)],
+                    "source_url": f"http://seed{i}.net/",
+                    "source_domain": f"seed{i}.net",
+                    "final_url": f"http://{host}/land",
+                    "final_domain": host,
+                    "is_redirector": True,
+                    "is_mirror": True,
+                }
+            )
+        db = SessionLocal()
+        try:
+            written += bulk_upsert_mirrors(db, rows).created
+        finally:
+            db.close()
+    wall = time.perf_counter() - started
+    return {
+        "rows": written,
+        "wall_seconds": round(wall, 3),
+        "db_rows_per_s": round(written / wall, 2) if wall and written else None,
+    }
+
+
+async def run_api(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    --api-requests запросов к /mirrors (без фильтра, по стране, по стране
+    и мерчанту), каждый фильтр листается курсором до конца и по кругу.
+    """
+    import httpx
+    from sqlalchemy import func, select
+
+    from app import app
+    from db import SessionLocal
+    from models import Mirror
+
+    db = SessionLocal()
+    try:
+        existing = db.scalar(select(func.count()).select_from(Mirror))
+    finally:
+        db.close()
+    seeded = await asyncio.to_thread(_seed_rows, args.api_rows, existing)
+
+    filters = [{}, {"country": "in"}, {"country": "br", "merchant": "brand1"}]
+    cursors: Dict[int, Optional[str]] = {}
+    rows_returned = 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async with Probe() as probe:
+
+            async def fetch(params: Dict[str, Any]) -> httpx.Response:
+                resp = await client.get("/mirrors", params=params)
+                resp.raise_for_status()
+                return resp
+
+            timed_fetch = probe.timed(fetch)
+            for n in range(args.api_requests):
+                slot = n % len(filters)
+                params = {**filters[slot], "limit": args.page_size}
+                if cursors.get(slot):
+                    params["after"] = cursors[slot]
+                resp = await timed_fetch(params)
+                rows_returned += len(resp.json())
+                cursors[slot] = resp.headers.get("x-next-cursor")
+
+    return probe.report(
+        args.api_requests,
+        unit="request",
+        rows_returned=rows_returned,
+        table_rows=existing + seeded["rows"],
+        seed=seeded,
+    )
+
+
+async def run(args: argparse.Namespace, farm: FarmConfig) -> Dict[str, Any]:
+    from db import dispose_async_engines, init_db
+    from services.browser_pool import get_browser_pool
+    from services.http_clients import close_http_clients, init_http_clients
+
+    init_db()
+    await init_http_clients()
+    browser_pool = get_browser_pool()
+
+    results: Dict[str, Any] = {}
+    try:
+        for name in args.scenarios:
+            print(f"running {name}...", file=sys.stderr)
+            if name == "collect":
+                results[name] = await run_collect(args)
+            elif name == "resolve":
+                results[name] = await run_resolve(args, farm)
+            elif name == "api":
+                results[name] = await run_api(args)
+    finally:
+        await close_http_clients()
+        await browser_pool.stop()
+        await dispose_async_engines()
+    return results
+
+
+# ---------- отчёт ----------
+
+# Метрики для сравнения: путь в отчёте сценария и «что лучше»
+_COMPARED = [
+    (("throughput_per_s",), "higher"),
+    (("latency_ms", "p50"), "lower"),
+    (("latency_ms", "p95"), "lower"),
+    (("latency_ms", "p99"), "lower"),
+    (("peak_rss_mb",), "lower"),
+    (("db_rows_per_s",), "higher"),
+    (("wall_seconds",), "lower"),
+]
+
+
+def _dig(data: Dict[str, Any], path) -> Optional[float]:
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data if isinstance(data, (int, float)) else None
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    header = f"commit {report['commit']}"
+    if baseline is not None:
+        header += f" vs {baseline.get('commit')}"
+    print(header)
+
+    for name, scenario in report["scenarios"].items():
+        print(f"\n[{name}] {scenario.get('items')} {scenario.get('unit')}(s)")
+        old = (baseline or {}).get("scenarios", {}).get(name)
+        for path, better in _COMPARED:
+            value = _dig(scenario, path)
+            if value is None:
+                continue
+            line = f"  {'.'.join(path):<20} {value:>12.2f}"
+            prev = _dig(old, path) if old else None
+            if prev:
+                change = (value - prev) / prev * 100
+                improved = change > 0 if better == "higher" else change < 0
+                line += f"  {prev:>12.2f}  {change:+7.1f}% {'better' if improved else 'worse'}"
+            print(line)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Offline collection benchmark")
+    parser.add_argument(
+        "--scenarios",
+        type=lambda v: [s for s in v.split(",") if s],
+        default=list(SCENARIOS),
+        help=f"через запятую из {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument("--merchants", type=int, default=10)
+    parser.add_argument("--keywords", type=int, default=3)
+    parser.add_argument("--results", type=int, default=10, help="URL в выдаче на keyword")
+    parser.add_argument("--resolve-urls", type=int, default=100)
+    parser.add_argument("--tiered", action="store_true", help="resolve: httpx, браузер по эвристикам")
+    parser.add_argument("--api-requests", type=int, default=500)
+    parser.add_argument("--api-rows", type=int, default=10_000, help="сколько строк mirrors держать для /mirrors")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--no-browser", action="store_true", help="без Playwright: только http-уровень")
+    parser.add_argument("--with-caches", action="store_true")
+    parser.add_argument("--keep-limits", action="store_true", help="не снимать лимиты throttle")
+    parser.add_argument("--db", type=Path, help="файл SQLite (по умолчанию временный)")
+    parser.add_argument("--out", type=Path, help="куда записать JSON-отчёт")
+    parser.add_argument("--compare", type=Path, help="JSON-отчёт прошлого прогона")
+    add_farm_arguments(parser)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    farm = farm_config_from_args(args)
+
+    with tempfile.TemporaryDirectory(prefix="mirrors-bench-") as tmp:
+        db_path = (args.db or Path(tmp) / "bench.db").resolve()
+        port = _free_port()
+        configure_env(args, port, db_path)
+
+        proc = start_farm(farm, port)
+        try:
+            scenarios = asyncio.run(run(args, farm))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    params = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}
+    report = {
+        "commit": git_commit(),
+        "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "params": params,
+        "scenarios": scenarios,
+    }
+
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print_report(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
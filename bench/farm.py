@@ -0,0 +1,273 @@
+# bench/farm.py
+"""
+Синтетический интернет для бенчмарка: поддельный Serper.dev
+(POST /search) и ферма редиректоров/лендингов на одном порту.
+
+Сервер работает как HTTP-прокси: httpx (HTTP_PROXY) и Chromium
+(BROWSER_PROXY) шлют ему запросы к любым хостам, поведение страницы
+закодировано в пути:
+
+    /c/{hops}/{final}      цепочка из hops 302-редиректов, потом лендинг
+    /meta/{final}          <meta http-equiv="refresh"> на лендинг
+    /js/{final}            location.href = ... на лендинг
+    /cta/{final}           заглушка с кнопкой «Continue»
+    /slow/{ms}/{final}     ответ через ms миллисекунд, потом 302
+    /large/{kb}            лендинг размером kb килобайт
+    /land                  обычный лендинг
+
+Выдача Serper детерминирована: зависит только от seed и текста запроса,
+поэтому прогоны на разных коммитах видят одни и те же URL.
+
+Запуск отдельно (обычно его поднимает python -m bench):
+    python -m bench.farm --port 8899 --seed 1
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
+from starlette.routing import Route
+
+SERPER_HOST = "serper.bench"
+
+# Виды результатов в выдаче и их веса по умолчанию
+DEFAULT_MIX: Dict[str, float] = {
+    "direct": 2,   # сразу зеркало бренда
+    "chain": 4,    # 1-4 редиректа через трекеры
+    "meta": 1,
+    "js": 1,
+    "cta": 1,
+    "slow": 1,
+    "large": 1,
+    "other": 3,    # посторонний сайт
+}
+
+_BRAND_RE = re.compile(r"[^a-z0-9-]+")
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """"chain=4,meta=1,other=2" -> {"chain": 4.0, ...}; неуказанные виды — 0."""
+    mix = {kind: 0.0 for kind in DEFAULT_MIX}
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        kind, sep, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in mix or not sep:
+            raise ValueError(f"bad mix entry {part!r}, kinds: {', '.join(DEFAULT_MIX)}")
+        mix[kind] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise ValueError("mix: all weights are zero")
+    return mix
+
+
+def format_mix(mix: Dict[str, float]) -> str:
+    return ",".join(f"{kind}={weight:g}" for kind, weight in mix.items())
+
+
+@dataclass(frozen=True)
+class FarmConfig:
+    seed: int = 1
+    mix: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_MIX))
+    mirrors_per_brand: int = 5   # меньше — больше повторов одних и тех же доменов
+    slow_ms: int = 800
+    large_kb: int = 512
+    serper_ms: int = 200         # задержка ответа Serper
+    hop_ms: int = 20             # задержка каждого ответа фермы
+
+    def to_args(self) -> List[str]:
+        return [
+            "--seed", str(self.seed),
+            "--mix", format_mix(self.mix),
+            "--mirrors-per-brand", str(self.mirrors_per_brand),
+            "--slow-ms", str(self.slow_ms),
+            "--large-kb", str(self.large_kb),
+            "--serper-ms", str(self.serper_ms),
+            "--hop-ms", str(self.hop_ms),
+        ]
+
+    def _rng(self, *parts: object) -> random.Random:
+        digest = hashlib.sha256(repr((self.seed, *parts)).encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def results(self, query: str, num: int) -> List[str]:
+        """Органическая выдача для запроса: брендом считается первое слово."""
+        words = query.lower().split()
+        brand = _BRAND_RE.sub("", words[0]) if words else "brand"
+        rng = self._rng(query, num)
+        kinds = [kind for kind, weight in self.mix.items() if weight > 0]
+        weights = [self.mix[kind] for kind in kinds]
+
+        urls = []
+        for _ in range(max(0, num)):
+            kind = rng.choices(kinds, weights)[0]
+            mirror = f"{brand}-m{rng.randrange(max(1, self.mirrors_per_brand))}.com"
+            tracker = f"trk{rng.randrange(1000)}.net"
+            if kind == "direct":
+                urls.append(f"http://{mirror}/land")
+            elif kind == "chain":
+                urls.append(f"http://go.{tracker}/c/{rng.randint(1, 4)}/{mirror}")
+            elif kind in ("meta", "js", "cta"):
+                urls.append(f"http://lp.{tracker}/{kind}/{mirror}")
+            elif kind == "slow":
+                urls.append(f"http://slow.{tracker}/slow/{self.slow_ms}/{mirror}")
+            elif kind == "large":
+                urls.append(f"http://{mirror}/large/{self.large_kb}")
+            else:
+                urls.append(f"http://site{rng.randrange(10_000)}.org/land")
+        return urls
+
+
+def _landing(title: str, body: str = "") -> str:
+    return (
+        f"<!doctype html><html><head><title>{title}</title></head>"
+        f"<body><h1>{title}</h1>{body}</body></html>"
+    )
+
+
+def create_app(config: FarmConfig) -> Starlette:
+    async def pause(ms: int) -> None:
+        if ms > 0:
+            await asyncio.sleep(ms / 1000)
+
+    async def serper(request: Request) -> JSONResponse:
+        payload = await request.json()
+        await pause(config.serper_ms)
+        links = config.results(str(payload.get("q", "")), int(payload.get("num", 10)))
+        return JSONResponse(
+            {"organic": [{"position": i + 1, "link": link} for i, link in enumerate(links)]}
+        )
+
+    async def chain(request: Request):
+        await pause(config.hop_ms)
+        hops = request.path_params["hops"]
+        final = request.path_params["final"]
+        if hops <= 1:
+            return RedirectResponse(f"http://{final}/land", status_code=302)
+        host = request.headers.get("host", "trk.net").split(".", 1)[-1]
+        return RedirectResponse(f"http://hop{hops}.{host}/c/{hops - 1}/{final}", status_code=302)
+
+    async def meta(request: Request) -> HTMLResponse:
+        await pause(config.hop_ms)
+        target = f"http://{request.path_params['final']}/land"
+        head = f'<meta http-equiv="refresh" content="0; url={target}">'
+        return HTMLResponse(f"<!doctype html><html><head>{head}</head><body></body></html>")
+
+    async def js(request: Request) -> HTMLResponse:
+        await pause(config.hop_ms)
+        target = f"http://{request.path_params['final']}/land"
+        return HTMLResponse(_landing("Redirecting", f'<script>window.location.href="{target}";</script>'))
+
+    async def cta(request: Request) -> HTMLResponse:
+        await pause(config.hop_ms)
+        target = f"http://{request.path_params['final']}/land"
+        return HTMLResponse(_landing("Notice", f'<a href="{target}"><button>Continue</button></a>'))
+
+    async def slow(request: Request):
+        await pause(request.path_params["ms"])
+        return RedirectResponse(f"http://{request.path_params['final']}/land", status_code=302)
+
+    async def large(request: Request) -> StreamingResponse:
+        await pause(config.hop_ms)
+        filler = ("<p>" + "lorem ipsum dolor sit amet " * 36 + "</p>\n").encode()
+        chunk = filler * max(1, 16 * 1024 // len(filler))
+        total = request.path_params["kb"] * 1024
+
+        async def body():
+            yield b"<!doctype html><html><head><title>Landing</title></head><body>"
+            sent = 0
+            while sent < total:
+                yield chunk
+                sent += len(chunk)
+            yield b"</body></html>"
+
+        return StreamingResponse(body(), media_type="text/html")
+
+    async def land(request: Request) -> HTMLResponse:
+        await pause(config.hop_ms)
+        return HTMLResponse(_landing(request.headers.get("host", "landing")))
+
+    app = Starlette(
+        routes=[
+            Route("/search", serper, methods=["POST"]),
+            Route("/c/{hops:int}/{final}", chain),
+            Route("/meta/{final}", meta),
+            Route("/js/{final}", js),
+            Route("/cta/{final}", cta),
+            Route("/slow/{ms:int}/{final}", slow),
+            Route("/large/{kb:int}", large),
+            Route("/land", land),
+        ]
+    )
+    return _proxy_paths(app)
+
+
+def _proxy_paths(app):
+    """
+    Прокси-запросы приходят с абсолютным URL в строке запроса
+    (GET http://host/path) — оставляем от него только путь.
+    """
+
+    async def wrapped(scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(("http://", "https://")):
+            path = urlsplit(scope["path"]).path or "/"
+            scope = dict(scope, path=path, raw_path=path.encode())
+        await app(scope, receive, send)
+
+    return wrapped
+
+
+def add_farm_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = FarmConfig()
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=dict(DEFAULT_MIX),
+        help=f"веса видов выдачи, по умолчанию {format_mix(DEFAULT_MIX)}",
+    )
+    parser.add_argument("--mirrors-per-brand", type=int, default=defaults.mirrors_per_brand)
+    parser.add_argument("--slow-ms", type=int, default=defaults.slow_ms)
+    parser.add_argument("--large-kb", type=int, default=defaults.large_kb)
+    parser.add_argument("--serper-ms", type=int, default=defaults.serper_ms)
+    parser.add_argument("--hop-ms", type=int, default=defaults.hop_ms)
+
+
+def farm_config_from_args(args: argparse.Namespace) -> FarmConfig:
+    return FarmConfig(
+        seed=args.seed,
+        mix=args.mix,
+        mirrors_per_brand=args.mirrors_per_brand,
+        slow_ms=args.slow_ms,
+        large_kb=args.large_kb,
+        serper_ms=args.serper_ms,
+        hop_ms=args.hop_ms,
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Serper + redirect farm")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8899)
+    add_farm_arguments(parser)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(farm_config_from_args(args)),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+        access_log=False,
+    )
@@ -2,15 +2,126 @@
 
 from __future__ import annotations
 
+from typing import List
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     # Ключ для Serper.dev
     SERPER_API_KEY: str
+    SERPER_URL: str = "https://google.serper.dev/search"  # бенчмарк подставляет свой (bench/)
 
     # URL к базе данных (из .env: DATABASE_URL=...)
     DATABASE_URL: str = "sqlite:///./mirrors.db"
+    # Асинхронный драйвер (db.py); пусто — выводится из DATABASE_URL (aiosqlite/asyncpg)
+    ASYNC_DATABASE_URL: str = ""
+
+    # Профиль SQLite (db.py): WAL, один писатель и пул читателей
+    SQLITE_WAL: bool = True
+    SQLITE_SYNCHRONOUS: str = "NORMAL"           # в WAL безопасно, fsync только на checkpoint
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024    # байт файла БД, читаемых через mmap
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024        # page cache на соединение
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000           # ждём чужую блокировку вместо "database is locked"
+    SQLITE_READ_POOL_SIZE: int = 8               # соединений на чтение
+    SQLITE_WRITE_TIMEOUT: float = 30.0           # сколько сессия ждёт единственное соединение на запись
+
+    # Пул браузеров Playwright (services/browser_pool.py)
+    BROWSER_POOL_SIZE: int = 1               # сколько Chromium держим одновременно
+    BROWSER_MAX_PAGES: int = 4               # максимум открытых страниц на весь пул
+    BROWSER_RECYCLE_AFTER_PAGES: int = 200   # перезапуск браузера после N страниц
+    BROWSER_MAX_RSS_MB: int = 1500           # перезапуск при превышении памяти (0 — выкл.)
+    BROWSER_PROXY: str = ""                  # прокси для Chromium, напр. http://host:port (пусто — без)
+
+    # Профиль загрузки страницы в резолвере (services/page_profile.py)
+    BROWSER_PROFILE: str = "light"           # "light" — блокируем тяжёлое, "full" — как раньше
+    BROWSER_BLOCK_STYLESHEETS: bool = False
+    BROWSER_SETTLE_MS: int = 1500            # «тишина» навигации после domcontentloaded
+    BROWSER_CTA_NAVIGATION_MS: int = 5000    # сколько ждём перехода после клика по кнопке
+
+    # Параллельный резолв URL одного мерчанта (services/interactive_collector.py)
+    RESOLVE_BATCH_CONCURRENCY: int = 4
+    RESOLVE_BATCH_MAX_CONCURRENCY: int = 16  # потолок для concurrency из запроса
+    RESOLVE_PER_HOST_LIMIT: int = 2
+
+    # Конвейер сбора зеркал (services/mirrors.py)
+    SEARCH_CONCURRENCY: int = 4      # одновременных запросов к Serper
+    REDIRECT_CONCURRENCY: int = 16   # одновременных resolve_final_url
+    DB_WRITE_BATCH_SIZE: int = 200   # строк в одной транзакции writer-а
+    DB_WRITE_FLUSH_INTERVAL: float = 0.5  # сколько ждём добора пачки, сек
+
+    # Кэш выдачи Serper (services/search_cache.py)
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_TTL: int = 24 * 3600           # свежая запись, сек
+    SEARCH_CACHE_STALE_TTL: int = 3 * 24 * 3600  # сколько ещё отдаём устаревшую и обновляем в фоне
+    SEARCH_CACHE_MAX_ENTRIES: int = 50_000
+    SEARCH_CACHE_TOUCH_BATCH: int = 500          # last_access_at пишем пачкой из N обращений...
+    SEARCH_CACHE_TOUCH_INTERVAL: float = 60.0    # ...или раз в N секунд
+
+    # Кэш редиректов (services/redirect_cache.py)
+    REDIRECT_CACHE_ENABLED: bool = True
+    REDIRECT_CACHE_MIN_TTL: int = 3600            # цель недавно поменялась
+    REDIRECT_CACHE_BASE_TTL: int = 6 * 3600       # первая проверка
+    REDIRECT_CACHE_MAX_TTL: int = 7 * 24 * 3600   # давно стабильный редиректор
+
+    # Резолв редиректов по шагам: HEAD, затем stream-GET без тела (services/redirect_probe.py)
+    REDIRECT_PROBE_ENABLED: bool = True
+    REDIRECT_MAX_HOPS: int = 10
+
+    # Двухуровневый резолв: httpx, браузер — только по эвристикам (services/tiered_resolver.py)
+    TIERED_ESCALATION_ENABLED: bool = True
+    TIERED_SNIFF_BYTES: int = 64 * 1024   # сколько HTML читаем для эвристик
+
+    # merchants_config.json перечитывается при изменении mtime (merchants_loader.py)
+    MERCHANTS_RELOAD_INTERVAL: float = 2.0  # не чаще чем раз в N секунд проверяем файл
+
+    # Определение зеркал по бренду (services/brand_matcher.py)
+    # Слова и чужие бренды, внутри которых бренд не засчитывается:
+    # mistake.com — не stake, karabet.com — не 4rabet (скелет arabet)
+    BRAND_STOP_WORDS: List[str] = [
+        "mistake", "mistaken", "mistakes", "sweepstake", "sweepstakes",
+        "grubstake", "stakeholder", "stakeholders", "karabet",
+    ]
+    BRAND_MATCH_CACHE_SIZE: int = 100_000 # доменов в LRU-кэше результатов
+
+    # История редиректов (services/history.py)
+    HISTORY_ID_CACHE_SIZE: int = 200_000  # id значений справочника в памяти процесса (на таблицу)
+
+    # Очередь заданий и воркер (services/jobs.py, worker.py)
+    WORKER_CONCURRENCY: int = 2       # сколько заданий воркер выполняет одновременно
+    JOB_LEASE_SECONDS: int = 120      # lease продлевается каждые lease/3 секунд
+    JOB_POLL_INTERVAL: float = 2.0    # пауза, когда очередь пуста
+    JOB_MAX_ATTEMPTS: int = 3         # после стольких попыток задание — failed
+    WORKER_METRICS_PORT: int = 9101   # /metrics воркера для Prometheus (0 — выкл.)
+
+    # Планировщик перепроверок (services/scheduler.py, scheduler.py)
+    SCHEDULER_REQUESTS_PER_MINUTE: float = 10.0  # бюджет запросов к Serper (1 задача = 1 запрос)
+    SCHEDULER_TICK_SECONDS: int = 60
+    SCHEDULER_BASE_INTERVAL: int = 24 * 3600     # интервал для мерчанта priority=1 без смен домена
+    SCHEDULER_MIN_INTERVAL: int = 3600
+    SCHEDULER_MAX_INTERVAL: int = 7 * 24 * 3600
+    SCHEDULER_CHURN_WINDOW: int = 14 * 24 * 3600 # за какой период считаем смены final_domain
+    SCHEDULER_RESULTS_PER_KEYWORD: int = 10
+    SCHEDULER_MAX_QUEUED_JOBS: int = 5           # не ставим новых, пока очередь не разберут
+
+    # Лимиты и повторы исходящих запросов (services/throttle.py)
+    SERPER_RATE_PER_SECOND: float = 5.0   # квота Serper.dev (на 429 снижается сама)
+    SERPER_BURST: int = 10
+    HOST_RATE_PER_SECOND: float = 2.0     # вежливость к одному целевому хосту
+    HOST_BURST: int = 4
+    RETRY_ATTEMPTS: int = 4               # всего попыток, включая первую
+    RETRY_BASE_DELAY: float = 0.5         # backoff: random(0, base * 2^n), не больше max
+    RETRY_MAX_DELAY: float = 30.0         # Retry-After больше этого — не ждём, сдаёмся
+    CIRCUIT_FAILURE_THRESHOLD: int = 5    # ошибок подряд до отключения хоста
+    CIRCUIT_RESET_SECONDS: float = 60.0   # через сколько пробуем хост снова
+
+    # Общие httpx-клиенты (services/http_clients.py)
+    HTTP2_ENABLED: bool = False                  # нужен пакет h2
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    SERPER_MAX_CONNECTIONS: int = 20
+    SERPER_MAX_KEEPALIVE: int = 10
+    TARGET_MAX_CONNECTIONS: int = 100
+    TARGET_MAX_KEEPALIVE: int = 20
 
     model_config = SettingsConfigDict(
         env_file=".env",
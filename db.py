@@ -2,18 +2,154 @@
 
 from __future__ import annotations
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from config import get_settings
 
 settings = get_settings()
 
-# Здесь используем свойство database_url (из config.Settings)
-engine = create_engine(
-    settings.database_url,
-    future=True,
-)
+
+def _is_sqlite_file(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+
+def _sqlite_pragmas(engine: Engine, *, read_only: bool) -> None:
+    """
+    Настройки SQLite на каждое новое соединение.
+
+    WAL: читатели не блокируют писателя и наоборот. synchronous=NORMAL
+    в WAL-режиме не теряет целостность, fsync только на checkpoint.
+    busy_timeout: конкурирующий процесс (API, воркер, планировщик)
+    ждёт блокировку, а не получает сразу "database is locked".
+    """
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        # Транзакции начинаем сами (см. on_begin), а не драйвер sqlite3
+        dbapi_connection.isolation_level = None
+
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+            if settings.SQLITE_WAL:
+                cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute(f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}")
+            # Отрицательное значение — размер в КиБ, а не в страницах
+            cursor.execute(f"PRAGMA cache_size = {-int(settings.SQLITE_CACHE_SIZE_KB)}")
+            cursor.execute("PRAGMA temp_store = MEMORY")
+            if read_only:
+                cursor.execute("PRAGMA query_only = ON")
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def on_begin(conn):
+        # Писатель сразу берёт RESERVED-блокировку: ожидание чужой записи
+        # укладывается в busy_timeout, а не падает на середине транзакции
+        # при попытке повысить блокировку после чтения.
+        conn.exec_driver_sql("BEGIN" if read_only else "BEGIN IMMEDIATE")
+
+
+def _create_engines():
+    """
+    (engine для записи, engine для чтения).
+
+    Для файлового SQLite запись идёт через одно соединение (пул размера 1):
+    сессии на запись выстраиваются в очередь внутри процесса, а чтения
+    берут соединения из отдельного пула и в WAL-режиме не ждут писателя.
+    Для остальных СУБД оба engine — один и тот же.
+    """
+    url = settings.database_url
+
+    if not _is_sqlite_file(url):
+        engine = create_engine(url, future=True)
+        return engine, engine
+
+    writer = create_engine(
+        url,
+        future=True,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.SQLITE_WRITE_TIMEOUT,
+    )
+    _sqlite_pragmas(writer, read_only=False)
+
+    reader = create_engine(
+        url,
+        future=True,
+        pool_size=max(1, settings.SQLITE_READ_POOL_SIZE),
+        max_overflow=0,
+    )
+    _sqlite_pragmas(reader, read_only=True)
+
+    return writer, reader
+
+
+def _async_url(url: str) -> URL:
+    """
+    URL для асинхронного драйвера: sqlite -> sqlite+aiosqlite,
+    postgresql -> postgresql+asyncpg. ASYNC_DATABASE_URL — задать явно.
+    """
+    if settings.ASYNC_DATABASE_URL:
+        return make_url(settings.ASYNC_DATABASE_URL)
+
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite")
+    if backend == "postgresql":
+        return parsed.set(drivername="postgresql+asyncpg")
+    raise ValueError(f"no async driver for {backend}, set ASYNC_DATABASE_URL")
+
+
+def _create_async_engines():
+    """
+    Асинхронные двойники engine/read_engine с тем же профилем:
+    для SQLite — одно соединение на запись и пул на чтение.
+
+    Код в event loop пишет только через async_engine (сборщик —
+    MirrorWriter, воркер — run_in_writer): записи процесса стоят
+    в очереди за одним соединением, а ожидание не блокирует loop.
+    Синхронный engine остаётся для миграций и sync-эндпоинтов API,
+    которые выполняются в потоках.
+    """
+    url = _async_url(settings.database_url)
+
+    if not _is_sqlite_file(settings.database_url):
+        engine = create_async_engine(url)
+        return engine, engine
+
+    writer = create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.SQLITE_WRITE_TIMEOUT,
+    )
+    _sqlite_pragmas(writer.sync_engine, read_only=False)
+
+    reader = create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=max(1, settings.SQLITE_READ_POOL_SIZE),
+        max_overflow=0,
+    )
+    _sqlite_pragmas(reader.sync_engine, read_only=True)
+
+    return writer, reader
+
+
+# engine — запись (и миграции), read_engine — только чтение
+engine, read_engine = _create_engines()
+
+# То же для кода в event loop (сборщик, GET /mirrors): запросы не блокируют loop
+async_engine, async_read_engine = _create_async_engines()
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -21,6 +157,21 @@ SessionLocal = sessionmaker(
     bind=engine,
 )
 
+# Сессии только для чтения: списки, выгрузки, статусы. Писать через них нельзя
+# (для SQLite соединения открыты с query_only).
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=read_engine,
+)
+
+
+# expire_on_commit=False: после commit объекты читаются без нового запроса
+# (ленивой подгрузки в async-сессии нет)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, expire_on_commit=False)
+
 
 def get_db():
     db = SessionLocal()
@@ -28,3 +179,44 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+async def run_in_writer(fn, *args, **kwargs):
+    """
+    Выполняет синхронную fn(db: Session, ...) (services/jobs.py и т.п.)
+    на async-соединении для записи. Commit делает сама fn.
+    """
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(fn, *args, **kwargs)
+
+
+async def dispose_async_engines() -> None:
+    """Закрывает пулы async-соединений (при остановке приложения/воркера)."""
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
+
+def init_db() -> None:
+    """
+    Создаёт недостающие таблицы (существующие не трогает)
+    и применяет миграции из migrations.py.
+    """
+    import models  # noqa: F401  — регистрирует модели в Base.metadata
+    from migrations import run_migrations
+
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
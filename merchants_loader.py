@@ -3,14 +3,23 @@
 from __future__ import annotations
 
 import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import get_settings
+from services.brand_matcher import BrandMatcher
+
+logger = logging.getLogger(__name__)
 
 # merchants_config.json лежит в корне проекта рядом с этим файлом
 CONFIG_PATH = Path(__file__).parent / "merchants_config.json"
 
 
-def load_merchants() -> List[Dict[str, Any]]:
+def load_merchants(path: Path = CONFIG_PATH) -> List[Dict[str, Any]]:
     """
     Загружает конфиг мерчантов из merchants_config.json.
     Формат файла:
@@ -19,15 +28,174 @@ def load_merchants() -> List[Dict[str, Any]]:
         "merchant": "1xbet",
         "country": "in",
         "keywords": ["cricket betting"],
-        "brand_pattern": "1xbet"
+        "brand_pattern": "1xbet",
+        "priority": 2.0
       },
       ...
     ]
+    priority — необязательный вес для планировщика (по умолчанию 1.0).
     """
-    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+    with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
     if not isinstance(data, list):
         raise ValueError("merchants_config.json должен содержать список объектов")
 
     return data
+
+
+# ---------- Скомпилированный конфиг с горячей перезагрузкой ----------
+
+
+@dataclass
+class MerchantConfig:
+    merchant: str
+    country: str
+    keywords: List[str]
+    brand_pattern: Optional[str] = None
+    # Вес мерчанта для планировщика перепроверок (services/scheduler.py)
+    priority: float = 1.0
+    # keyword -> готовая строка запроса к Serper (заполняется сама)
+    queries: Dict[str, str] = field(default_factory=dict, compare=False)
+
+    def __post_init__(self) -> None:
+        if not self.queries:
+            self.queries = {kw: f"{self.merchant} {kw}" for kw in self.keywords}
+
+
+def _compile_entry(index: int, raw: Any) -> MerchantConfig:
+    where = f"merchants_config.json[{index}]"
+
+    if not isinstance(raw, dict):
+        raise ValueError(f"{where}: ожидается объект")
+
+    merchant = raw.get("merchant")
+    if not isinstance(merchant, str) or not merchant.strip():
+        raise ValueError(f"{where}: поле merchant обязательно")
+
+    country = raw.get("country", "in")
+    if not isinstance(country, str) or not country.strip():
+        raise ValueError(f"{where}: country должен быть непустой строкой")
+
+    keywords = raw.get("keywords")
+    if (
+        not isinstance(keywords, list)
+        or not keywords
+        or not all(isinstance(kw, str) and kw.strip() for kw in keywords)
+    ):
+        raise ValueError(f"{where}: keywords — непустой список строк")
+
+    brand_pattern = raw.get("brand_pattern")
+    if brand_pattern is not None and (not isinstance(brand_pattern, str) or not brand_pattern.strip()):
+        raise ValueError(f"{where}: brand_pattern должен быть непустой строкой")
+
+    priority = raw.get("priority", 1.0)
+    if isinstance(priority, bool) or not isinstance(priority, (int, float)) or priority <= 0:
+        raise ValueError(f"{where}: priority должен быть положительным числом")
+
+    return MerchantConfig(
+        merchant=merchant.strip(),
+        country=country.strip().lower(),
+        # без дублей, порядок сохраняем
+        keywords=list(dict.fromkeys(kw.strip() for kw in keywords)),
+        brand_pattern=brand_pattern.strip() if brand_pattern else None,
+        priority=float(priority),
+    )
+
+
+class CompiledMerchants:
+    """
+    Проверенный конфиг мерчантов: готовые MerchantConfig (с запросами
+    для Serper), индекс по имени и общий матчер брендов.
+    """
+
+    def __init__(self, merchants: List[MerchantConfig], *, mtime: float = 0.0) -> None:
+        self.merchants = merchants
+        self.mtime = mtime
+
+        self._by_name: Dict[str, List[MerchantConfig]] = {}
+        seen = set()
+        for cfg in merchants:
+            key = (cfg.merchant.casefold(), cfg.country)
+            if key in seen:
+                raise ValueError(f"мерчант {cfg.merchant!r} ({cfg.country}) указан дважды")
+            seen.add(key)
+            self._by_name.setdefault(cfg.merchant.casefold(), []).append(cfg)
+
+        self.brand_matcher = BrandMatcher(cfg.brand_pattern for cfg in merchants if cfg.brand_pattern)
+
+    @classmethod
+    def from_raw(cls, data: List[Dict[str, Any]], *, mtime: float = 0.0) -> "CompiledMerchants":
+        return cls([_compile_entry(i, raw) for i, raw in enumerate(data)], mtime=mtime)
+
+    def unknown(self, names: Optional[Iterable[str]]) -> List[str]:
+        return [name for name in names or [] if name.casefold() not in self._by_name]
+
+    def select(self, names: Optional[Iterable[str]] = None) -> List[MerchantConfig]:
+        """
+        Мерчанты по именам (без учёта регистра), в порядке конфига.
+        names=None или пустой список — все.
+        """
+        if not names:
+            return list(self.merchants)
+        wanted = {name.casefold() for name in names}
+        return [cfg for cfg in self.merchants if cfg.merchant.casefold() in wanted]
+
+
+class MerchantsRegistry:
+    """
+    Держит CompiledMerchants и перечитывает файл, когда меняется его mtime
+    (проверка не чаще раза в MERCHANTS_RELOAD_INTERVAL секунд).
+    Если новый файл битый — остаёмся на предыдущей версии.
+    """
+
+    def __init__(self, path: Path = CONFIG_PATH, *, check_interval: float = 2.0) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._compiled: Optional[CompiledMerchants] = None
+        self._checked_at = 0.0
+        self._rejected_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> CompiledMerchants:
+        now = time.monotonic()
+        if self._compiled is not None and now - self._checked_at < self.check_interval:
+            return self._compiled
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = self.path.stat().st_mtime
+            except OSError:
+                if self._compiled is None:
+                    raise
+                logger.warning("%s is not accessible, keeping loaded merchants", self.path)
+                return self._compiled
+
+            stale = self._compiled is None or mtime != self._compiled.mtime
+            if stale and mtime != self._rejected_mtime:
+                try:
+                    self._compiled = CompiledMerchants.from_raw(load_merchants(self.path), mtime=mtime)
+                    logger.info("loaded %d merchants from %s", len(self._compiled.merchants), self.path)
+                except (OSError, ValueError):
+                    if self._compiled is None:
+                        raise
+                    # Этот же битый файл больше не разбираем — ждём следующего mtime
+                    self._rejected_mtime = mtime
+                    logger.exception("%s is invalid, keeping previous merchants", self.path)
+
+            return self._compiled
+
+
+_registry: Optional[MerchantsRegistry] = None
+
+
+def get_merchants_registry() -> MerchantsRegistry:
+    global _registry
+    if _registry is None:
+        _registry = MerchantsRegistry(check_interval=get_settings().MERCHANTS_RELOAD_INTERVAL)
+    return _registry
+
+
+def get_merchants() -> CompiledMerchants:
+    return get_merchants_registry().get()
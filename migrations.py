@@ -0,0 +1,149 @@
+# migrations.py
+"""
+Простые версионные миграции схемы.
+
+create_all (db.init_db) создаёт только отсутствующие таблицы и не трогает
+существующие — индексы и изменения старых таблиц делаются здесь.
+Каждая миграция выполняется один раз, номер записывается в schema_migrations.
+Шаг миграции — SQL-строка или функция(conn); все SQL должны работать
+и на SQLite, и на PostgreSQL.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, List, Tuple, Union
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+Step = Union[str, Callable[[Connection], None]]
+
+
+def add_column_if_missing(table: str, column: str, ddl_type: str) -> Callable[[Connection], None]:
+    """
+    ALTER TABLE ... ADD COLUMN, если колонки ещё нет.
+    На свежей базе create_all уже создал её по модели — тогда ничего не делаем.
+    """
+
+    def step(conn: Connection) -> None:
+        columns = {c["name"] for c in inspect(conn).get_columns(table)}
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+    return step
+
+
+# (версия, описание, шаги)
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (
+        1,
+        "keyset pagination indexes for GET /mirrors",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_mirrors_country_merchant_seen "
+            "ON mirrors (country, merchant, last_seen_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_mirrors_last_seen "
+            "ON mirrors (last_seen_at, id)",
+        ],
+    ),
+    (
+        2,
+        "status codes of redirect hops in redirect_cache",
+        [add_column_if_missing("redirect_cache", "hop_statuses", "TEXT")],
+    ),
+    (
+        3,
+        "resolution tier of each mirror",
+        [add_column_if_missing("mirrors", "resolved_tier", "VARCHAR")],
+    ),
+    (
+        4,
+        "clicked CTA text in redirect_cache",
+        [add_column_if_missing("redirect_cache", "cta_text", "VARCHAR")],
+    ),
+    (
+        5,
+        "redirect history: dimension tables and observations backfilled from mirrors",
+        [
+            "INSERT INTO domains (name) "
+            "SELECT d FROM (SELECT source_domain AS d FROM mirrors "
+            "UNION SELECT final_domain FROM mirrors) AS t "
+            "WHERE d IS NOT NULL AND d <> '' AND d NOT IN (SELECT name FROM domains)",
+            "INSERT INTO merchants (name) SELECT DISTINCT merchant FROM mirrors "
+            "WHERE merchant NOT IN (SELECT name FROM merchants)",
+            "INSERT INTO keywords (name) SELECT DISTINCT keyword FROM mirrors "
+            "WHERE keyword NOT IN (SELECT name FROM keywords)",
+            "INSERT INTO urls (url, domain_id) "
+            "SELECT t.u, MIN(d.id) FROM (SELECT source_url AS u, source_domain AS dn FROM mirrors "
+            "UNION SELECT final_url, final_domain FROM mirrors WHERE final_url IS NOT NULL) AS t "
+            "JOIN domains d ON d.name = t.dn "
+            "WHERE t.u NOT IN (SELECT url FROM urls) GROUP BY t.u",
+            # По интервалу на строку mirrors; если история уже пишется — не трогаем
+            "INSERT INTO mirror_observations (merchant_id, country, keyword_id, "
+            "source_url_id, source_domain_id, final_url_id, final_domain_id, "
+            "is_mirror, first_seen_at, last_seen_at) "
+            "SELECT mc.id, m.country, k.id, su.id, sd.id, fu.id, fd.id, "
+            "m.is_mirror, m.first_seen_at, m.last_seen_at FROM mirrors m "
+            "JOIN merchants mc ON mc.name = m.merchant "
+            "JOIN keywords k ON k.name = m.keyword "
+            "JOIN urls su ON su.url = m.source_url "
+            "JOIN domains sd ON sd.name = m.source_domain "
+            "LEFT JOIN domains fd ON fd.name = m.final_domain "
+            "LEFT JOIN urls fu ON fu.url = m.final_url AND fd.id IS NOT NULL "
+            "WHERE NOT EXISTS (SELECT 1 FROM mirror_observations) "
+            "ORDER BY m.first_seen_at, m.id",
+        ],
+    ),
+    (
+        6,
+        "keyset index for GET /mirrors filtered by country only",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_mirrors_country_seen "
+            "ON mirrors (country, last_seen_at, id)",
+        ],
+    ),
+    (
+        7,
+        "keyset index for GET /mirrors filtered by merchant only",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_mirrors_merchant_seen "
+            "ON mirrors (merchant, last_seen_at, id)",
+        ],
+    ),
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "version INTEGER PRIMARY KEY, "
+                "description VARCHAR NOT NULL)"
+            )
+        )
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+    for version, description, steps in MIGRATIONS:
+        if version in applied:
+            continue
+
+        # API, воркер и планировщик вызывают init_db при старте одновременно:
+        # номер перечитывается под блокировкой записи (на SQLite транзакция
+        # writer-а начинается с BEGIN IMMEDIATE, см. db.py), и миграцию,
+        # которую уже применил другой процесс, пропускаем.
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("LOCK TABLE schema_migrations IN EXCLUSIVE MODE"))
+            if conn.scalar(
+                text("SELECT 1 FROM schema_migrations WHERE version = :v"), {"v": version}
+            ):
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description) VALUES (:v, :d)"),
+                {"v": version, "d": description},
+            )
@@ -7,6 +7,8 @@ from sqlalchemy import (
     String,
     Boolean,
     DateTime,
+    Index,
+    Text,
     UniqueConstraint,
 )
 from sqlalchemy.orm import declarative_base
@@ -32,6 +34,8 @@ class Mirror(Base):
     is_redirector = Column(Boolean, default=False, nullable=False)
     is_mirror = Column(Boolean, default=False, nullable=False)
     cta_found = Column(Boolean, default=False, nullable=False)
+    # Кто резолвил: "http" или "browser" (см. services/tiered_resolver.py)
+    resolved_tier = Column(String, nullable=True)
 
     first_seen_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     last_seen_at = Column(
@@ -50,4 +54,233 @@ class Mirror(Base):
             "final_domain",
             name="uq_mirror_unique",
         ),
+        # Keyset-пагинация /mirrors (см. migrations.py, версия 1)
+        Index("ix_mirrors_country_merchant_seen", "country", "merchant", "last_seen_at", "id"),
+        # /mirrors?country=… без merchant (см. migrations.py, версия 6)
+        Index("ix_mirrors_country_seen", "country", "last_seen_at", "id"),
+        # /mirrors?merchant=… без country (версия 7)
+        Index("ix_mirrors_merchant_seen", "merchant", "last_seen_at", "id"),
+        Index("ix_mirrors_last_seen", "last_seen_at", "id"),
+    )
+
+
+class SearchCacheEntry(Base):
+    """
+    Кэш выдачи Serper: ключ — sha256 от (query, num, gl, hl),
+    results — JSON-список URL.
+    """
+
+    __tablename__ = "search_cache"
+
+    key = Column(String(64), primary_key=True)
+
+    query = Column(String, nullable=False)
+    num = Column(Integer, nullable=False)
+    gl = Column(String, nullable=True)
+    hl = Column(String, nullable=True)
+
+    results = Column(Text, nullable=False)
+
+    fetched_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_access_at = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+
+
+class RedirectCacheEntry(Base):
+    """
+    Кэш резолва редиректов: ключ — sha256 от (kind, нормализованный URL).
+    kind — кто резолвил: "http" (httpx) или "browser" (Playwright).
+    """
+
+    __tablename__ = "redirect_cache"
+
+    key = Column(String(64), primary_key=True)
+    kind = Column(String, nullable=False)
+
+    source_url = Column(String, nullable=False)
+    final_url = Column(String, nullable=False)
+    final_domain = Column(String, nullable=True)
+    chain = Column(Text, nullable=False)  # JSON-список URL по порядку переходов
+    hop_statuses = Column(Text, nullable=True)  # JSON-список HTTP-статусов по chain (только "http")
+    cta_text = Column(String, nullable=True)  # какую кнопку нажал браузер (только "browser")
+
+    # Сколько проверок подряд цель этого URL не менялась
+    stable_checks = Column(Integer, default=0, nullable=False)
+
+    checked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, index=True, nullable=False)
+
+
+class RedirectDomainStability(Base):
+    """
+    Стабильность редиректов по хосту источника: от неё считается TTL
+    записей redirect_cache всех URL этого хоста, в том числе новых.
+    """
+
+    __tablename__ = "redirect_domain_stability"
+
+    kind = Column(String, primary_key=True)
+    domain = Column(String, primary_key=True)
+
+    # Сколько проверок подряд (по любым URL хоста) цель не менялась — от этого растёт TTL
+    stable_checks = Column(Integer, default=0, nullable=False)
+
+    checked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class CollectionJob(Base):
+    """
+    Задание на сбор зеркал (очередь в БД, исполняет worker.py).
+
+    kind   — "all" или "batch" (какую функцию сбора запускать);
+    params — JSON с аргументами; progress/result — JSON-снимки.
+    Пока задание running, воркер держит lease и продлевает его;
+    просроченный lease значит, что воркер умер и задание можно забрать.
+    """
+
+    __tablename__ = "collection_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    kind = Column(String, nullable=False)
+    params = Column(Text, nullable=False)
+
+    status = Column(String, default="queued", index=True, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+
+    progress = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class MirrorChange(Base):
+    """
+    Журнал изменений зеркал для инкрементальной ленты /mirrors/changes.
+
+    Запись добавляется, когда Mirror создан (kind="created") или у
+    редиректора поменялся final_domain (kind="final_domain_changed").
+    seq монотонно растёт (AUTOINCREMENT в SQLite, sequence в PostgreSQL).
+    """
+
+    __tablename__ = "mirror_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = Column(Integer, primary_key=True)
+
+    mirror_id = Column(Integer, index=True, nullable=False)
+    kind = Column(String, nullable=False)
+
+    merchant = Column(String, nullable=False)
+    country = Column(String, nullable=False)
+    keyword = Column(String, nullable=False)
+    source_url = Column(String, nullable=False)
+    source_domain = Column(String, nullable=False)
+    final_url = Column(String, nullable=True)
+    final_domain = Column(String, nullable=True)
+    previous_final_domain = Column(String, nullable=True)
+    is_mirror = Column(Boolean, default=False, nullable=False)
+
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class CrawlSchedule(Base):
+    """
+    Когда планировщик (services/scheduler.py) последний раз отправлял
+    задачу (merchant, country, keyword) на сбор.
+    """
+
+    __tablename__ = "crawl_schedule"
+    __table_args__ = (
+        UniqueConstraint("merchant", "country", "keyword", name="uq_crawl_schedule_task"),
+    )
+
+    id = Column(Integer, primary_key=True)
+
+    merchant = Column(String, nullable=False)
+    country = Column(String, nullable=False)
+    keyword = Column(String, nullable=False)
+
+    last_dispatched_at = Column(DateTime, nullable=False)
+    last_job_id = Column(Integer, nullable=True)
+
+
+# ---------- История редиректов (services/history.py) ----------
+#
+# Справочники: каждая строка (домен, мерчант, keyword, URL) хранится один раз,
+# в наблюдениях — только целые ключи.
+
+
+class Domain(Base):
+    __tablename__ = "domains"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
+
+class Merchant(Base):
+    __tablename__ = "merchants"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
+
+class Keyword(Base):
+    __tablename__ = "keywords"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
+
+class Url(Base):
+    __tablename__ = "urls"
+
+    id = Column(Integer, primary_key=True)
+    url = Column(String, unique=True, nullable=False)
+    domain_id = Column(Integer, index=True, nullable=False)
+
+
+class MirrorObservation(Base):
+    """
+    Куда вёл редиректор: интервал [first_seen_at, last_seen_at], в котором
+    source_url (для merchant/country/keyword) резолвился в final_url.
+
+    Пока цель та же — у последнего интервала сдвигается last_seen_at;
+    сменилась — добавляется новый интервал, старые не переписываются.
+    """
+
+    __tablename__ = "mirror_observations"
+
+    id = Column(Integer, primary_key=True)
+
+    merchant_id = Column(Integer, nullable=False)
+    country = Column(String, nullable=False)
+    keyword_id = Column(Integer, nullable=False)
+
+    source_url_id = Column(Integer, nullable=False)
+    source_domain_id = Column(Integer, nullable=False)
+    final_url_id = Column(Integer, nullable=True)
+    final_domain_id = Column(Integer, nullable=True)
+
+    is_mirror = Column(Boolean, default=False, nullable=False)
+
+    first_seen_at = Column(DateTime, nullable=False)
+    last_seen_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # Последний интервал для строки сбора
+        Index(
+            "ix_observations_task",
+            "source_url_id", "merchant_id", "country", "keyword_id", "last_seen_at",
+        ),
+        # «Куда вёл домен X» и «что вело на домен Y» за период
+        Index("ix_observations_source_domain", "source_domain_id", "last_seen_at"),
+        Index("ix_observations_final_domain", "final_domain_id", "last_seen_at"),
     )
@@ -0,0 +1,92 @@
+# scheduler.py
+"""
+Планировщик перепроверок: вместо cron, который раз в N часов
+пересобирает всё подряд, раз в SCHEDULER_TICK_SECONDS ставит в очередь
+самые «просроченные» задачи (merchant, country, keyword) в пределах
+бюджета SCHEDULER_REQUESTS_PER_MINUTE. Выполняет их worker.py.
+
+Запуск:
+    python scheduler.py
+    python scheduler.py --rpm 30
+    python scheduler.py --dry-run    # показать план и выйти
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import signal
+
+from config import get_settings
+from db import ReadSessionLocal, SessionLocal, init_db
+from services.scheduler import RequestBudget, plan, tick
+
+settings = get_settings()
+
+logger = logging.getLogger("scheduler")
+
+
+def _tick(budget: RequestBudget) -> None:
+    db = SessionLocal()
+    try:
+        job_ids = tick(db, budget)
+        if job_ids:
+            logger.info("dispatched jobs: %s", job_ids)
+    except Exception:
+        logger.exception("scheduler tick failed")
+    finally:
+        db.close()
+
+
+async def main(rpm: float) -> None:
+    init_db()
+
+    interval = max(1, settings.SCHEDULER_TICK_SECONDS)
+    budget = RequestBudget(rpm, burst=rpm * max(1.0, interval / 60))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info("scheduler started, budget=%.1f requests/min, tick=%ds", rpm, interval)
+
+    while not stop.is_set():
+        # Запросы к БД синхронные — не держим ими цикл событий
+        await asyncio.to_thread(_tick, budget)
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def dry_run(limit: int) -> None:
+    init_db()
+    db = ReadSessionLocal()
+    try:
+        for task in plan(db)[:limit]:
+            print(
+                f"{task.score:10.2f}  {'due ' if task.is_due else '    '}"
+                f"{task.merchant}/{task.country}  {task.keyword}  "
+                f"churn={task.churn} interval={task.interval}"
+            )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mirrors recrawl scheduler")
+    parser.add_argument("--rpm", type=float, default=settings.SCHEDULER_REQUESTS_PER_MINUTE)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--limit", type=int, default=50, help="сколько задач показать в --dry-run")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    if args.dry_run:
+        dry_run(args.limit)
+    else:
+        asyncio.run(main(max(0.1, args.rpm)))
@@ -0,0 +1,274 @@
+# services/brand_matcher.py
+
+from __future__ import annotations
+
+import logging
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import idna
+import tldextract
+
+from config import get_settings
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# Встроенный снимок Public Suffix List, без сетевых запросов и файлового кэша.
+# Приватные суффиксы (blogspot.com, pages.dev, ...) тоже считаем суффиксами:
+# stake.pages.dev — это отдельный сайт, а не поддомен pages.dev.
+_extract = tldextract.TLDExtract(
+    suffix_list_urls=(),
+    cache_dir=None,
+    include_psl_private_domains=True,
+)
+
+# Буквы других алфавитов, которые выглядят как латиница
+_HOMOGLYPHS = {
+    # кириллица
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h",
+    "о": "o", "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i",
+    "ї": "i", "ј": "j", "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w", "ӏ": "l",
+    "ь": "b", "г": "r", "п": "n",
+    # греческий
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v",
+    "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x", "ω": "w",
+}
+
+# Цифры и буквы, которые путают между собой: после замены
+# 1xbet / lxbet / ixbet дают один и тот же «скелет»
+_CONFUSABLES = {
+    "0": "o", "1": "l", "i": "l", "3": "e", "4": "a", "5": "s",
+    "7": "t", "8": "b", "9": "g",
+}
+
+# Составные подмены: "rn" выглядит как "m", "vv" — как "w"
+_DIGRAPHS = (("rn", "m"), ("vv", "w"))
+
+_SEPARATORS = "-_."
+
+
+def registrable_domain(host: str) -> str:
+    """
+    Регистрируемый домен по Public Suffix List:
+    www.stake.co.in -> stake.co.in, a.b.example.com -> example.com.
+    Для IP и хостов без суффикса возвращает хост как есть.
+    """
+    host = (host or "").strip().lower().rstrip(".")
+    host = host.rsplit("@", 1)[-1].split(":", 1)[0]
+    ext = _extract(host)
+    if ext.domain and ext.suffix:
+        return f"{ext.domain}.{ext.suffix}"
+    return host
+
+
+def _brand_label(host: str) -> str:
+    """
+    Часть регистрируемого домена без публичного суффикса
+    (stake-india.co.in -> stake-india), IDN раскодирован.
+    """
+    host = (host or "").strip().lower().rstrip(".")
+    host = host.rsplit("@", 1)[-1].split(":", 1)[0]
+    label = _extract(host).domain or host
+    if "xn--" in label:
+        try:
+            label = idna.decode(label)
+        except idna.IDNAError:
+            pass
+    return label
+
+
+def _fold_char(ch: str) -> str:
+    # Убираем диакритику (ŝ -> s), потом гомоглифы
+    decomposed = unicodedata.normalize("NFKD", ch)
+    base = "".join(c for c in decomposed if not unicodedata.combining(c)) or ch
+    base = base.casefold()
+    return "".join(_CONFUSABLES.get(c, c) for c in _HOMOGLYPHS.get(base, base))
+
+
+def skeleton(text: str) -> str:
+    """
+    «Скелет» строки для сравнения похожих написаний: без разделителей
+    (- _ . пробелы), диакритики и гомоглифов.
+
+    >>> skeleton("Ѕtаke-İndia"), skeleton("1xbеt.com"), skeleton("rnostbet")
+    ('stakelndla', 'lxbetcom', 'mostbet')
+    """
+    text = unicodedata.normalize("NFKC", text)
+    chars: List[str] = []
+    for ch in text:
+        if ch in _SEPARATORS or ch.isspace():
+            continue
+        chars.extend(_fold_char(ch))
+
+    result = "".join(chars)
+    for pair, repl in _DIGRAPHS:
+        while pair in result:
+            result = result.replace(pair, repl)
+    return result
+
+
+class _Automaton:
+    """
+    Aho-Corasick по набору строк: один проход по тексту находит
+    все вхождения всех образцов.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+
+        for pattern in patterns:
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(pattern)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, str]]:
+        """Список (позиция начала, образец)."""
+        found = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for pattern in self._out[node]:
+                found.append((i - len(pattern) + 1, pattern))
+        return found
+
+
+class BrandMatcher:
+    """
+    Определяет, чей бренд в домене, сразу по всем брендам.
+
+    Домен приводится к регистрируемому (PSL), IDN/punycode раскодируется,
+    гомоглифы и цифровые подмены сводятся к одному «скелету»
+    (1x-bet, 1хbet, lxbet -> lxbet). Дальше один проход Aho-Corasick.
+
+    Бренд ищется в любом месте домена (my1xbet.com, play1win.in),
+    кроме вхождений внутрь слов из stop_words: stake в mistake.com
+    не засчитывается, а в mistake-stake.com — засчитывается.
+
+    >>> m = BrandMatcher(["stake", "1xbet", "1win"], stop_words=["mistake", "stakeholder"])
+    >>> sorted(m.match("my1xbet.com")), sorted(m.match("play1win.in"))
+    (['1xbet'], ['1win'])
+    >>> sorted(m.match("stake-india.co.in")), sorted(m.match("mirrorstake.com"))
+    (['stake'], ['stake'])
+    >>> m.match("mistake.com"), m.match("stakeholder.org")
+    (frozenset(), frozenset())
+    >>> sorted(m.match("mistake-stake.com"))
+    ['stake']
+    """
+
+    def __init__(self, brands: Iterable[str], *, stop_words: Optional[Iterable[str]] = None) -> None:
+        self._brands: Dict[str, List[str]] = {}
+        for brand in brands:
+            if not brand or not brand.strip():
+                continue
+            key = skeleton(brand)
+            if key:
+                self._brands.setdefault(key, [])
+                if brand not in self._brands[key]:
+                    self._brands[key].append(brand)
+        self._known = {b.casefold() for names in self._brands.values() for b in names}
+        self._automaton = _Automaton(self._brands)
+
+        if stop_words is None:
+            stop_words = settings.BRAND_STOP_WORDS
+        # Само название бренда стоп-словом быть не может
+        stops = {skeleton(w) for w in stop_words if w and w.strip()}
+        self._stop_automaton = _Automaton(stops - set(self._brands) - {""})
+
+        self._match_cached = lru_cache(maxsize=settings.BRAND_MATCH_CACHE_SIZE)(self._match)
+
+    def __contains__(self, brand: str) -> bool:
+        return brand.casefold() in self._known
+
+    def __len__(self) -> int:
+        return len(self._known)
+
+    def _match(self, host: str) -> FrozenSet[str]:
+        label = _brand_label(host)
+        text = skeleton(label)
+
+        # Отрезки скелета, занятые стоп-словами
+        stops = [(start, start + len(word)) for start, word in self._stop_automaton.find(text)]
+
+        matched = set()
+        for start, key in self._automaton.find(text):
+            end = start + len(key)
+            if any(s <= start and end <= e for s, e in stops):
+                continue
+            matched.update(b.casefold() for b in self._brands[key])
+        return frozenset(matched)
+
+    def match(self, host: str) -> FrozenSet[str]:
+        """Все бренды (в нижнем регистре), найденные в домене."""
+        if not host:
+            return frozenset()
+        return self._match_cached(host.lower())
+
+    def matches(self, host: str, brand: str) -> bool:
+        return brand.casefold() in self.match(host)
+
+
+def get_brand_matcher() -> BrandMatcher:
+    """
+    Общий матчер по брендам из merchants_config.json.
+    Строится вместе с конфигом мерчантов и пересобирается при его
+    перезагрузке (merchants_loader.get_merchants).
+    """
+    global _empty_matcher
+    from merchants_loader import get_merchants
+
+    try:
+        return get_merchants().brand_matcher
+    except (OSError, ValueError):
+        logger.warning("merchants_config.json unreadable, brand matcher is empty", exc_info=True)
+        if _empty_matcher is None:
+            _empty_matcher = BrandMatcher([])
+        return _empty_matcher
+
+
+_empty_matcher: Optional[BrandMatcher] = None
+
+
+@lru_cache(maxsize=256)
+def _single_brand_matcher(brand: str) -> BrandMatcher:
+    return BrandMatcher([brand])
+
+
+def is_brand_domain(host: str, brand: Optional[str]) -> bool:
+    """
+    Есть ли brand в домене. Бренды из конфига проверяются общим матчером
+    (результат по домену кэшируется для всех брендов сразу), остальные —
+    отдельным маленьким матчером.
+    """
+    if not brand or not host:
+        return False
+    matcher = get_brand_matcher()
+    if brand not in matcher:
+        matcher = _single_brand_matcher(brand.casefold())
+    return matcher.matches(host, brand)
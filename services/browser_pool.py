@@ -0,0 +1,297 @@
+# services/browser_pool.py
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, suppress
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from playwright.async_api import (
+    Browser,
+    Error as PlaywrightError,
+    Page,
+    Playwright,
+    async_playwright,
+)
+
+from config import get_settings
+
+from .metrics import BROWSER_ACTIVE_PAGES, BROWSER_PHASE_LATENCY
+
+settings = get_settings()
+
+# Как часто (в секундах) пересчитываем RSS дочерних процессов
+_RSS_CHECK_INTERVAL = 5.0
+
+
+class BrowserCrashedError(Exception):
+    """
+    Браузер упал во время работы со страницей.
+    Вызывающий код может просто повторить запрос — пул уже
+    поднимет новый Chromium на следующем acquire.
+    """
+
+
+class _BrowserHandle:
+    """
+    Один запущенный Chromium + счётчики для ротации.
+    """
+
+    def __init__(self, browser: Browser) -> None:
+        self.browser = browser
+        self.active = 0        # сколько контекстов открыто прямо сейчас
+        self.served = 0        # сколько страниц уже обслужил
+        self.retired = False   # помечен на перезапуск
+
+    @property
+    def alive(self) -> bool:
+        return self.browser.is_connected()
+
+
+def _children_rss_mb() -> Optional[float]:
+    """
+    Суммарный RSS всех дочерних процессов (драйвер Playwright + Chromium), в МБ.
+    Работает через /proc (Linux). На других ОС возвращает None —
+    тогда ротация по памяти просто не срабатывает.
+    """
+    proc = "/proc"
+    if not os.path.isdir(proc):
+        return None
+
+    parents: Dict[int, int] = {}
+    rss_pages: Dict[int, int] = {}
+
+    for name in os.listdir(proc):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"{proc}/{name}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Имя процесса в скобках может содержать пробелы — режем по последней ')'
+        fields = stat[stat.rfind(")") + 2:].split()
+        try:
+            parents[int(name)] = int(fields[1])
+            rss_pages[int(name)] = int(fields[21])
+        except (IndexError, ValueError):
+            continue
+
+    root = os.getpid()
+    total = 0
+    stack = [root]
+    children: Dict[int, List[int]] = {}
+    for pid, ppid in parents.items():
+        children.setdefault(ppid, []).append(pid)
+
+    while stack:
+        pid = stack.pop()
+        for child in children.get(pid, []):
+            total += rss_pages.get(child, 0)
+            stack.append(child)
+
+    return total * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class BrowserPool:
+    """
+    Долгоживущий пул Chromium-браузеров.
+
+    - каждый запрос получает изолированный browser context (куки, storage);
+    - число одновременно открытых страниц ограничено семафором;
+    - браузер перезапускается после N страниц или при превышении памяти;
+    - упавший браузер заменяется новым при следующем запросе.
+    """
+
+    def __init__(
+        self,
+        *,
+        size: int = 1,
+        max_pages: int = 4,
+        recycle_after_pages: int = 200,
+        max_rss_mb: int = 0,
+        launch_kwargs: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.size = max(1, size)
+        self.max_pages = max(1, max_pages)
+        self.recycle_after_pages = recycle_after_pages
+        self.max_rss_mb = max_rss_mb
+        self.launch_kwargs = launch_kwargs or {"headless": True}
+
+        self._playwright: Optional[Playwright] = None
+        self._slots: List[Optional[_BrowserHandle]] = [None] * self.size
+        self._slot_locks = [asyncio.Lock() for _ in range(self.size)]
+        self._pages = asyncio.Semaphore(self.max_pages)
+        self._start_lock = asyncio.Lock()
+        self._last_rss_check = 0.0
+
+    # ---------- жизненный цикл ----------
+
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+
+    async def stop(self) -> None:
+        async with self._start_lock:
+            for i, handle in enumerate(self._slots):
+                if handle is not None:
+                    await self._close(handle)
+                self._slots[i] = None
+            if self._playwright is not None:
+                with suppress(Exception):
+                    await self._playwright.stop()
+                self._playwright = None
+
+    @property
+    def active_pages(self) -> int:
+        return sum(h.active for h in self._slots if h is not None)
+
+    # ---------- выдача страниц ----------
+
+    @asynccontextmanager
+    async def page(self, **context_kwargs: Any) -> AsyncIterator[Page]:
+        """
+        Выдаёт новую страницу в отдельном browser context.
+        Контекст закрывается при выходе, браузер остаётся жить.
+        """
+        await self.start()
+
+        async with self._pages:
+            index = self._pick_slot()
+            # launch — от запроса страницы до готовой вкладки
+            # (включая запуск браузера, если его пришлось поднять)
+            started = time.perf_counter()
+            handle, context = await self._new_context(index, context_kwargs)
+            try:
+                page = await context.new_page()
+                BROWSER_PHASE_LATENCY.labels(phase="launch").observe(time.perf_counter() - started)
+                BROWSER_ACTIVE_PAGES.inc()
+                try:
+                    yield page
+                except Exception as e:
+                    if not handle.alive:
+                        raise BrowserCrashedError(str(e)) from e
+                    raise
+                finally:
+                    BROWSER_ACTIVE_PAGES.dec()
+            finally:
+                with suppress(Exception):
+                    await context.close()
+                handle.active -= 1
+                handle.served += 1
+                await self._after_release(handle)
+
+    def _pick_slot(self) -> int:
+        """
+        Берём слот с наименьшим числом активных страниц.
+        """
+        best = 0
+        best_load = None
+        for i, handle in enumerate(self._slots):
+            load = handle.active if handle is not None else 0
+            if best_load is None or load < best_load:
+                best, best_load = i, load
+        return best
+
+    async def _new_context(self, index: int, context_kwargs: Dict[str, Any]):
+        """
+        Открывает context и сразу учитывает его в handle.active,
+        чтобы браузер не закрыли из-под нас при ротации.
+        """
+        for attempt in range(2):
+            handle = await self._ensure_browser(index)
+            handle.active += 1
+            try:
+                context = await handle.browser.new_context(**context_kwargs)
+                return handle, context
+            except PlaywrightError:
+                handle.active -= 1
+                # Браузер умер между проверкой и new_context — поднимаем новый
+                if attempt == 1 or handle.alive:
+                    raise
+                handle.retired = True
+        raise RuntimeError("unreachable")
+
+    async def _ensure_browser(self, index: int) -> _BrowserHandle:
+        async with self._slot_locks[index]:
+            handle = self._slots[index]
+            if handle is not None and handle.alive and not handle.retired:
+                return handle
+
+            if handle is not None and handle.active == 0:
+                await self._close(handle)
+
+            assert self._playwright is not None
+            browser = await self._playwright.chromium.launch(**self.launch_kwargs)
+            new_handle = _BrowserHandle(browser)
+            self._slots[index] = new_handle
+            return new_handle
+
+    # ---------- ротация ----------
+
+    async def _after_release(self, handle: _BrowserHandle) -> None:
+        if not handle.retired:
+            if (
+                self.recycle_after_pages
+                and handle.served >= self.recycle_after_pages
+            ) or self._memory_exceeded():
+                handle.retired = True
+
+        # Старый браузер закрываем, только когда на нём не осталось страниц.
+        # Новые запросы уже получат свежий экземпляр через _ensure_browser.
+        if (handle.retired or not handle.alive) and handle.active == 0:
+            if handle not in self._slots:
+                await self._close(handle)
+            else:
+                index = self._slots.index(handle)
+                async with self._slot_locks[index]:
+                    if self._slots[index] is handle and handle.active == 0:
+                        self._slots[index] = None
+                        await self._close(handle)
+
+    def _memory_exceeded(self) -> bool:
+        if not self.max_rss_mb:
+            return False
+
+        now = time.monotonic()
+        if now - self._last_rss_check < _RSS_CHECK_INTERVAL:
+            return False
+        self._last_rss_check = now
+
+        rss = _children_rss_mb()
+        return rss is not None and rss > self.max_rss_mb
+
+    @staticmethod
+    async def _close(handle: _BrowserHandle) -> None:
+        with suppress(Exception):
+            await handle.browser.close()
+
+
+_pool: Optional[BrowserPool] = None
+
+
+def _launch_kwargs() -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {"headless": True}
+    if settings.BROWSER_PROXY:
+        kwargs["proxy"] = {"server": settings.BROWSER_PROXY}
+    return kwargs
+
+
+def get_browser_pool() -> BrowserPool:
+    """
+    Единый пул на процесс. Запускается/останавливается в lifespan FastAPI,
+    но при необходимости стартует лениво при первом запросе.
+    """
+    global _pool
+    if _pool is None:
+        _pool = BrowserPool(
+            size=settings.BROWSER_POOL_SIZE,
+            max_pages=settings.BROWSER_MAX_PAGES,
+            recycle_after_pages=settings.BROWSER_RECYCLE_AFTER_PAGES,
+            max_rss_mb=settings.BROWSER_MAX_RSS_MB,
+            launch_kwargs=_launch_kwargs(),
+        )
+    return _pool
@@ -1,63 +1,189 @@
-from typing import List, Tuple
+import asyncio
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
 
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
+
+from config import get_settings
+
+from .browser_pool import BrowserCrashedError, get_browser_pool
+from .cta import cta_selector, cta_texts_for, match_cta, rank_cta
+from .metrics import BROWSER_PHASE_LATENCY, count_error
+from .page_profile import PageProfile, apply_profile, get_default_profile
+from .redirect_cache import get_redirect_cache
+from .throttle import get_host_upstream
+
+settings = get_settings()
+
+# Сколько найденных по тексту элементов сравниваем перед кликом
+_MAX_CTA_CANDIDATES = 20
 
 
 async def resolve_url(
     url: str,
     wait_seconds: int = 8,
     click_texts: List[str] | None = None,
-) -> Tuple[str, List[str]]:
+    use_cache: bool = True,
+    profile: Optional[PageProfile] = None,
+    country: Optional[str] = None,
+) -> Tuple[str, List[str], Optional[str]]:
     """
     Открывает URL в Chromium, отслеживает редиректы,
     пытается нажимать типовые кнопки.
-    Возвращает (final_url, redirects_list).
+    Возвращает (final_url, redirects_list, cta) — cta: текст нажатой
+    кнопки или None, если ничего не нажимали.
+
+    Браузер берётся из общего пула (services/browser_pool.py),
+    на каждый URL создаётся отдельный изолированный context.
+    Результат кэшируется (services/redirect_cache.py), use_cache=False —
+    всегда открывать страницу заново.
+    profile — что блокировать и как ждать загрузку (по умолчанию из настроек).
+    country — если click_texts не заданы, берём пресет кнопок для страны
+    (services/cta.py).
     """
-    click_texts = click_texts or ["Continue", "I agree", "Agree", "Accept", "Proceed"]
+    cache = get_redirect_cache()
+    cached = await cache.get("browser", url) if use_cache else None
+    if cached is not None:
+        return cached.final_url, cached.chain, cached.cta_text
 
-    redirects: List[str] = []
+    # Тот же лимит и breaker на хост, что и у httpx-резолва; без повторов —
+    # страница в браузере и так дорогая
+    final_url, redirects, cta = await get_host_upstream().call(
+        urlparse(url).netloc.lower(),
+        lambda: _resolve_with_pool(
+            url,
+            wait_seconds,
+            click_texts or cta_texts_for(country),
+            profile or get_default_profile(),
+        ),
+        attempts=1,
+    )
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
+    await cache.put(
+        "browser",
+        url,
+        final_url=final_url,
+        final_domain=urlparse(final_url).netloc.lower(),
+        chain=redirects,
+        cta_text=cta,
+    )
+    return final_url, redirects, cta
 
-        # Собираем все переходы
-        def on_navigate(frame):
-            if frame.url and frame.url not in redirects:
-                redirects.append(frame.url)
 
-        page.on("framenavigated", on_navigate)
+async def _resolve_with_pool(
+    url: str,
+    wait_seconds: int,
+    click_texts: List[str],
+    profile: PageProfile,
+) -> Tuple[str, List[str], Optional[str]]:
+    pool = get_browser_pool()
 
-        # Переход на страницу
+    # Если браузер упал посреди работы — пул поднимет новый,
+    # а мы один раз повторим запрос, не роняя его.
+    for attempt in range(2):
         try:
+            async with pool.page() as page:
+                await apply_profile(page, profile)
+                return await _resolve_on_page(page, url, wait_seconds, click_texts, profile)
+        except BrowserCrashedError as e:
+            count_error("browser", e)
+            if attempt == 1:
+                raise
+
+    raise RuntimeError("unreachable")
+
+
+async def _resolve_on_page(
+    page: Page,
+    url: str,
+    wait_seconds: int,
+    click_texts: List[str],
+    profile: PageProfile,
+) -> Tuple[str, List[str], Optional[str]]:
+    redirects: List[str] = []
+    loop = asyncio.get_running_loop()
+    last_navigation = loop.time()
+    navigated = asyncio.Event()
+
+    # Собираем все переходы
+    def on_navigate(frame):
+        nonlocal last_navigation
+        if frame == page.main_frame:
+            last_navigation = loop.time()
+            navigated.set()
+        if frame.url and frame.url not in redirects:
+            redirects.append(frame.url)
+
+    page.on("framenavigated", on_navigate)
+
+    deadline = loop.time() + wait_seconds
+
+    async def settle() -> None:
+        # Вместо networkidle: ждём, пока JS/meta-редиректы не затихнут
+        # на settle_ms, но не дольше общего wait_seconds
+        if not profile.settle_ms:
+            return
+        quiet = profile.settle_ms / 1000
+        while loop.time() < deadline and loop.time() - last_navigation < quiet:
+            await asyncio.sleep(0.1)
+
+    # Переход на страницу
+    try:
+        with BROWSER_PHASE_LATENCY.labels(phase="goto").time():
             await page.goto(
                 url,
-                wait_until="networkidle",
+                wait_until=profile.wait_until,
                 timeout=wait_seconds * 1000,
             )
-        except PlaywrightTimeoutError:
-            # При таймауте просто продолжаем работать с тем,
-            # что успели загрузить (частичный успех).
-            pass
+    except PlaywrightTimeoutError:
+        # При таймауте просто продолжаем работать с тем,
+        # что успели загрузить (частичный успех).
+        pass
+
+    with BROWSER_PHASE_LATENCY.labels(phase="settle").time():
+        await settle()
+
+    # Кандидатов ищем одним селектором сразу по всем текстам, а нажимаем
+    # тот, чей текст раньше в click_texts (не первый по порядку в DOM)
+    cta: Optional[str] = None
+    click_started = loop.time()
+    try:
+        candidates = page.locator(cta_selector(click_texts))
+        # Все подписи — одним запросом к странице, а не по элементу
+        labels = (await candidates.all_inner_texts())[:_MAX_CTA_CANDIDATES]
+        best = None
+        for i, label in enumerate(labels):
+            rank = rank_cta(label, click_texts)
+            if rank is not None and (best is None or rank < best[0]):
+                best = (rank, i, label)
 
-        # Пытаемся нажать типовые кнопки
-        for text in click_texts:
+        if best is not None:
+            _, i, label = best
+            navigated.clear()
+            await candidates.nth(i).click(timeout=2000)
+            cta = match_cta(label, click_texts) or label.strip()[:100]
+
+            # Ждём перехода после клика, а не фиксированную паузу
             try:
-                btn = await page.query_selector(f"text={text}")
-                if btn:
-                    await btn.click()
-                    # дадим странице чуть времени после клика
-                    await page.wait_for_timeout(3000)
-                    break
-            except Exception:
-                # Любые ошибки клика игнорируем, задача — дойти до финального URL
+                await asyncio.wait_for(
+                    navigated.wait(),
+                    timeout=settings.BROWSER_CTA_NAVIGATION_MS / 1000,
+                )
+            except asyncio.TimeoutError:
                 pass
+            else:
+                await settle()
+    except Exception as e:
+        # Любые ошибки клика игнорируем, задача — дойти до финального URL
+        count_error("cta_click", e)
+
+    # click — поиск кнопки, клик и переход после него
+    BROWSER_PHASE_LATENCY.labels(phase="click").observe(loop.time() - click_started)
 
-        final_url = page.url
-        await browser.close()
+    final_url = page.url
 
     # Если по какой-то причине навигации не было — вернём исходный URL
     if not redirects:
         redirects.append(url)
 
-    return final_url, redirects
+    return final_url, redirects, cta
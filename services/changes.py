@@ -0,0 +1,146 @@
+# services/changes.py
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import MirrorChange
+
+
+def log_change(
+    db: Session,
+    *,
+    mirror_id: int,
+    kind: str,
+    row: Dict[str, Any],
+    previous_final_domain: Optional[str] = None,
+    changed_at: Optional[datetime] = None,
+) -> None:
+    """
+    Добавляет запись в журнал в текущую транзакцию (commit делает вызывающий).
+    """
+    db.add(
+        MirrorChange(
+            mirror_id=mirror_id,
+            kind=kind,
+            merchant=row["merchant"],
+            country=row["country"],
+            keyword=row["keyword"],
+            source_url=row["source_url"],
+            source_domain=row["source_domain"],
+            final_url=row.get("final_url"),
+            final_domain=row.get("final_domain"),
+            previous_final_domain=previous_final_domain,
+            is_mirror=bool(row.get("is_mirror", False)),
+            changed_at=changed_at or datetime.utcnow(),
+        )
+    )
+
+
+def _mirror_key(row: Dict[str, Any]) -> Tuple:
+    # uq_mirror_unique (см. models.Mirror)
+    return (
+        row["merchant"],
+        row["country"],
+        row["keyword"],
+        row["source_domain"],
+        row["final_domain"],
+    )
+
+
+def log_upserted_mirrors(
+    db: Session,
+    upserted: Sequence[Tuple[int, Dict[str, Any], bool]],
+    *,
+    redirected: Sequence[Tuple[Dict[str, Any], str]],
+    changed_at: Optional[datetime] = None,
+) -> None:
+    """
+    Журналирует строки пачки bulk upsert-а: (mirror_id, row, created).
+
+    redirected — (row, прошлый final_domain) из history.record_observations:
+    смена считается по самому source_url (плюс merchant, country, keyword),
+    а не по source_domain. У одного домена-редиректора часто несколько URL
+    с разными целями, и при сравнении по домену каждый из них выглядел бы
+    сменой относительно соседа. Такие строки — final_domain_changed с
+    прошлым доменом, остальные новые строки — created, обновление без
+    смены цели в журнал не попадает.
+
+    Два URL одного домена с разными целями: повторный прогон ничего не пишет,
+    смена цели одного URL — ровно одна запись.
+
+    >>> from sqlalchemy import create_engine, select
+    >>> from sqlalchemy.orm import Session
+    >>> from models import Base, MirrorChange
+    >>> from services.mirrors import bulk_upsert_mirrors
+    >>> engine = create_engine("sqlite://")
+    >>> Base.metadata.create_all(engine)
+    >>> def row(url, final):
+    ...     return {"merchant": "stake", "country": "in", "keyword": "casino",
+    ...             "source_url": url, "source_domain": "aff.com",
+    ...             "final_url": f"https://{final}/", "final_domain": final,
+    ...             "is_redirector": True, "is_mirror": final == "stake.com"}
+    >>> def kinds(db):
+    ...     return [(c.kind, c.source_url, c.previous_final_domain)
+    ...             for c in db.scalars(select(MirrorChange).order_by(MirrorChange.seq))]
+    >>> with Session(engine) as db:
+    ...     for _ in range(3):
+    ...         _ = bulk_upsert_mirrors(db, [row("https://aff.com/a", "stake.com"),
+    ...                                      row("https://aff.com/b", "other.com")])
+    ...     kinds(db)
+    [('created', 'https://aff.com/a', None), ('created', 'https://aff.com/b', None)]
+    >>> with Session(engine) as db:
+    ...     _ = bulk_upsert_mirrors(db, [row("https://aff.com/a", "stake.com"),
+    ...                                  row("https://aff.com/b", "stake.com")])
+    ...     kinds(db)[2:]
+    [('final_domain_changed', 'https://aff.com/b', 'other.com')]
+    """
+    mirror_ids = {_mirror_key(row): mirror_id for mirror_id, row, _ in upserted}
+
+    logged = set()
+    for row, previous in redirected:
+        mirror_id = mirror_ids[_mirror_key(row)]
+        log_change(
+            db,
+            mirror_id=mirror_id,
+            kind="final_domain_changed",
+            row=row,
+            previous_final_domain=previous,
+            changed_at=changed_at,
+        )
+        logged.add(mirror_id)
+
+    for mirror_id, row, created in upserted:
+        if created and mirror_id not in logged:
+            log_change(db, mirror_id=mirror_id, kind="created", row=row, changed_at=changed_at)
+
+
+def fetch_changes(db: Session, since_seq: int, limit: int) -> List[Dict[str, Any]]:
+    rows = db.scalars(
+        select(MirrorChange)
+        .where(MirrorChange.seq > since_seq)
+        .order_by(MirrorChange.seq.asc())
+        .limit(limit)
+    )
+    return [
+        {
+            "seq": c.seq,
+            "mirror_id": c.mirror_id,
+            "kind": c.kind,
+            "merchant": c.merchant,
+            "country": c.country,
+            "keyword": c.keyword,
+            "source_url": c.source_url,
+            "source_domain": c.source_domain,
+            "final_url": c.final_url,
+            "final_domain": c.final_domain,
+            "previous_final_domain": c.previous_final_domain,
+            "is_mirror": c.is_mirror,
+            "changed_at": c.changed_at,
+        }
+        for c in rows
+    ]
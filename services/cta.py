@@ -0,0 +1,97 @@
+# services/cta.py
+
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Базовые тексты кнопок — подходят для любой страны
+BASE_CTA_TEXTS = ["Continue", "I agree", "Agree", "Accept", "Proceed"]
+
+# Дополнительные тексты по странам (gl из Serper), в порядке приоритета.
+# Только согласие/продолжение: «Войти», «Login», «Play now» ведут на вход
+# или в лобби, и финальным URL стала бы страница логина.
+COUNTRY_CTA_TEXTS: Dict[str, List[str]] = {
+    "in": ["जारी रखें", "सहमत", "स्वीकार करें", "आगे बढ़ें"],
+    "bd": ["চালিয়ে যান", "সম্মত", "গ্রহণ করুন"],
+    "pk": ["جاری رکھیں", "متفق", "قبول کریں"],
+    "br": ["Continuar", "Concordo", "Aceitar", "Prosseguir"],
+    "pt": ["Continuar", "Concordo", "Aceitar", "Prosseguir"],
+    "es": ["Continuar", "Acepto", "Aceptar", "Estoy de acuerdo"],
+    "mx": ["Continuar", "Acepto", "Aceptar", "Estoy de acuerdo"],
+    "ar": ["Continuar", "Acepto", "Aceptar", "Estoy de acuerdo"],
+    "cl": ["Continuar", "Acepto", "Aceptar", "Estoy de acuerdo"],
+    "co": ["Continuar", "Acepto", "Aceptar", "Estoy de acuerdo"],
+    "pe": ["Continuar", "Acepto", "Aceptar", "Estoy de acuerdo"],
+    "ru": ["Продолжить", "Согласен", "Принять", "Перейти"],
+    "kz": ["Продолжить", "Согласен", "Принять", "Перейти", "Жалғастыру"],
+    "uz": ["Продолжить", "Согласен", "Davom etish", "Qabul qilish"],
+    "ua": ["Продовжити", "Погоджуюсь", "Прийняти", "Перейти"],
+    "tr": ["Devam", "Devam et", "Kabul ediyorum", "Kabul et"],
+    "az": ["Davam et", "Razıyam", "Qəbul et"],
+    "de": ["Weiter", "Fortfahren", "Zustimmen", "Akzeptieren"],
+    "fr": ["Continuer", "J'accepte", "Accepter", "Poursuivre"],
+    "it": ["Continua", "Accetto", "Accetta", "Procedi"],
+    "pl": ["Kontynuuj", "Zgadzam się", "Akceptuję", "Przejdź"],
+    "id": ["Lanjutkan", "Setuju", "Terima"],
+    "vn": ["Tiếp tục", "Đồng ý", "Chấp nhận"],
+    "th": ["ดำเนินการต่อ", "ยอมรับ", "ตกลง"],
+    "ph": ["Magpatuloy", "Sumasang-ayon"],
+    "jp": ["続ける", "同意する", "承諾"],
+    "kr": ["계속", "동의", "수락"],
+}
+
+
+def cta_texts_for(country: Optional[str], extra: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Тексты кнопок для страны: сначала явно переданные (extra),
+    потом пресет страны, потом базовые английские. Без дублей.
+    """
+    texts: List[str] = []
+    seen = set()
+    for text in [*(extra or []), *COUNTRY_CTA_TEXTS.get((country or "").lower(), []), *BASE_CTA_TEXTS]:
+        key = text.strip().casefold()
+        if key and key not in seen:
+            seen.add(key)
+            texts.append(text.strip())
+    return texts
+
+
+def _alternation(texts: Iterable[str]) -> str:
+    # Длинные тексты вперёд, чтобы "I agree" не проиграл "Agree"
+    ordered = sorted({t for t in texts if t}, key=len, reverse=True)
+    return "|".join(re.escape(t).replace("/", r"\/") for t in ordered)
+
+
+def cta_selector(texts: Iterable[str]) -> str:
+    """
+    Один Playwright text-селектор с регулярным выражением на все тексты
+    (регистр не важен) — кандидаты ищутся одним проходом по DOM,
+    а какой из них нажать, решает rank_cta.
+    """
+    return f"text=/{_alternation(texts)}/i"
+
+
+def match_cta(label: str, texts: Iterable[str]) -> Optional[str]:
+    """
+    Какой из текстов оказался на нажатом элементе (для записи в результат).
+    """
+    lowered = label.casefold()
+    for text in sorted(texts, key=len, reverse=True):
+        if text.casefold() in lowered:
+            return text
+    return None
+
+
+def rank_cta(label: str, texts: Sequence[str]) -> Optional[Tuple[int, int]]:
+    """
+    Приоритет найденного элемента: (позиция текста в texts, 0 — подпись
+    совпадает с текстом целиком, 1 — только содержит его). Меньше — лучше,
+    None — ни один текст не подходит.
+    """
+    lowered = " ".join(label.split()).casefold()
+    for position, text in enumerate(texts):
+        wanted = text.casefold()
+        if wanted in lowered:
+            return position, 0 if lowered == wanted else 1
+    return None
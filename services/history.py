@@ -0,0 +1,270 @@
+# services/history.py
+"""
+История редиректов в компактном виде: справочники доменов, мерчантов,
+keywords и URL (models.Domain/Merchant/Keyword/Url) и интервалы
+наблюдений «source_url вёл на final_domain» (models.MirrorObservation).
+
+mirrors хранит только текущее состояние, а здесь видно, куда редиректор
+вёл неделю назад: выборка по домену идёт по индексу
+(source_domain_id, last_seen_at).
+
+id строк справочников не меняются, поэтому кэшируются в процессе:
+в транзакции пачки запросы к справочникам идут только за новыми
+значениями. В кэш попадают id только после commit (до него новую
+строку ещё может откатить rollback).
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, event, insert, select, tuple_, update
+from sqlalchemy.orm import InstrumentedAttribute, Session, aliased
+
+from config import get_settings
+from models import Domain, Keyword, Merchant, MirrorObservation, Url
+
+settings = get_settings()
+
+# Ключей в одном IN (...): держим число bind-параметров ниже лимита SQLite
+_LOOKUP_CHUNK = 200
+
+# Таблица справочника -> {значение: id}, только закоммиченные строки
+_ID_CACHE: Dict[str, Dict[str, int]] = {}
+
+# Ключ в Session.info: id, найденные в текущей транзакции
+_PENDING_IDS = "history_pending_ids"
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_ids(session: Session) -> None:
+    pending = session.info.pop(_PENDING_IDS, None)
+    if not pending:
+        return
+    for table, ids in pending.items():
+        cache = _ID_CACHE.setdefault(table, {})
+        if len(cache) + len(ids) > settings.HISTORY_ID_CACHE_SIZE:
+            # Простой предел памяти: проще начать заново, чем вести LRU
+            cache.clear()
+        cache.update(ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_ids(session: Session) -> None:
+    session.info.pop(_PENDING_IDS, None)
+
+_TASK_COLUMNS = (
+    MirrorObservation.source_url_id,
+    MirrorObservation.merchant_id,
+    MirrorObservation.country,
+    MirrorObservation.keyword_id,
+)
+
+
+def _insert_ignore(db: Session, model, rows: List[Dict[str, Any]]) -> None:
+    """INSERT ... ON CONFLICT DO NOTHING: строку мог добавить параллельный писатель."""
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f"insert ignore не поддерживается для {dialect}")
+
+    db.execute(dialect_insert(model).on_conflict_do_nothing(), rows)
+
+
+def _intern(
+    db: Session,
+    column: InstrumentedAttribute,
+    values: Dict[str, Dict[str, Any]],
+) -> Dict[str, int]:
+    """
+    id строк справочника для values (значение -> доп. колонки новой строки),
+    недостающие добавляются. Известные процессу id берутся из _ID_CACHE.
+    """
+    model = column.class_
+    cached = _ID_CACHE.get(model.__tablename__, {})
+    ids: Dict[str, int] = {name: cached[name] for name in values if name in cached}
+    values = {name: extra for name, extra in values.items() if name not in ids}
+    if not values:
+        return ids
+    found: Dict[str, int] = {}
+
+    def lookup(names: List[str]) -> None:
+        for start in range(0, len(names), _LOOKUP_CHUNK):
+            chunk = names[start:start + _LOOKUP_CHUNK]
+            for name, row_id in db.execute(select(column, model.id).where(column.in_(chunk))):
+                found[name] = row_id
+
+    lookup(list(values))
+    missing = [name for name in values if name not in found]
+    if missing:
+        _insert_ignore(db, model, [{column.key: name, **values[name]} for name in missing])
+        lookup(missing)
+
+    pending = db.info.setdefault(_PENDING_IDS, {})
+    pending.setdefault(model.__tablename__, {}).update(found)
+    ids.update(found)
+    return ids
+
+
+def record_observations(
+    db: Session,
+    rows: Sequence[Dict[str, Any]],
+    *,
+    seen_at: datetime,
+) -> List[Tuple[Dict[str, Any], str]]:
+    """
+    Добавляет наблюдения строк сбора в текущую транзакцию (commit делает
+    вызывающий). Если последний интервал той же строки (source_url,
+    merchant, country, keyword) вёл на тот же final_domain — продлевается
+    его last_seen_at, иначе открывается новый интервал.
+
+    Возвращает (row, прошлый final_domain) для строк, чей source_url
+    раньше вёл на другой домен, — это и есть смены цели редиректора
+    (services/changes.py).
+    """
+    rows = [r for r in rows if r.get("source_domain")]
+    if not rows:
+        return []
+
+    domains = _intern(
+        db,
+        Domain.name,
+        {
+            name: {}
+            for r in rows
+            for name in (r["source_domain"], r.get("final_domain"))
+            if name
+        },
+    )
+    merchants = _intern(db, Merchant.name, {r["merchant"]: {} for r in rows})
+    keywords = _intern(db, Keyword.name, {r["keyword"]: {} for r in rows})
+
+    url_values: Dict[str, Dict[str, Any]] = {}
+    for r in rows:
+        url_values[r["source_url"]] = {"domain_id": domains[r["source_domain"]]}
+        if r.get("final_url") and r.get("final_domain"):
+            url_values[r["final_url"]] = {"domain_id": domains[r["final_domain"]]}
+    urls = _intern(db, Url.url, url_values)
+
+    # Ключ интервала -> последняя строка с ним (как в bulk upsert)
+    keyed: Dict[Tuple, Dict[str, Any]] = {}
+    for r in rows:
+        key = (
+            urls[r["source_url"]],
+            merchants[r["merchant"]],
+            r["country"],
+            keywords[r["keyword"]],
+        )
+        keyed[key] = r
+
+    # Ключ -> (id, final_domain_id, final_domain) последнего интервала
+    latest: Dict[Tuple, Tuple[int, Optional[int], Optional[str]]] = {}
+    keys = list(keyed)
+    for start in range(0, len(keys), _LOOKUP_CHUNK):
+        chunk = keys[start:start + _LOOKUP_CHUNK]
+        found = db.execute(
+            select(
+                MirrorObservation.id,
+                *_TASK_COLUMNS,
+                MirrorObservation.final_domain_id,
+                Domain.name,
+            )
+            .outerjoin(Domain, Domain.id == MirrorObservation.final_domain_id)
+            .where(tuple_(*_TASK_COLUMNS).in_(chunk))
+            .order_by(MirrorObservation.last_seen_at.asc(), MirrorObservation.id.asc())
+        )
+        for obs_id, *key, final_domain_id, final_domain in found:
+            latest[tuple(key)] = (obs_id, final_domain_id, final_domain)
+
+    extended: List[Dict[str, Any]] = []
+    opened: List[Dict[str, Any]] = []
+    redirected: List[Tuple[Dict[str, Any], str]] = []
+    for key, r in keyed.items():
+        final_domain_id = domains.get(r.get("final_domain") or "")
+        current = latest.get(key)
+
+        if current is not None and current[1] == final_domain_id:
+            extended.append(
+                {"id": current[0], "last_seen_at": seen_at, "is_mirror": bool(r["is_mirror"])}
+            )
+            continue
+        if current is not None and current[2] and final_domain_id is not None:
+            redirected.append((r, current[2]))
+
+        source_url_id, merchant_id, country, keyword_id = key
+        opened.append(
+            {
+                "merchant_id": merchant_id,
+                "country": country,
+                "keyword_id": keyword_id,
+                "source_url_id": source_url_id,
+                "source_domain_id": domains[r["source_domain"]],
+                "final_url_id": urls.get(r.get("final_url") or "") if final_domain_id else None,
+                "final_domain_id": final_domain_id,
+                "is_mirror": bool(r["is_mirror"]),
+                "first_seen_at": seen_at,
+                "last_seen_at": seen_at,
+            }
+        )
+
+    if extended:
+        db.execute(update(MirrorObservation), extended)
+    if opened:
+        db.execute(insert(MirrorObservation), opened)
+    return redirected
+
+
+def history_query(
+    source: str,
+    *,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 500,
+) -> Select:
+    """
+    Интервалы «куда вёл source» в порядке времени.
+    source — домен (stake-go.com) или полный URL редиректора.
+    since/until — только интервалы, пересекающиеся с [since, until].
+    """
+    source_url = aliased(Url)
+    source_domain = aliased(Domain)
+    final_url = aliased(Url)
+    final_domain = aliased(Domain)
+
+    stmt = (
+        select(
+            Merchant.name.label("merchant"),
+            MirrorObservation.country,
+            Keyword.name.label("keyword"),
+            source_url.url.label("source_url"),
+            source_domain.name.label("source_domain"),
+            final_url.url.label("final_url"),
+            final_domain.name.label("final_domain"),
+            MirrorObservation.is_mirror,
+            MirrorObservation.first_seen_at,
+            MirrorObservation.last_seen_at,
+        )
+        .join(Merchant, Merchant.id == MirrorObservation.merchant_id)
+        .join(Keyword, Keyword.id == MirrorObservation.keyword_id)
+        .join(source_url, source_url.id == MirrorObservation.source_url_id)
+        .join(source_domain, source_domain.id == MirrorObservation.source_domain_id)
+        .outerjoin(final_url, final_url.id == MirrorObservation.final_url_id)
+        .outerjoin(final_domain, final_domain.id == MirrorObservation.final_domain_id)
+    )
+
+    if "://" in source:
+        stmt = stmt.where(source_url.url == source.strip())
+    else:
+        stmt = stmt.where(source_domain.name == source.strip().lower())
+
+    if since is not None:
+        stmt = stmt.where(MirrorObservation.last_seen_at >= since)
+    if until is not None:
+        stmt = stmt.where(MirrorObservation.first_seen_at <= until)
+
+    return stmt.order_by(MirrorObservation.first_seen_at.asc(), MirrorObservation.id.asc()).limit(limit)
@@ -0,0 +1,93 @@
+# services/http_clients.py
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import weakref
+from typing import Optional
+
+import httpx
+
+from config import get_settings
+
+settings = get_settings()
+
+
+def _http2_available() -> bool:
+    return settings.HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+
+class HttpClients:
+    """
+    Набор долгоживущих httpx.AsyncClient на процесс:
+      - serper  — только для google.serper.dev (мало соединений, один хост);
+      - targets — для произвольных сайтов при резолве редиректов.
+
+    Клиенты держат keep-alive соединения между запросами,
+    поэтому TCP+TLS не поднимается заново на каждый URL.
+    """
+
+    def __init__(self) -> None:
+        http2 = _http2_available()
+
+        self.serper = httpx.AsyncClient(
+            timeout=20.0,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.SERPER_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SERPER_MAX_KEEPALIVE,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self.targets = httpx.AsyncClient(
+            timeout=25.0,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.TARGET_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.TARGET_MAX_KEEPALIVE,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    async def aclose(self) -> None:
+        await self.serper.aclose()
+        await self.targets.aclose()
+
+
+# Соединения httpx привязаны к event loop, поэтому реестр — на каждый loop.
+# Основной loop приложения создаёт клиентов в lifespan, а фоновые запуски
+# в отдельном loop получают свой набор и закрывают его сами.
+_registry: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, HttpClients]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_http_clients() -> HttpClients:
+    loop = asyncio.get_running_loop()
+    clients = _registry.get(loop)
+    if clients is None:
+        clients = HttpClients()
+        _registry[loop] = clients
+    return clients
+
+
+def get_serper_client() -> httpx.AsyncClient:
+    return get_http_clients().serper
+
+
+def get_target_client() -> httpx.AsyncClient:
+    return get_http_clients().targets
+
+
+async def init_http_clients() -> None:
+    get_http_clients()
+
+
+async def close_http_clients() -> None:
+    """
+    Закрывает клиентов текущего event loop (если они были созданы).
+    """
+    clients: Optional[HttpClients] = _registry.pop(asyncio.get_running_loop(), None)
+    if clients is not None:
+        await clients.aclose()
@@ -1,5 +1,13 @@
+import asyncio
 from typing import List, Dict, Any
+from urllib.parse import urlparse
+
+from config import get_settings
+
 from .browser_resolver import resolve_url
+from .tiered_resolver import resolve_tiered
+
+settings = get_settings()
 
 
 async def resolve_urls_for_merchant(
@@ -7,40 +15,77 @@ async def resolve_urls_for_merchant(
     urls: List[str],
     click_texts: List[str] | None = None,
     wait_seconds: int = 8,
+    concurrency: int | None = None,
+    per_host_limit: int | None = None,
+    use_cache: bool = True,
+    tiered: bool = False,
+    country: str | None = None,
 ) -> List[Dict[str, Any]]:
     """
     Прогоняет список URL одного мерчанта через браузерный резолвер.
-    Возвращает список словарей с результатами по каждому URL.
+    Возвращает список словарей с результатами по каждому URL
+    (в том же порядке, что и входной список).
+
+    concurrency    — сколько URL резолвим одновременно (по умолчанию из настроек);
+    per_host_limit — сколько одновременных запросов допускаем к одному хосту,
+                     чтобы не долбить один и тот же редиректор.
+    use_cache      — False: не брать результат из кэша редиректов.
+    tiered         — True: сначала httpx, браузер только по эвристикам
+                     (services/tiered_resolver.py); иначе всегда Playwright.
+    country        — пресет текстов кнопок, если click_texts не заданы.
     """
-    results: List[Dict[str, Any]] = []
-
-    for url in urls:
-        try:
-            final_url, redirects = await resolve_url(
-                url=url,
-                wait_seconds=wait_seconds,
-                click_texts=click_texts,
-            )
-            results.append(
-                {
+    workers = max(1, concurrency or settings.RESOLVE_BATCH_CONCURRENCY)
+    host_limit = max(1, per_host_limit or settings.RESOLVE_PER_HOST_LIMIT)
+
+    batch_sem = asyncio.Semaphore(workers)
+    host_sems: Dict[str, asyncio.Semaphore] = {}
+
+    async def resolve_one(url: str) -> Dict[str, Any]:
+        host = urlparse(url).netloc.lower()
+        host_sem = host_sems.setdefault(host, asyncio.Semaphore(host_limit))
+
+        async with host_sem, batch_sem:
+            try:
+                if tiered:
+                    resolved = await resolve_tiered(
+                        url,
+                        click_texts=click_texts,
+                        wait_seconds=wait_seconds,
+                        use_cache=use_cache,
+                        country=country,
+                    )
+                    final_url, redirects = resolved.final_url, resolved.redirects
+                    tier, cta = resolved.tier, resolved.cta_text
+                else:
+                    final_url, redirects, cta = await resolve_url(
+                        url=url,
+                        wait_seconds=wait_seconds,
+                        click_texts=click_texts,
+                        use_cache=use_cache,
+                        country=country,
+                    )
+                    tier = "browser"
+                return {
                     "merchant": merchant,
                     "start_url": url,
                     "final_url": final_url,
                     "redirects": redirects,
+                    "tier": tier,
+                    "cta": cta,
                     "ok": True,
                     "error": None,
                 }
-            )
-        except Exception as e:
-            results.append(
-                {
+            except Exception as e:
+                return {
                     "merchant": merchant,
                     "start_url": url,
                     "final_url": None,
                     "redirects": [],
+                    "tier": None,
+                    "cta": None,
                     "ok": False,
                     "error": str(e),
                 }
-            )
 
-    return results
+    # gather сохраняет порядок входного списка
+    return list(await asyncio.gather(*(resolve_one(url) for url in urls)))
@@ -12,13 +12,16 @@ async def collect_mirrors_interactive_for_merchant(
     limit: int = 10,
     click_texts: List[str] | None = None,
     wait_seconds: int = 8,
+    bypass_cache: bool = False,
 ) -> List[Dict[str, Any]]:
     """
     Полный интерактивный цикл:
       1) Формируем поисковый запрос для Serper (мерчант + ключи + страна).
       2) Получаем кандидатов-URL из Serper.
-      3) Прогоняем их через Playwright (клики, редиректы).
+      3) Резолвим их: сначала httpx, Playwright (клики, редиректы) —
+         только для страниц, которым он нужен (поле tier в результате).
       4) Возвращаем результаты по каждому URL.
+    bypass_cache=True — перепроверить URL, не глядя в кэш редиректов.
     """
     # Простейшая сборка поискового запроса
     parts: List[str] = [merchant] + keywords + [country]
@@ -34,6 +37,9 @@ async def collect_mirrors_interactive_for_merchant(
         urls=raw_urls,
         click_texts=click_texts,
         wait_seconds=wait_seconds,
+        use_cache=not bypass_cache,
+        tiered=True,
+        country=country,
     )
 
     # Можно добавить поле query для прозрачности
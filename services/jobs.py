@@ -0,0 +1,209 @@
+# services/jobs.py
+
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from models import CollectionJob
+
+from .metrics import JOBS_IN_FLIGHT
+from .mirrors import collect_mirrors_for_all, collect_mirrors_for_batch
+
+settings = get_settings()
+
+JOB_KINDS = ("all", "batch")
+
+
+# ---------- API-сторона: постановка и просмотр ----------
+
+
+def enqueue_job(
+    db: Session, kind: str, params: Dict[str, Any], *, commit: bool = True
+) -> CollectionJob:
+    """
+    commit=False — только flush (id уже есть): задание попадёт в очередь
+    вместе с остальными изменениями той же транзакции.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"unknown job kind: {kind}")
+
+    job = CollectionJob(
+        kind=kind,
+        params=json.dumps(params, ensure_ascii=False),
+        status="queued",
+    )
+    db.add(job)
+    if not commit:
+        db.flush()
+        return job
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def job_to_dict(job: CollectionJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "params": json.loads(job.params),
+        "progress": json.loads(job.progress) if job.progress else None,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+# ---------- воркер-сторона: lease ----------
+
+
+def _claimable(now: datetime):
+    """
+    Задание можно забрать, если оно в очереди или его lease истёк
+    (воркер, который его держал, умер или завис).
+    """
+    return or_(
+        CollectionJob.status == "queued",
+        (CollectionJob.status == "running") & (CollectionJob.lease_expires_at < now),
+    )
+
+
+def claim_job(db: Session, worker_id: str) -> Optional[CollectionJob]:
+    """
+    Атомарно забирает самое старое доступное задание.
+    Гонку между воркерами решает условный UPDATE: кто первым обновил
+    строку (rowcount == 1), тот и владелец.
+    """
+    now = datetime.utcnow()
+
+    while True:
+        job_id = db.scalar(
+            select(CollectionJob.id)
+            .where(_claimable(now))
+            .order_by(CollectionJob.id.asc())
+            .limit(1)
+        )
+        if job_id is None:
+            return None
+
+        res = db.execute(
+            update(CollectionJob)
+            .where(CollectionJob.id == job_id, _claimable(now))
+            .values(
+                status="running",
+                lease_owner=worker_id,
+                lease_expires_at=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                attempts=CollectionJob.attempts + 1,
+                started_at=now,
+            )
+        )
+        db.commit()
+
+        if res.rowcount != 1:
+            # Кто-то успел раньше — пробуем следующее
+            continue
+
+        job = db.get(CollectionJob, job_id)
+        db.refresh(job)
+
+        if job.attempts > settings.JOB_MAX_ATTEMPTS:
+            _finish(db, job.id, worker_id, status="failed", error="too many attempts")
+            continue
+
+        return job
+
+
+def renew_lease(db: Session, job_id: int, worker_id: str) -> bool:
+    """
+    Продлевает lease. False — задание уже не наше (lease перехватили).
+    """
+    res = db.execute(
+        update(CollectionJob)
+        .where(CollectionJob.id == job_id, CollectionJob.lease_owner == worker_id)
+        .values(
+            lease_expires_at=datetime.utcnow()
+            + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        )
+    )
+    db.commit()
+    return res.rowcount == 1
+
+
+def record_progress(db: Session, job_id: int, worker_id: str, progress: Dict[str, Any]) -> None:
+    db.execute(
+        update(CollectionJob)
+        .where(CollectionJob.id == job_id, CollectionJob.lease_owner == worker_id)
+        .values(progress=json.dumps(progress))
+    )
+    db.commit()
+
+
+def complete_job(db: Session, job_id: int, worker_id: str, result: Dict[str, Any]) -> None:
+    _finish(db, job_id, worker_id, status="done", result=result)
+
+
+def fail_job(db: Session, job_id: int, worker_id: str, error: str) -> None:
+    _finish(db, job_id, worker_id, status="failed", error=error)
+
+
+def _finish(
+    db: Session,
+    job_id: int,
+    worker_id: str,
+    *,
+    status: str,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+) -> None:
+    db.execute(
+        update(CollectionJob)
+        .where(CollectionJob.id == job_id, CollectionJob.lease_owner == worker_id)
+        .values(
+            status=status,
+            result=json.dumps(result, ensure_ascii=False) if result is not None else None,
+            error=error,
+            lease_expires_at=None,
+            finished_at=datetime.utcnow(),
+        )
+    )
+    db.commit()
+
+
+# ---------- запуск ----------
+
+
+async def run_job(kind: str, params: Dict[str, Any], progress) -> Dict[str, Any]:
+    """
+    Выполняет задание нужного типа и возвращает результат сбора.
+    """
+    with JOBS_IN_FLIGHT.track_inprogress():
+        return await _run_job(kind, params, progress)
+
+
+async def _run_job(kind: str, params: Dict[str, Any], progress) -> Dict[str, Any]:
+    if kind == "all":
+        return await collect_mirrors_for_all(
+            limit=params.get("limit", 50),
+            progress=progress,
+            merchants=params.get("merchants"),
+        )
+
+    if kind == "batch":
+        return await collect_mirrors_for_batch(
+            items=params["items"],
+            limit=params.get("limit", 10),
+            follow_redirects=params.get("follow_redirects", True),
+            bypass_cache=params.get("bypass_cache", False),
+            progress=progress,
+        )
+
+    raise ValueError(f"unknown job kind: {kind}")
@@ -0,0 +1,73 @@
+# services/metrics.py
+"""
+Метрики Prometheus. API отдаёт их на GET /metrics,
+worker.py — на отдельном порту (WORKER_METRICS_PORT).
+"""
+
+from __future__ import annotations
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Бакеты под сетевые запросы: от десятков миллисекунд до таймаутов
+_NETWORK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+# Запись в БД обычно быстрая, но под блокировкой SQLite бывает и секунды
+_DB_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+SERPER_LATENCY = Histogram(
+    "mirrors_serper_request_seconds",
+    "Время одного HTTP-запроса к Serper.dev (каждая попытка отдельно)",
+    buckets=_NETWORK_BUCKETS,
+)
+
+REDIRECT_RESOLVE_LATENCY = Histogram(
+    "mirrors_redirect_resolve_seconds",
+    "Время резолва одного URL до финального, по уровню (http/browser/cache)",
+    ["tier"],
+    buckets=_NETWORK_BUCKETS,
+)
+
+BROWSER_PHASE_LATENCY = Histogram(
+    "mirrors_browser_phase_seconds",
+    "Время фаз работы со страницей в Playwright: launch, goto, settle, click",
+    ["phase"],
+    buckets=_NETWORK_BUCKETS,
+)
+
+DB_WRITE_LATENCY = Histogram(
+    "mirrors_db_write_seconds",
+    "Время записи зеркал: upsert (выполнение запросов) и commit",
+    ["op"],
+    buckets=_DB_BUCKETS,
+)
+
+CACHE_REQUESTS = Counter(
+    "mirrors_cache_requests_total",
+    "Обращения к кэшам: cache=search|redirect, result=hit|stale|miss",
+    ["cache", "result"],
+)
+
+ERRORS = Counter(
+    "mirrors_errors_total",
+    "Ошибки по этапам и типам исключений",
+    ["stage", "type"],
+)
+
+MIRRORS_WRITTEN = Counter(
+    "mirrors_written_total",
+    "Созданные и обновлённые записи mirrors по мерчантам",
+    ["merchant", "result"],
+)
+
+BROWSER_ACTIVE_PAGES = Gauge(
+    "mirrors_browser_active_pages",
+    "Открытые сейчас страницы в пуле браузеров",
+)
+
+JOBS_IN_FLIGHT = Gauge(
+    "mirrors_jobs_in_flight",
+    "Задания на сбор, которые выполняются прямо сейчас",
+)
+
+
+def count_error(stage: str, exc: BaseException) -> None:
+    ERRORS.labels(stage=stage, type=type(exc).__name__).inc()
@@ -1,67 +1,41 @@
 import asyncio
+import inspect
+import logging
+import time
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from urllib.parse import urlparse
 
 import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from config import get_settings
-from db import SessionLocal
+from db import AsyncSessionLocal
+from merchants_loader import MerchantConfig, get_merchants
 from models import Mirror
 
-settings = get_settings()
-
-
-# ---------- Конфиг одного мерчанта ----------
-
-
-@dataclass
-class MerchantConfig:
-    merchant: str
-    country: str
-    keywords: List[str]
-    brand_pattern: Optional[str] = None
+from .brand_matcher import is_brand_domain
+from .changes import log_upserted_mirrors
+from .history import record_observations
+from .http_clients import get_serper_client, get_target_client
+from .metrics import (
+    DB_WRITE_LATENCY,
+    MIRRORS_WRITTEN,
+    REDIRECT_RESOLVE_LATENCY,
+    SERPER_LATENCY,
+    count_error,
+)
+from .redirect_cache import get_redirect_cache, normalize_url
+from .redirect_probe import probe_redirects
+from .search_cache import get_search_cache
+from .throttle import RETRYABLE_STATUSES, RetryableError, get_host_upstream, get_serper_upstream
+from .tiered_resolver import TieredResolution, resolve_tiered
 
+settings = get_settings()
 
-def get_default_merchants() -> List[MerchantConfig]:
-    """
-    Базовый список мерчантов для collect_mirrors_all_async.
-    Можно потом вынести в отдельный JSON, но пока — жёстко в коде.
-    """
-    return [
-        MerchantConfig(
-            merchant="dafabet",
-            country="in",
-            keywords=["cricket betting", "sports betting"],
-            brand_pattern="dafabet",
-        ),
-        MerchantConfig(
-            merchant="1xbet",
-            country="in",
-            keywords=["cricket betting", "betting"],
-            brand_pattern="1xbet",
-        ),
-        MerchantConfig(
-            merchant="stake",
-            country="in",
-            keywords=["cricket betting", "sports"],
-            brand_pattern="stake",
-        ),
-        MerchantConfig(
-            merchant="1win",
-            country="in",
-            keywords=["cricket betting"],
-            brand_pattern="1win",
-        ),
-        MerchantConfig(
-            merchant="bc game",
-            country="in",
-            keywords=["cricket betting"],
-            brand_pattern="bcgame",
-        ),
-    ]
+logger = logging.getLogger(__name__)
 
 
 # ---------- Serper.dev ----------
@@ -75,10 +49,37 @@ async def serper_search(
     lang: str = "en",
 ) -> List[str]:
     """
-    Возвращает список URL-ов из Serper.dev.
-    При любой ошибке (лимиты, сеть, 4xx/5xx) — просто [].
+    Возвращает список URL-ов из Serper.dev (через кэш выдачи).
+    429/5xx и сетевые ошибки повторяются с backoff (services/throttle.py);
+    если не помогло (или ключ неверный) — пишем в лог и отдаём [].
     """
-    url = "https://google.serper.dev/search"
+    try:
+        return await get_search_cache().get_or_fetch(
+            query=query,
+            num=num,
+            gl=country,
+            hl=lang,
+            fetch=lambda: _serper_fetch(query, num=num, country=country, lang=lang),
+        )
+    except Exception as e:
+        # Повторы уже были — не роняем сбор, но и не молчим
+        count_error("serper", e)
+        logger.warning("serper search failed for %r: %s", query, e)
+        return []
+
+
+async def _serper_fetch(
+    query: str,
+    *,
+    num: int,
+    country: str,
+    lang: str,
+) -> List[str]:
+    """
+    Прямой запрос к Serper.dev без кэша. Ошибки пробрасываются,
+    чтобы кэш не сохранил неудачный ответ как пустую выдачу.
+    """
+    url = settings.SERPER_URL
     headers = {
         "X-API-KEY": settings.SERPER_API_KEY,  # <-- ВАЖНО: используем имя переменной из config.py
         "Content-Type": "application/json",
@@ -90,14 +91,18 @@ async def serper_search(
         "hl": lang,
     }
 
-    try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
+    client = get_serper_client()
+
+    async def request() -> httpx.Response:
+        with SERPER_LATENCY.time():
             resp = await client.post(url, headers=headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-    except Exception:
-        # Если лимит, неверный ключ или сеть — просто ничего не вернём
-        return []
+        if resp.status_code in RETRYABLE_STATUSES:
+            raise RetryableError.from_response(resp, "serper")
+        resp.raise_for_status()
+        return resp
+
+    resp = await get_serper_upstream().call("serper", request)
+    data = resp.json()
 
     links: List[str] = []
     for item in data.get("organic", []):
@@ -112,10 +117,14 @@ async def resolve_final_url(
     url: str,
     *,
     follow_redirects: bool = True,
+    use_cache: bool = True,
 ) -> Tuple[str, str, bool]:
     """
     Возвращает (final_url, final_domain, is_redirector).
     Любая ошибка при запросе → считаем, что final_url = исходный url.
+
+    Успешные резолвы кэшируются (services/redirect_cache.py);
+    use_cache=False — всегда идём в сеть, но результат в кэш всё равно пишем.
     """
     parsed = urlparse(url)
     start_domain = parsed.netloc.lower()
@@ -123,13 +132,51 @@ async def resolve_final_url(
     if not follow_redirects:
         return url, start_domain, False
 
-    try:
-        async with httpx.AsyncClient(timeout=25.0, follow_redirects=True) as client:
-            resp = await client.get(url)
-            final_url = str(resp.url)
-    except Exception:
-        final_url = url
+    cache = get_redirect_cache()
+    cached = await cache.get("http", url) if use_cache else None
+    started = time.perf_counter()
+
+    if cached is not None:
+        final_url = cached.final_url
+    else:
+        try:
+            cacheable = True
+            if settings.REDIRECT_PROBE_ENABLED:
+                # HEAD / stream-GET по шагам: тело страницы не скачиваем
+                probe = await probe_redirects(url)
+                if probe.error is not None and len(probe.hops) <= 1:
+                    # Даже первый запрос не прошёл
+                    raise RuntimeError(probe.error)
+                final_url = probe.final_url
+                chain, statuses = probe.chain, probe.statuses
+                # Цепочка оборвалась на середине — берём, докуда дошли, но не кэшируем
+                cacheable = probe.error is None
+            else:
+                client = get_target_client()
+                resp = await get_host_upstream().call(
+                    start_domain,
+                    lambda: client.get(url, follow_redirects=True),
+                )
+                final_url = str(resp.url)
+                chain = [str(r.url) for r in resp.history] + [final_url]
+                statuses = [r.status_code for r in resp.history] + [resp.status_code]
+
+            if cacheable:
+                await cache.put(
+                    "http",
+                    url,
+                    final_url=final_url,
+                    final_domain=urlparse(final_url).netloc.lower(),
+                    chain=chain,
+                    hop_statuses=statuses,
+                )
+        except Exception as e:
+            count_error("redirect", e)
+            final_url = url
 
+    REDIRECT_RESOLVE_LATENCY.labels(tier="cache" if cached is not None else "http").observe(
+        time.perf_counter() - started
+    )
     final_domain = urlparse(final_url).netloc.lower()
     is_redirector = bool(final_domain) and final_domain != start_domain
 
@@ -137,9 +184,11 @@ async def resolve_final_url(
 
 
 def is_mirror_domain(domain: str, brand_pattern: Optional[str]) -> bool:
-    if not brand_pattern:
-        return False
-    return brand_pattern.lower() in domain.lower()
+    """
+    Похож ли домен на домен бренда: учитывает PSL, IDN, гомоглифы
+    и стоп-слова (services/brand_matcher.py).
+    """
+    return is_brand_domain(domain, brand_pattern)
 
 
 # ---------- Работа с БД ----------
@@ -158,164 +207,554 @@ def upsert_mirror(
     is_redirector: bool,
     is_mirror: bool,
     cta_found: bool = False,
+    resolved_tier: Optional[str] = None,
 ) -> Tuple[bool, bool]:
     """
-    Создаёт или обновляет Mirror.
-    Возвращает (created, updated).
-    Любая ошибка commit → просто rollback и считаем, что ничего не поменялось.
+    Создаёт или обновляет одну строку Mirror по ключу uq_mirror_unique
+    (через bulk_upsert_mirrors). Возвращает (created, updated).
+    Ошибка записи → rollback, (False, False) и запись в лог.
     """
-    now = datetime.utcnow()
+    row = {
+        "merchant": merchant,
+        "country": country,
+        "keyword": keyword,
+        "source_url": source_url,
+        "source_domain": source_domain,
+        "final_url": final_url,
+        "final_domain": final_domain,
+        "is_redirector": is_redirector,
+        "is_mirror": is_mirror,
+        "cta_found": cta_found,
+        "resolved_tier": resolved_tier,
+    }
+    try:
+        return bulk_upsert_mirrors(db, [row]).rows[0]
+    except Exception as e:
+        count_error("db", e)
+        logger.exception("mirror upsert failed: %s", source_url)
+        return False, False
 
-    obj = (
-        db.query(Mirror)
-        .filter(
-            Mirror.merchant == merchant,
-            Mirror.country == country,
-            Mirror.keyword == keyword,
-            Mirror.source_url == source_url,
-        )
-        .first()
-    )
 
-    created = False
-    updated = False
-
-    if obj:
-        obj.final_url = final_url
-        obj.final_domain = final_domain
-        obj.is_redirector = is_redirector
-        obj.is_mirror = is_mirror
-        obj.cta_found = cta_found
-        obj.last_seen_at = now
-        db.add(obj)
-        updated = True
+# Ключ уникальности строки Mirror (см. uq_mirror_unique в models.py)
+MIRROR_KEY_COLUMNS = ("merchant", "country", "keyword", "source_domain", "final_domain")
+
+# Поля, которые обновляются при конфликте по uq_mirror_unique
+_UPSERT_UPDATE_COLUMNS = (
+    "final_url",
+    "is_redirector",
+    "is_mirror",
+    "cta_found",
+    "resolved_tier",
+    "last_seen_at",
+)
+
+# Строк в одном INSERT: держим число bind-параметров ниже лимита SQLite (999)
+_ROWS_PER_STATEMENT = 75
+
+
+@dataclass
+class BulkUpsertResult:
+    created: int
+    updated: int
+    # (created, updated) для каждой входной строки, в исходном порядке
+    rows: List[Tuple[bool, bool]]
+
+
+def _mirror_key(row: Dict[str, Any]) -> Tuple:
+    return tuple(row[col] for col in MIRROR_KEY_COLUMNS)
+
+
+def _upsert_statement(db: Session, values: List[Dict[str, Any]]):
+    """
+    Нативный INSERT ... ON CONFLICT DO UPDATE для SQLite и PostgreSQL.
+    """
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+
+        stmt = insert(Mirror).values(values)
+        conflict = {"constraint": "uq_mirror_unique"}
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+
+        stmt = insert(Mirror).values(values)
+        conflict = {"index_elements": list(MIRROR_KEY_COLUMNS)}
     else:
-        obj = Mirror(
-            merchant=merchant,
-            country=country,
-            keyword=keyword,
-            source_url=source_url,
-            source_domain=source_domain,
-            final_url=final_url,
-            final_domain=final_domain,
-            is_redirector=is_redirector,
-            is_mirror=is_mirror,
-            cta_found=cta_found,
-            first_seen_at=now,
-            last_seen_at=now,
+        raise NotImplementedError(f"bulk upsert не поддерживается для {dialect}")
+
+    stmt = stmt.on_conflict_do_update(
+        **conflict,
+        set_={col: stmt.excluded[col] for col in _UPSERT_UPDATE_COLUMNS},
+    )
+    # first_seen_at == now только у только что вставленных строк
+    return stmt.returning(
+        Mirror.id,
+        *(getattr(Mirror, col) for col in MIRROR_KEY_COLUMNS),
+        Mirror.first_seen_at,
+    )
+
+
+def bulk_upsert_mirrors(
+    db: Session,
+    rows: List[Dict[str, Any]],
+) -> BulkUpsertResult:
+    """
+    Пишет пачку строк (те же поля, что у upsert_mirror) одной транзакцией.
+
+    Дубликаты по uq_mirror_unique внутри пачки схлопываются (побеждает
+    последняя строка), для повторов возвращается (False, False).
+    Все строки попадают в историю наблюдений (services/history.py), а
+    новые строки и смены цели source_url — в журнал mirror_changes,
+    в той же транзакции.
+    При ошибке пачка откатывается и исключение пробрасывается наверх.
+    """
+    now = datetime.utcnow()
+
+    # key -> индекс последней строки с этим ключом
+    latest: Dict[Tuple, int] = {}
+    for i, row in enumerate(rows):
+        latest[_mirror_key(row)] = i
+
+    values = []
+    for key, i in latest.items():
+        row = rows[i]
+        values.append(
+            {
+                "merchant": row["merchant"],
+                "country": row["country"],
+                "keyword": row["keyword"],
+                "source_url": row["source_url"],
+                "source_domain": row["source_domain"],
+                "final_url": row["final_url"],
+                "final_domain": row["final_domain"],
+                "is_redirector": row["is_redirector"],
+                "is_mirror": row["is_mirror"],
+                "cta_found": row.get("cta_found", False),
+                "resolved_tier": row.get("resolved_tier"),
+                "first_seen_at": now,
+                "last_seen_at": now,
+            }
         )
-        db.add(obj)
-        created = True
 
+    by_key = {_mirror_key(v): v for v in values}
+    created_keys = set()
+    upserted: List[Tuple[int, Dict[str, Any], bool]] = []
     try:
-        db.commit()
+        with DB_WRITE_LATENCY.labels(op="upsert").time():
+            for start in range(0, len(values), _ROWS_PER_STATEMENT):
+                chunk = values[start:start + _ROWS_PER_STATEMENT]
+                for returned in db.execute(_upsert_statement(db, chunk)):
+                    mirror_id, *key, first_seen_at = returned
+                    created = first_seen_at == now
+                    if created:
+                        created_keys.add(tuple(key))
+                    upserted.append((mirror_id, by_key[tuple(key)], created))
+            # Все строки, а не только схлопнутые: в истории ключ — source_url
+            redirected = record_observations(db, rows, seen_at=now)
+            log_upserted_mirrors(db, upserted, redirected=redirected, changed_at=now)
+        with DB_WRITE_LATENCY.labels(op="commit").time():
+            db.commit()
     except Exception:
         db.rollback()
-        # Если уникальный индекс или другая ошибка — просто считаем, что ничего не изменили
-        created = False
-        updated = False
+        raise
+
+    flags: List[Tuple[bool, bool]] = []
+    for i, row in enumerate(rows):
+        key = _mirror_key(row)
+        if latest[key] != i:
+            flags.append((False, False))
+        elif key in created_keys:
+            flags.append((True, False))
+        else:
+            flags.append((False, True))
 
-    return created, updated
+    return BulkUpsertResult(
+        created=sum(c for c, _ in flags),
+        updated=sum(u for _, u in flags),
+        rows=flags,
+    )
+
+
+class MirrorWriter:
+    """
+    Единственный потребитель, который пишет в БД.
+
+    Конвейер сбора кладёт строки в очередь (submit), а этот объект в одной
+    фоновой задаче копит их в пачки и пишет через bulk_upsert_mirrors —
+    одна транзакция (и один fsync) на пачку, а не на строку.
+    Результат по строке — (created, updated) — приходит через future.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+    ) -> None:
+        self.batch_size = max(1, batch_size or settings.DB_WRITE_BATCH_SIZE)
+        self.flush_interval = (
+            settings.DB_WRITE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        )
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "MirrorWriter":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._queue.put(None)
+        if self._task is not None:
+            await self._task
+
+    def submit(self, **row) -> "asyncio.Future[Tuple[bool, bool]]":
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, fut))
+        return fut
+
+    async def write(self, **row) -> Tuple[bool, bool]:
+        return await self.submit(**row)
+
+    async def _next_batch(self) -> Tuple[List[Tuple[Dict[str, Any], asyncio.Future]], bool]:
+        """
+        Ждёт первую строку, затем добирает пачку до batch_size
+        или до истечения flush_interval. Возвращает (batch, stop).
+        """
+        item = await self._queue.get()
+        if item is None:
+            return [], True
+
+        batch = [item]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    async def _run(self) -> None:
+        async with AsyncSessionLocal() as db:
+            stop = False
+            while not stop:
+                batch, stop = await self._next_batch()
+                if batch:
+                    await self._flush(db, batch)
+
+    async def _upsert(self, db: AsyncSession, rows: List[Dict[str, Any]]) -> List[Tuple[bool, bool]]:
+        # Синхронный bulk_upsert_mirrors поверх async-драйвера:
+        # ожидание БД отдаёт управление loop-у, а не блокирует его
+        result = await db.run_sync(bulk_upsert_mirrors, rows)
+        return result.rows
+
+    async def _flush(self, db: AsyncSession, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        rows = [row for row, _ in batch]
+        try:
+            flags = await self._upsert(db, rows)
+        except Exception:
+            logger.exception("bulk upsert of %d mirrors failed, retrying row by row", len(rows))
+            flags = []
+            for row in rows:
+                # Плохая строка не должна тянуть за собой всю пачку
+                try:
+                    flags.append((await self._upsert(db, [row]))[0])
+                except Exception as e:
+                    count_error("db", e)
+                    logger.exception("mirror upsert failed: %s", row.get("source_url"))
+                    flags.append((False, False))
+
+        for (_, fut), result in zip(batch, flags):
+            if not fut.done():
+                fut.set_result(result)
 
 
 # ---------- Основная логика сбора ----------
 
 
+@dataclass
+class _CollectorPools:
+    """
+    Общие на один запуск лимиты параллельности:
+    отдельно для поисковых запросов и для резолва редиректов.
+    """
+
+    search: asyncio.Semaphore
+    resolve: asyncio.Semaphore
+
+    @classmethod
+    def from_settings(cls) -> "_CollectorPools":
+        return cls(
+            search=asyncio.Semaphore(max(1, settings.SEARCH_CONCURRENCY)),
+            resolve=asyncio.Semaphore(max(1, settings.REDIRECT_CONCURRENCY)),
+        )
+
+
 async def _collect_for_config(
     cfg: MerchantConfig,
     *,
     limit: int,
     follow_redirects: bool,
+    writer: MirrorWriter,
+    pools: _CollectorPools,
+    bypass_cache: bool = False,
 ) -> Tuple[int, int]:
     """
     Сбор зеркал для одного мерчанта (для всех его keywords).
     Любая ошибка в процессе — не роняет весь процесс, просто даёт меньше результатов.
+
+    Поиск по keywords и резолв URL идут параллельно (в пределах pools),
+    а строки отдаются writer-у строго в исходном порядке
+    (keyword → позиция в выдаче), поэтому limit режет тот же набор URL,
+    что и при последовательном обходе.
+
+    Дубликаты отсекаются до резолва по нормализованному URL
+    (redirect_cache.normalize_url: без utm_*, click-id, фрагмента):
+    в выдаче keyword повтор URL пропускается и не тратит limit, а
+    резолвится каждый URL один раз на весь мерчант — остальные keywords
+    берут его результат. Разные URL одного домена резолвятся отдельно:
+    редиректор может вести их в разные места, и в истории
+    (services/history.py) это разные строки.
+
+    limit считается по ключам uq_mirror_unique, а не по строкам: URL
+    с той же парой (source_domain, final_domain) в keyword writer всё равно
+    получает (для истории), но bulk upsert сольёт его с первым, и места
+    в limit он не занимает.
+
+    >>> from unittest import mock
+    >>> async def search(query, **kwargs):
+    ...     return ["https://aff.com/a", "https://aff.com/b", "https://aff.com/c"]
+    >>> async def resolve(url, **kwargs):
+    ...     final = {"a": "stake.com", "b": "stake.com", "c": "other.com"}[url[-1]]
+    ...     return TieredResolution(start_url=url, final_url=f"https://{final}/",
+    ...                             final_domain=final, tier="http")
+    >>> class Writer:
+    ...     rows = []
+    ...     def submit(self, **row):
+    ...         self.rows.append((row["source_url"], row["final_domain"]))
+    ...         fut = asyncio.get_running_loop().create_future()
+    ...         fut.set_result((True, False))
+    ...         return fut
+    >>> async def collect():
+    ...     with mock.patch.multiple(__name__, serper_search=search, resolve_tiered=resolve):
+    ...         await _collect_for_config(
+    ...             MerchantConfig(merchant="stake", country="in", keywords=["casino"]),
+    ...             limit=2, follow_redirects=True, writer=Writer(),
+    ...             pools=_CollectorPools.from_settings())
+    >>> asyncio.run(collect())
+    >>> Writer.rows
+    [('https://aff.com/a', 'stake.com'), ('https://aff.com/b', 'stake.com'), ('https://aff.com/c', 'other.com')]
     """
     created_total = 0
     updated_total = 0
 
     per_keyword_limit = max(1, limit // max(1, len(cfg.keywords)))
 
-    db: Session = SessionLocal()
-    try:
-        for kw in cfg.keywords:
-            if created_total + updated_total >= limit:
-                break
+    pending: List[asyncio.Task] = []
 
-            query = f"{cfg.merchant} {kw}"
+    # нормализованный URL -> задача его резолва
+    resolutions: Dict[str, asyncio.Task] = {}
 
-            urls: List[str]
+    async def search(kw: str) -> List[str]:
+        query = cfg.queries.get(kw) or f"{cfg.merchant} {kw}"
+        async with pools.search:
             try:
-                urls = await serper_search(
+                return await serper_search(
                     query,
                     num=per_keyword_limit,
                     country=cfg.country,
                     lang="en",
                 )
             except Exception:
-                urls = []
+                return []
 
-            for url in urls:
-                if created_total + updated_total >= limit:
-                    break
+    async def resolve(url: str, source_domain: str) -> TieredResolution:
+        if not follow_redirects:
+            return TieredResolution(start_url=url, final_url=url, final_domain=source_domain)
 
-                source_domain = urlparse(url).netloc.lower()
+        async with pools.resolve:
+            started = time.perf_counter()
+            try:
+                # httpx, а браузер — только если страница этого требует
+                resolved = await resolve_tiered(
+                    url,
+                    use_cache=not bypass_cache,
+                    country=cfg.country,
+                )
+            except Exception as e:
+                count_error("resolve", e)
+                return TieredResolution(start_url=url, final_url=url, final_domain=source_domain)
+            tier = "cache" if resolved.from_cache else resolved.tier or "none"
+            REDIRECT_RESOLVE_LATENCY.labels(tier=tier).observe(
+                time.perf_counter() - started
+            )
+            return resolved
+
+    async def candidates(kw: str) -> List[Tuple[str, str, asyncio.Task]]:
+        urls = await search(kw)
+        result = []
+        seen: Set[str] = set()
+        for url in urls:
+            key = normalize_url(url)
+            if key in seen:
+                continue
+            seen.add(key)
+
+            source_domain = urlparse(url).netloc.lower()
+            task = resolutions.get(key)
+            if task is None:
+                task = asyncio.create_task(resolve(url, source_domain))
+                resolutions[key] = task
+                pending.append(task)
+            result.append((url, source_domain, task))
+        return result
+
+    keyword_tasks = [(kw, asyncio.create_task(candidates(kw))) for kw in cfg.keywords]
+    pending.extend(task for _, task in keyword_tasks)
+
+    # Строки уходят writer-у без ожидания, поэтому limit считаем по
+    # отправленным ключам uq_mirror_unique: строки с одним ключом
+    # bulk upsert схлопывает в одну запись.
+    submitted: List[asyncio.Future] = []
+    mirror_keys: Set[Tuple[str, str, str]] = set()
 
-                try:
-                    final_url, final_domain, is_redirector = await resolve_final_url(
-                        url, follow_redirects=follow_redirects
-                    )
-                except Exception:
-                    final_url = url
-                    final_domain = source_domain
-                    is_redirector = False
+    try:
+        for kw, keyword_task in keyword_tasks:
+            if len(mirror_keys) >= limit:
+                break
 
-                mirror_flag = is_mirror_domain(final_domain, cfg.brand_pattern)
+            for url, source_domain, resolve_task in await keyword_task:
+                if len(mirror_keys) >= limit:
+                    break
 
-                created, updated = upsert_mirror(
-                    db,
-                    merchant=cfg.merchant,
-                    country=cfg.country,
-                    keyword=kw,
-                    source_url=url,
-                    source_domain=source_domain,
-                    final_url=final_url,
-                    final_domain=final_domain,
-                    is_redirector=is_redirector,
-                    is_mirror=mirror_flag,
-                    cta_found=False,
+                resolved = await resolve_task
+                mirror_keys.add((kw, source_domain, resolved.final_domain))
+
+                mirror_flag = is_mirror_domain(resolved.final_domain, cfg.brand_pattern)
+
+                submitted.append(
+                    writer.submit(
+                        merchant=cfg.merchant,
+                        country=cfg.country,
+                        keyword=kw,
+                        source_url=url,
+                        source_domain=source_domain,
+                        final_url=resolved.final_url,
+                        final_domain=resolved.final_domain,
+                        is_redirector=resolved.is_redirector,
+                        is_mirror=mirror_flag,
+                        cta_found=resolved.cta_found,
+                        resolved_tier=resolved.tier,
+                    )
                 )
-                created_total += int(created)
-                updated_total += int(updated)
 
     finally:
-        db.close()
+        # Лимит набран (или ошибка) — лишние поиски/резолвы больше не нужны
+        for task in pending:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    for created, updated in await asyncio.gather(*submitted):
+        created_total += int(created)
+        updated_total += int(updated)
+
+    MIRRORS_WRITTEN.labels(merchant=cfg.merchant, result="created").inc(created_total)
+    MIRRORS_WRITTEN.labels(merchant=cfg.merchant, result="updated").inc(updated_total)
 
     return created_total, updated_total
 
 
-async def collect_mirrors_for_all(limit: int = 50) -> dict:
+# Может быть корутиной: тогда её дожидаются (запись прогресса в БД)
+ProgressCallback = Callable[[Dict[str, int]], Optional[Awaitable[None]]]
+
+
+async def _collect_configs(
+    configs: List[MerchantConfig],
+    *,
+    limit: int,
+    follow_redirects: bool,
+    bypass_cache: bool = False,
+    progress: Optional[ProgressCallback] = None,
+) -> Tuple[int, int]:
     """
-    Массовый сбор по всем дефолтным мерчантам.
-    Ошибки по отдельному мерчанту не роняют весь процесс.
+    Параллельный сбор по списку мерчантов с общими пулами и одним writer-ом.
+    Ошибка по отдельному мерчанту не роняет остальных.
+
+    progress (если передан) вызывается после каждого мерчанта со словарём
+    {merchants_total, merchants_done, created, updated}. Его ошибка
+    только пишется в лог: сбор из-за неё не прерывается.
     """
-    configs = get_default_merchants()
+    pools = _CollectorPools.from_settings()
 
-    total_created = 0
-    total_updated = 0
+    state = {
+        "merchants_total": len(configs),
+        "merchants_done": 0,
+        "created": 0,
+        "updated": 0,
+    }
 
-    for cfg in configs:
+    async def run_one(cfg: MerchantConfig, writer: MirrorWriter) -> Tuple[int, int]:
         try:
             c, u = await _collect_for_config(
                 cfg,
                 limit=limit,
-                follow_redirects=False,  # для массового сбора без тяжёлых редиректов
+                follow_redirects=follow_redirects,
+                writer=writer,
+                pools=pools,
+                bypass_cache=bypass_cache,
             )
-            total_created += c
-            total_updated += u
         except Exception:
             # если с конкретным мерчантом всё плохо — просто пропускаем
-            continue
+            c, u = 0, 0
+
+        state["merchants_done"] += 1
+        state["created"] += c
+        state["updated"] += u
+        if progress is not None:
+            try:
+                outcome = progress(dict(state))
+                if inspect.isawaitable(outcome):
+                    await outcome
+            except Exception:
+                logger.exception("progress callback failed")
+        return c, u
+
+    async with MirrorWriter() as writer:
+        await asyncio.gather(*(run_one(cfg, writer) for cfg in configs))
+
+    return state["created"], state["updated"]
+
+
+async def collect_mirrors_for_all(
+    limit: int = 50,
+    progress: Optional[ProgressCallback] = None,
+    merchants: Optional[List[str]] = None,
+) -> dict:
+    """
+    Массовый сбор по мерчантам из merchants_config.json.
+    merchants — только эти мерчанты (по имени, без учёта регистра),
+    None — все. Ошибки по отдельному мерчанту не роняют весь процесс.
+    Редиректы здесь не резолвятся, поэтому и кэш редиректов не нужен.
+    """
+    compiled = get_merchants()
+    configs = compiled.select(merchants)
+
+    total_created, total_updated = await _collect_configs(
+        configs,
+        limit=limit,
+        follow_redirects=False,  # для массового сбора без тяжёлых редиректов
+        progress=progress,
+    )
 
     return {
         "status": "ok",
@@ -323,6 +762,7 @@ async def collect_mirrors_for_all(limit: int = 50) -> dict:
         "created": total_created,
         "updated": total_updated,
         "merchants_count": len(configs),
+        "unknown_merchants": compiled.unknown(merchants),
         "limit": limit,
     }
 
@@ -332,6 +772,8 @@ async def collect_mirrors_for_batch(
     items: List,
     limit: int = 10,
     follow_redirects: bool = True,
+    bypass_cache: bool = False,
+    progress: Optional[ProgressCallback] = None,
 ) -> dict:
     """
     Сбор по конкретным мерчантам (как для /collect_mirrors_batch).
@@ -355,21 +797,13 @@ async def collect_mirrors_for_batch(
             )
         )
 
-    total_created = 0
-    total_updated = 0
-
-    for cfg in configs:
-        try:
-            c, u = await _collect_for_config(
-                cfg,
-                limit=limit,
-                follow_redirects=follow_redirects,
-            )
-            total_created += c
-            total_updated += u
-        except Exception:
-            # если с этим мерчантом что-то пошло не так — просто пропускаем
-            continue
+    total_created, total_updated = await _collect_configs(
+        configs,
+        limit=limit,
+        follow_redirects=follow_redirects,
+        bypass_cache=bypass_cache,
+        progress=progress,
+    )
 
     return {
         "status": "ok",
@@ -0,0 +1,105 @@
+# services/mirrors_export.py
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+from db import read_engine
+from models import Mirror
+
+# Колонки выгрузки (в этом порядке идут в CSV)
+EXPORT_COLUMNS = [
+    Mirror.id,
+    Mirror.merchant,
+    Mirror.country,
+    Mirror.keyword,
+    Mirror.source_url,
+    Mirror.source_domain,
+    Mirror.final_url,
+    Mirror.final_domain,
+    Mirror.is_redirector,
+    Mirror.is_mirror,
+    Mirror.cta_found,
+    Mirror.resolved_tier,
+    Mirror.first_seen_at,
+    Mirror.last_seen_at,
+]
+
+EXPORT_FIELDS = [col.key for col in EXPORT_COLUMNS]
+
+# Сколько строк тянем из курсора за раз и отдаём одним куском ответа
+_CHUNK_ROWS = 1000
+
+
+def _export_query(
+    *,
+    country: Optional[str],
+    merchant: Optional[str],
+    since: Optional[datetime],
+):
+    stmt = select(*EXPORT_COLUMNS)
+
+    if country:
+        stmt = stmt.where(Mirror.country == country)
+    if merchant:
+        stmt = stmt.where(Mirror.merchant == merchant)
+    if since:
+        stmt = stmt.where(Mirror.last_seen_at >= since)
+
+    return stmt.order_by(Mirror.id.asc())
+
+
+def _iter_row_chunks(**filters) -> Iterator[list]:
+    """
+    Читает строки через серверный курсор (stream_results) кусками
+    по _CHUNK_ROWS — ORM-объекты не создаются, память постоянная.
+    Своё соединение: генератор живёт дольше, чем запрос-сессия.
+    """
+    with read_engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True,
+            yield_per=_CHUNK_ROWS,
+        ).execute(_export_query(**filters))
+
+        for chunk in result.partitions():
+            yield chunk
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_mirrors_ndjson(**filters) -> Iterator[str]:
+    for chunk in _iter_row_chunks(**filters):
+        yield "".join(
+            json.dumps(
+                {field: _plain(value) for field, value in zip(EXPORT_FIELDS, row)},
+                ensure_ascii=False,
+            )
+            + "\n"
+            for row in chunk
+        )
+
+
+def iter_mirrors_csv(**filters) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    writer.writerow(EXPORT_FIELDS)
+    for chunk in _iter_row_chunks(**filters):
+        writer.writerows([_plain(value) for value in row] for row in chunk)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+    # Пустая выгрузка — всё равно отдаём заголовок
+    if buf.getvalue():
+        yield buf.getvalue()
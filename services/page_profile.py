@@ -0,0 +1,128 @@
+# services/page_profile.py
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import FrozenSet, Optional
+from urllib.parse import urlparse
+
+from playwright.async_api import Page, Route
+
+from config import get_settings
+
+settings = get_settings()
+
+# Типы ресурсов, которые не влияют на редиректы и кнопки
+HEAVY_RESOURCE_TYPES = frozenset({"image", "media", "font"})
+
+# Аналитика, реклама, чаты — на лендингах казино их десятки
+TRACKER_DOMAINS = frozenset(
+    {
+        "google-analytics.com",
+        "googletagmanager.com",
+        "doubleclick.net",
+        "googlesyndication.com",
+        "googleadservices.com",
+        "facebook.net",
+        "connect.facebook.net",
+        "hotjar.com",
+        "mc.yandex.ru",
+        "yandex.ru",
+        "clarity.ms",
+        "segment.io",
+        "mixpanel.com",
+        "amplitude.com",
+        "tiktok.com",
+        "analytics.tiktok.com",
+        "criteo.com",
+        "adnxs.com",
+        "taboola.com",
+        "outbrain.com",
+        "onesignal.com",
+        "livechatinc.com",
+        "intercom.io",
+        "zendesk.com",
+        "jivosite.com",
+    }
+)
+
+
+@dataclass(frozen=True)
+class PageProfile:
+    """
+    Как грузить страницу в резолвере.
+
+    blocked_types   — resource_type запросов, которые обрываем;
+    blocked_domains — домены (и их поддомены), которые обрываем;
+    wait_until      — событие для page.goto;
+    settle_ms       — после goto ждём, пока главный фрейм не перестанет
+                      переходить settle_ms миллисекунд (0 — не ждём).
+    """
+
+    name: str
+    blocked_types: FrozenSet[str] = field(default_factory=frozenset)
+    blocked_domains: FrozenSet[str] = field(default_factory=frozenset)
+    wait_until: str = "domcontentloaded"
+    settle_ms: int = 0
+
+    @property
+    def intercepts(self) -> bool:
+        return bool(self.blocked_types or self.blocked_domains)
+
+    def is_blocked(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.blocked_types:
+            return True
+
+        host = (urlparse(url).hostname or "").lower()
+        while host:
+            if host in self.blocked_domains:
+                return True
+            _, _, host = host.partition(".")
+        return False
+
+
+# Как было раньше: всё грузим, ждём networkidle
+FULL_PROFILE = PageProfile(name="full", wait_until="networkidle")
+
+
+def light_profile(block_stylesheets: bool = False, settle_ms: int = 1500) -> PageProfile:
+    blocked = set(HEAVY_RESOURCE_TYPES)
+    if block_stylesheets:
+        blocked.add("stylesheet")
+    return PageProfile(
+        name="light",
+        blocked_types=frozenset(blocked),
+        blocked_domains=TRACKER_DOMAINS,
+        wait_until="domcontentloaded",
+        settle_ms=settle_ms,
+    )
+
+
+def get_default_profile() -> PageProfile:
+    if settings.BROWSER_PROFILE == "full":
+        return FULL_PROFILE
+    return light_profile(
+        block_stylesheets=settings.BROWSER_BLOCK_STYLESHEETS,
+        settle_ms=settings.BROWSER_SETTLE_MS,
+    )
+
+
+async def apply_profile(page: Page, profile: Optional[PageProfile] = None) -> None:
+    """
+    Вешает на страницу перехват запросов по профилю.
+    """
+    profile = profile or get_default_profile()
+    if not profile.intercepts:
+        return
+
+    async def handle(route: Route) -> None:
+        request = route.request
+        # Документы не трогаем никогда — иначе сломаем сами редиректы
+        if request.resource_type != "document" and profile.is_blocked(
+            request.resource_type, request.url
+        ):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await page.route("**/*", handle)
@@ -0,0 +1,218 @@
+# services/redirect_cache.py
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from config import get_settings
+from db import AsyncReadSessionLocal, AsyncSessionLocal
+from models import RedirectCacheEntry, RedirectDomainStability
+
+from .metrics import CACHE_REQUESTS
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# Параметры, которые не влияют на то, куда ведёт редиректор
+_TRACKING_PARAMS = {"gclid", "fbclid", "yclid", "msclkid"}
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Приводит URL к каноническому виду для ключа кэша:
+    нижний регистр схемы/хоста, без порта по умолчанию и фрагмента,
+    отсортированные query-параметры без utm_* и click-id.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+
+    port = parts.port
+    if port and _DEFAULT_PORTS.get(scheme) != port:
+        host = f"{host}:{port}"
+
+    path = parts.path or "/"
+
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    )
+
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def _source_host(url: str) -> str:
+    return urlsplit(normalize_url(url)).netloc
+
+
+@dataclass
+class CachedRedirect:
+    final_url: str
+    final_domain: str
+    chain: List[str]
+    hop_statuses: Optional[List[int]] = None
+    cta_text: Optional[str] = None
+
+
+@dataclass
+class RedirectCacheStats:
+    hits: int = 0
+    misses: int = 0
+    changes: int = 0
+
+
+class RedirectCache:
+    """
+    Кэш «исходный URL → финальный URL + цепочка редиректов».
+
+    TTL адаптивный и считается по хосту источника (redirect_domain_stability):
+    каждая проверка URL этого хоста, на которой домен цели не поменялся,
+    удваивает срок жизни (от base_ttl до max_ttl), и новый URL того же
+    хоста сразу получает накопленный TTL. Если цель поменялась — счётчик
+    хоста сбрасывается и запись живёт только min_ttl, т.е. «прыгающие»
+    редиректоры перепроверяются чаще.
+    """
+
+    def __init__(
+        self,
+        *,
+        min_ttl: int,
+        base_ttl: int,
+        max_ttl: int,
+        enabled: bool = True,
+    ) -> None:
+        self.min_ttl = timedelta(seconds=min_ttl)
+        self.base_ttl = timedelta(seconds=base_ttl)
+        self.max_ttl = timedelta(seconds=max_ttl)
+        self.enabled = enabled
+        self.stats = RedirectCacheStats()
+
+    @staticmethod
+    def make_key(kind: str, url: str) -> str:
+        raw = f"{kind}:{normalize_url(url)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, kind: str, url: str) -> Optional[CachedRedirect]:
+        if not self.enabled:
+            return None
+
+        try:
+            async with AsyncReadSessionLocal() as db:
+                entry = await db.get(RedirectCacheEntry, self.make_key(kind, url))
+        except Exception:
+            logger.warning("redirect cache read failed", exc_info=True)
+            entry = None
+
+        if entry is None or entry.expires_at <= datetime.utcnow():
+            self.stats.misses += 1
+            CACHE_REQUESTS.labels(cache="redirect", result="miss").inc()
+            return None
+
+        self.stats.hits += 1
+        CACHE_REQUESTS.labels(cache="redirect", result="hit").inc()
+        return CachedRedirect(
+            final_url=entry.final_url,
+            final_domain=entry.final_domain or "",
+            chain=json.loads(entry.chain),
+            hop_statuses=json.loads(entry.hop_statuses) if entry.hop_statuses else None,
+            cta_text=entry.cta_text,
+        )
+
+    async def put(
+        self,
+        kind: str,
+        url: str,
+        *,
+        final_url: str,
+        final_domain: str,
+        chain: List[str],
+        hop_statuses: Optional[List[int]] = None,
+        cta_text: Optional[str] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+
+        now = datetime.utcnow()
+        key = self.make_key(kind, url)
+
+        db = AsyncSessionLocal()
+        try:
+            entry = await db.get(RedirectCacheEntry, key)
+            domain = await db.get(RedirectDomainStability, (kind, _source_host(url)))
+            if domain is None:
+                domain = RedirectDomainStability(
+                    kind=kind,
+                    domain=_source_host(url),
+                    stable_checks=0,
+                    changed_at=now,
+                )
+                db.add(domain)
+
+            if entry is None:
+                entry = RedirectCacheEntry(
+                    key=key,
+                    kind=kind,
+                    source_url=url,
+                    stable_checks=0,
+                    changed_at=now,
+                )
+                db.add(entry)
+                # Новый URL: о нём ничего не известно, но хост уже мог себя показать
+                ttl = self._stable_ttl(domain.stable_checks)
+            elif entry.final_domain == final_domain:
+                entry.stable_checks += 1
+                domain.stable_checks += 1
+                ttl = self._stable_ttl(domain.stable_checks)
+            else:
+                entry.stable_checks = 0
+                entry.changed_at = now
+                domain.stable_checks = 0
+                domain.changed_at = now
+                self.stats.changes += 1
+                ttl = self.min_ttl
+
+            domain.checked_at = now
+            entry.final_url = final_url
+            entry.final_domain = final_domain
+            entry.chain = json.dumps(chain, ensure_ascii=False)
+            entry.hop_statuses = json.dumps(hop_statuses) if hop_statuses is not None else None
+            entry.cta_text = cta_text
+            entry.checked_at = now
+            entry.expires_at = now + ttl
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.warning("redirect cache write failed", exc_info=True)
+        finally:
+            await db.close()
+
+    def _stable_ttl(self, stable_checks: int) -> timedelta:
+        return min(self.max_ttl, self.base_ttl * 2 ** min(stable_checks, 16))
+
+    def snapshot(self) -> dict:
+        return asdict(self.stats)
+
+
+_cache: Optional[RedirectCache] = None
+
+
+def get_redirect_cache() -> RedirectCache:
+    global _cache
+    if _cache is None:
+        _cache = RedirectCache(
+            min_ttl=settings.REDIRECT_CACHE_MIN_TTL,
+            base_ttl=settings.REDIRECT_CACHE_BASE_TTL,
+            max_ttl=settings.REDIRECT_CACHE_MAX_TTL,
+            enabled=settings.REDIRECT_CACHE_ENABLED,
+        )
+    return _cache
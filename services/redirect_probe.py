@@ -0,0 +1,147 @@
+# services/redirect_probe.py
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import httpx
+
+from config import get_settings
+
+from .http_clients import get_target_client
+from .throttle import CircuitOpenError, RetryableError, get_host_upstream
+
+settings = get_settings()
+
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+# Дальше этих схем не ходим: tg:, intent:, market:, javascript: — конец цепочки
+_FETCHABLE_SCHEMES = {"http", "https"}
+
+# На эти ответы HEAD не верим и переспрашиваем GET-ом
+# (многие сайты не умеют HEAD или отвечают на него иначе)
+_HEAD_UNRELIABLE = {400, 403, 404, 405, 406, 429, 500, 501, 502, 503}
+
+# Если и GET ответил так — хост перегружен или нас притормозили: ждём и повторяем
+_RETRY_STATUSES = {429, 502, 503, 504}
+
+
+@dataclass
+class RedirectHop:
+    url: str
+    status: Optional[int]
+    method: Optional[str]  # "HEAD", "GET" или None — не запрашивался (не http(s))
+
+
+@dataclass
+class RedirectProbe:
+    start_url: str
+    final_url: str
+    hops: List[RedirectHop] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def chain(self) -> List[str]:
+        return [hop.url for hop in self.hops] or [self.start_url]
+
+    @property
+    def statuses(self) -> List[Optional[int]]:
+        return [hop.status for hop in self.hops]
+
+    @property
+    def leaves_web(self) -> bool:
+        """Цепочка ушла на не-http(s) адрес: страницы, которую можно открыть, нет."""
+        return urlparse(self.final_url).scheme.lower() not in _FETCHABLE_SCHEMES
+
+
+async def _head(client: httpx.AsyncClient, url: str) -> httpx.Response:
+    return await client.head(url, follow_redirects=False)
+
+
+async def _streamed_get(client: httpx.AsyncClient, url: str) -> httpx.Response:
+    """
+    GET без чтения тела: нужны только статус и заголовки.
+    Выход из stream() закрывает соединение, не скачивая страницу.
+    """
+    async with client.stream("GET", url, follow_redirects=False) as resp:
+        return resp
+
+
+async def _hop(client: httpx.AsyncClient, url: str) -> Tuple[httpx.Response, str]:
+    """Один переход: HEAD, при неудаче — stream-GET."""
+    try:
+        resp = await _head(client, url)
+    except httpx.HTTPError:
+        resp = None
+
+    if resp is not None and resp.status_code not in _HEAD_UNRELIABLE:
+        return resp, "HEAD"
+
+    resp = await _streamed_get(client, url)
+    if resp.status_code in _RETRY_STATUSES:
+        raise RetryableError.from_response(resp, url)
+    return resp, "GET"
+
+
+async def probe_redirects(url: str, *, max_hops: Optional[int] = None) -> RedirectProbe:
+    """
+    Проходит цепочку редиректов вручную, по одному переходу:
+    сначала HEAD, при неудаче — GET в режиме stream, который закрывается
+    до чтения тела. Тяжёлые лендинги так не скачиваются целиком.
+
+    Возвращает финальный URL и все переходы со статусами.
+    Сетевая ошибка не бросается: probe.error заполнен, final_url —
+    последний URL, до которого удалось дойти.
+    Редирект на не-http(s) адрес (tg:, intent:, market:, ...) не
+    запрашивается: он и есть final_url, без ошибки.
+    """
+    max_hops = max_hops or settings.REDIRECT_MAX_HOPS
+    client = get_target_client()
+    hosts = get_host_upstream()
+
+    probe = RedirectProbe(start_url=url, final_url=url)
+    current = url
+    seen = set()
+
+    for _ in range(max_hops + 1):
+        if current in seen:
+            probe.error = "redirect loop"
+            break
+        seen.add(current)
+
+        # Лимит на хост, повторы на 429/5xx и сетевых ошибках (services/throttle.py)
+        host = urlparse(current).netloc.lower()
+        try:
+            resp, method = await hosts.call(host, lambda: _hop(client, current))
+        except RetryableError as e:
+            # Попытки кончились — записываем последний ответ как есть
+            resp, method = e.response, "GET"
+            if resp is None:
+                probe.hops.append(RedirectHop(url=current, status=None, method=method))
+                probe.final_url = current
+                probe.error = str(e)
+                break
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            probe.hops.append(RedirectHop(url=current, status=None, method="GET"))
+            probe.final_url = current
+            probe.error = f"{type(e).__name__}: {e}"
+            break
+
+        probe.hops.append(RedirectHop(url=current, status=resp.status_code, method=method))
+        probe.final_url = current
+
+        location = resp.headers.get("location")
+        if resp.status_code not in _REDIRECT_STATUSES or not location:
+            break
+
+        current = urljoin(current, location)
+        if urlparse(current).scheme.lower() not in _FETCHABLE_SCHEMES:
+            probe.hops.append(RedirectHop(url=current, status=None, method=None))
+            probe.final_url = current
+            break
+    else:
+        probe.error = "too many redirects"
+
+    return probe
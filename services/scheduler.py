@@ -0,0 +1,278 @@
+# services/scheduler.py
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from merchants_loader import get_merchants
+from models import CollectionJob, CrawlSchedule, Mirror, MirrorChange
+
+from .jobs import enqueue_job
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+TaskKey = Tuple[str, str, str]  # (merchant, country, keyword)
+
+# Оценка для задач, которые ещё ни разу не собирались, — идут первыми
+_NEVER_CRAWLED_SCORE = 1000.0
+
+
+@dataclass
+class RecrawlTask:
+    merchant: str
+    country: str
+    keyword: str
+    brand_pattern: Optional[str]
+    priority: float
+    # Последний раз, когда задачу видели/запускали (None — никогда)
+    last_seen_at: Optional[datetime]
+    last_dispatched_at: Optional[datetime]
+    # Сколько раз за SCHEDULER_CHURN_WINDOW у редиректоров менялся final_domain
+    churn: int
+    interval: timedelta
+    # staleness / interval: >= 1 — пора перепроверять
+    score: float
+
+    @property
+    def key(self) -> TaskKey:
+        return (self.merchant, self.country, self.keyword)
+
+    @property
+    def is_due(self) -> bool:
+        return self.score >= 1.0
+
+    def to_dict(self) -> dict:
+        return {
+            "merchant": self.merchant,
+            "country": self.country,
+            "keyword": self.keyword,
+            "priority": self.priority,
+            "last_seen_at": self.last_seen_at,
+            "last_dispatched_at": self.last_dispatched_at,
+            "churn": self.churn,
+            "interval_seconds": int(self.interval.total_seconds()),
+            "score": round(self.score, 3),
+        }
+
+
+def target_interval(priority: float, churn: int) -> timedelta:
+    """
+    Как часто перепроверять задачу: базовый интервал делится на вес
+    мерчанта и на (1 + число смен домена за окно), в пределах
+    [SCHEDULER_MIN_INTERVAL, SCHEDULER_MAX_INTERVAL].
+    """
+    seconds = settings.SCHEDULER_BASE_INTERVAL / (max(priority, 0.01) * (1 + churn))
+    seconds = min(settings.SCHEDULER_MAX_INTERVAL, max(settings.SCHEDULER_MIN_INTERVAL, seconds))
+    return timedelta(seconds=seconds)
+
+
+def _last_seen(db: Session) -> Dict[TaskKey, datetime]:
+    rows = db.execute(
+        select(Mirror.merchant, Mirror.country, Mirror.keyword, func.max(Mirror.last_seen_at))
+        .group_by(Mirror.merchant, Mirror.country, Mirror.keyword)
+    )
+    return {(m, c, k): seen for m, c, k, seen in rows}
+
+
+def _churn(db: Session, since: datetime) -> Dict[TaskKey, int]:
+    rows = db.execute(
+        select(MirrorChange.merchant, MirrorChange.country, MirrorChange.keyword, func.count())
+        .where(
+            MirrorChange.kind == "final_domain_changed",
+            MirrorChange.changed_at >= since,
+        )
+        .group_by(MirrorChange.merchant, MirrorChange.country, MirrorChange.keyword)
+    )
+    return {(m, c, k): n for m, c, k, n in rows}
+
+
+def _dispatched(db: Session) -> Dict[TaskKey, datetime]:
+    rows = db.execute(
+        select(
+            CrawlSchedule.merchant,
+            CrawlSchedule.country,
+            CrawlSchedule.keyword,
+            CrawlSchedule.last_dispatched_at,
+        )
+    )
+    return {(m, c, k): at for m, c, k, at in rows}
+
+
+def plan(db: Session, now: Optional[datetime] = None) -> List[RecrawlTask]:
+    """
+    Все задачи (merchant, country, keyword) из merchants_config.json,
+    от самой «просроченной» к самой свежей.
+    """
+    now = now or datetime.utcnow()
+
+    last_seen = _last_seen(db)
+    churn = _churn(db, now - timedelta(seconds=settings.SCHEDULER_CHURN_WINDOW))
+    dispatched = _dispatched(db)
+
+    tasks: List[RecrawlTask] = []
+    for cfg in get_merchants().merchants:
+        for kw in cfg.keywords:
+            key = (cfg.merchant, cfg.country, kw)
+            seen_at = last_seen.get(key)
+            dispatched_at = dispatched.get(key)
+            changes = churn.get(key, 0)
+            interval = target_interval(cfg.priority, changes)
+
+            last = max((t for t in (seen_at, dispatched_at) if t is not None), default=None)
+            if last is None:
+                score = _NEVER_CRAWLED_SCORE * cfg.priority
+            else:
+                score = (now - last) / interval
+
+            tasks.append(
+                RecrawlTask(
+                    merchant=cfg.merchant,
+                    country=cfg.country,
+                    keyword=kw,
+                    brand_pattern=cfg.brand_pattern,
+                    priority=cfg.priority,
+                    last_seen_at=seen_at,
+                    last_dispatched_at=dispatched_at,
+                    churn=changes,
+                    interval=interval,
+                    score=score,
+                )
+            )
+
+    tasks.sort(key=lambda t: t.score, reverse=True)
+    return tasks
+
+
+def _mark_dispatched(db: Session, tasks: List[RecrawlTask], job_id: int, now: datetime) -> None:
+    for task in tasks:
+        row = db.scalar(
+            select(CrawlSchedule).where(
+                CrawlSchedule.merchant == task.merchant,
+                CrawlSchedule.country == task.country,
+                CrawlSchedule.keyword == task.keyword,
+            )
+        )
+        if row is None:
+            row = CrawlSchedule(merchant=task.merchant, country=task.country, keyword=task.keyword)
+            db.add(row)
+        row.last_dispatched_at = now
+        row.last_job_id = job_id
+
+
+def queued_jobs(db: Session) -> int:
+    return db.scalar(
+        select(func.count()).select_from(CollectionJob).where(CollectionJob.status == "queued")
+    )
+
+
+def due_tasks(db: Session, budget: int, now: Optional[datetime] = None) -> List[RecrawlTask]:
+    """До budget самых просроченных задач."""
+    if budget <= 0:
+        return []
+    return [task for task in plan(db, now) if task.is_due][:budget]
+
+
+def dispatch(db: Session, due: List[RecrawlTask], now: Optional[datetime] = None) -> List[int]:
+    """
+    Ставит задачи в очередь заданиями "batch" — по одному на
+    (merchant, country). Возвращает id поставленных заданий.
+
+    Задание и отметка в crawl_schedule пишутся одной транзакцией:
+    иначе падение между ними поставило бы ту же задачу ещё раз
+    на следующем тике.
+    """
+    now = now or datetime.utcnow()
+
+    groups: Dict[Tuple[str, str], List[RecrawlTask]] = {}
+    for task in due:
+        groups.setdefault((task.merchant, task.country), []).append(task)
+
+    job_ids: List[int] = []
+    for (merchant, country), tasks in groups.items():
+        keywords = [task.keyword for task in tasks]
+        limit = settings.SCHEDULER_RESULTS_PER_KEYWORD * len(keywords)
+
+        job = enqueue_job(
+            db,
+            "batch",
+            {
+                "items": [
+                    {
+                        "merchant": merchant,
+                        "country": country,
+                        "keywords": keywords,
+                        "brand_pattern": tasks[0].brand_pattern,
+                        "limit": limit,
+                    }
+                ],
+                "limit": limit,
+                "follow_redirects": True,
+                "scheduled": True,
+            },
+            commit=False,
+        )
+        _mark_dispatched(db, tasks, job.id, now)
+        db.commit()
+        job_ids.append(job.id)
+
+        logger.info(
+            "scheduled job %s: %s/%s %s",
+            job.id,
+            merchant,
+            country,
+            ", ".join(keywords),
+        )
+
+    return job_ids
+
+
+class RequestBudget:
+    """
+    Бюджет запросов в минуту: копится между тиками (не больше burst),
+    расходуется целыми задачами.
+    """
+
+    def __init__(self, per_minute: float, *, burst: Optional[float] = None) -> None:
+        self.per_minute = per_minute
+        self.burst = burst or per_minute
+        self.tokens = 0.0
+        self._updated: Optional[datetime] = None
+
+    def refill(self, now: datetime) -> int:
+        if self._updated is None:
+            self.tokens = self.burst
+        else:
+            elapsed = (now - self._updated).total_seconds()
+            self.tokens = min(self.burst, self.tokens + elapsed * self.per_minute / 60)
+        self._updated = now
+        return int(self.tokens)
+
+    def spend(self, amount: int) -> None:
+        self.tokens = max(0.0, self.tokens - amount)
+
+
+def tick(db: Session, budget: RequestBudget, now: Optional[datetime] = None) -> List[int]:
+    """
+    Один шаг планировщика: если очередь разобрана, отправляет
+    просроченные задачи в пределах накопленного бюджета.
+    """
+    now = now or datetime.utcnow()
+    available = budget.refill(now)
+
+    if queued_jobs(db) >= settings.SCHEDULER_MAX_QUEUED_JOBS:
+        logger.info("queue is busy, skipping tick")
+        return []
+
+    due = due_tasks(db, available, now)
+    job_ids = dispatch(db, due, now)
+    budget.spend(len(due))
+    return job_ids
@@ -0,0 +1,268 @@
+# services/search_cache.py
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import bindparam, delete, func, select, update
+
+from config import get_settings
+from db import AsyncReadSessionLocal, AsyncSessionLocal
+from models import SearchCacheEntry
+
+from .metrics import CACHE_REQUESTS
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SearchCacheStats:
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    refreshes: int = 0
+    evictions: int = 0
+
+
+class SearchCache:
+    """
+    Персистентный кэш поисковой выдачи (таблица search_cache).
+
+    - запись моложе ttl — отдаём без запроса к API;
+    - запись моложе ttl + stale_ttl — отдаём сразу и обновляем в фоне
+      (stale-while-revalidate);
+    - старше — обычный промах: идём в API и сохраняем результат.
+
+    Размер ограничен max_entries: лишние записи вытесняются
+    по last_access_at (LRU). Ошибки API не кэшируются.
+
+    Чтение идёт через соединения только для чтения, а last_access_at
+    копится в памяти и пишется пачкой (touch_batch обращений, раз в
+    touch_interval секунд или перед вытеснением): попадание в кэш
+    не берёт блокировку записи SQLite. Несброшенные обращения при
+    остановке процесса теряются — LRU от этого лишь чуть менее точен.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: int,
+        stale_ttl: int,
+        max_entries: int,
+        enabled: bool = True,
+        touch_batch: int = 500,
+        touch_interval: float = 60.0,
+    ) -> None:
+        self.ttl = timedelta(seconds=ttl)
+        self.stale_ttl = timedelta(seconds=stale_ttl)
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.touch_batch = max(1, touch_batch)
+        self.touch_interval = touch_interval
+        self.stats = SearchCacheStats()
+
+        # key -> время последнего обращения, ещё не записанное в БД
+        self._touched: Dict[str, datetime] = {}
+        self._touches_flushed_at = time.monotonic()
+        self._touch_task: Optional[asyncio.Task] = None
+
+        # Один и тот же ключ не запрашиваем параллельно дважды
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def make_key(query: str, num: int, gl: Optional[str], hl: Optional[str]) -> str:
+        raw = json.dumps([query, num, gl, hl], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_or_fetch(
+        self,
+        *,
+        query: str,
+        num: int,
+        gl: Optional[str],
+        hl: Optional[str],
+        fetch: Callable[[], Awaitable[List[str]]],
+    ) -> List[str]:
+        if not self.enabled:
+            return await fetch()
+
+        key = self.make_key(query, num, gl, hl)
+        entry = await self._load(key)
+        now = datetime.utcnow()
+
+        if entry is not None:
+            age = now - entry.fetched_at
+            results = json.loads(entry.results)
+
+            if age < self.ttl:
+                self.stats.hits += 1
+                CACHE_REQUESTS.labels(cache="search", result="hit").inc()
+                return results
+
+            if age < self.ttl + self.stale_ttl:
+                self.stats.stale_hits += 1
+                CACHE_REQUESTS.labels(cache="search", result="stale").inc()
+                if key not in self._inflight:
+                    task = asyncio.create_task(
+                        self._refresh(key, query, num, gl, hl, fetch)
+                    )
+                    self._background.add(task)
+                    task.add_done_callback(self._background.discard)
+                return results
+
+        self.stats.misses += 1
+        CACHE_REQUESTS.labels(cache="search", result="miss").inc()
+        return await self._fetch_and_store(key, query, num, gl, hl, fetch)
+
+    def snapshot(self) -> dict:
+        return asdict(self.stats)
+
+    # ---------- внутреннее ----------
+
+    async def _refresh(self, key, query, num, gl, hl, fetch) -> None:
+        try:
+            await self._fetch_and_store(key, query, num, gl, hl, fetch)
+            self.stats.refreshes += 1
+        except Exception:
+            # Остаётся старая запись — повторим при следующем обращении
+            logger.warning("search cache refresh failed for %r", query, exc_info=True)
+
+    async def _fetch_and_store(self, key, query, num, gl, hl, fetch) -> List[str]:
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return list(await asyncio.shield(inflight))
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            results = await fetch()
+            await self._store(key, query, num, gl, hl, results)
+            fut.set_result(results)
+            return results
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            # Исключение уже отдали ожидающим — не даём asyncio ругаться
+            fut.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load(self, key: str) -> Optional[SearchCacheEntry]:
+        try:
+            async with AsyncReadSessionLocal() as db:
+                entry = await db.get(SearchCacheEntry, key)
+        except Exception:
+            logger.warning("search cache read failed", exc_info=True)
+            return None
+
+        if entry is not None:
+            self._touch(key)
+        return entry
+
+    def _touch(self, key: str) -> None:
+        self._touched[key] = datetime.utcnow()
+
+        due = (
+            len(self._touched) >= self.touch_batch
+            or time.monotonic() - self._touches_flushed_at >= self.touch_interval
+        )
+        if due and (self._touch_task is None or self._touch_task.done()):
+            self._touch_task = asyncio.create_task(self._flush_touches())
+
+    async def _flush_touches(self) -> None:
+        db = AsyncSessionLocal()
+        try:
+            await self._write_touches(db)
+        except Exception:
+            await db.rollback()
+            logger.warning("search cache touch flush failed", exc_info=True)
+        finally:
+            await db.close()
+
+    async def _write_touches(self, db) -> None:
+        """Пишет накопленные last_access_at одним executemany (commit — здесь же)."""
+        touched, self._touched = self._touched, {}
+        self._touches_flushed_at = time.monotonic()
+        if not touched:
+            return
+
+        table = SearchCacheEntry.__table__
+        await db.execute(
+            update(table)
+            .where(table.c.key == bindparam("touched_key"))
+            .values(last_access_at=bindparam("touched_at")),
+            [{"touched_key": key, "touched_at": at} for key, at in touched.items()],
+        )
+        await db.commit()
+
+    async def _store(self, key, query, num, gl, hl, results: List[str]) -> None:
+        now = datetime.utcnow()
+        db = AsyncSessionLocal()
+        try:
+            await db.merge(
+                SearchCacheEntry(
+                    key=key,
+                    query=query,
+                    num=num,
+                    gl=gl,
+                    hl=hl,
+                    results=json.dumps(results, ensure_ascii=False),
+                    fetched_at=now,
+                    last_access_at=now,
+                )
+            )
+            await db.commit()
+            await self._evict(db)
+        except Exception:
+            await db.rollback()
+            logger.warning("search cache write failed", exc_info=True)
+        finally:
+            await db.close()
+
+    async def _evict(self, db) -> None:
+        # Свежие обращения — до выбора вытесняемых, иначе уйдут «горячие» записи
+        await self._write_touches(db)
+
+        count = await db.scalar(select(func.count()).select_from(SearchCacheEntry))
+        excess = (count or 0) - self.max_entries
+        if excess <= 0:
+            return
+
+        oldest = (
+            select(SearchCacheEntry.key)
+            .order_by(SearchCacheEntry.last_access_at.asc())
+            .limit(excess)
+        )
+        await db.execute(delete(SearchCacheEntry).where(SearchCacheEntry.key.in_(oldest)))
+        await db.commit()
+        self.stats.evictions += excess
+
+
+_cache: Optional[SearchCache] = None
+
+
+def get_search_cache() -> SearchCache:
+    global _cache
+    if _cache is None:
+        _cache = SearchCache(
+            ttl=settings.SEARCH_CACHE_TTL,
+            stale_ttl=settings.SEARCH_CACHE_STALE_TTL,
+            max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+            enabled=settings.SEARCH_CACHE_ENABLED,
+            touch_batch=settings.SEARCH_CACHE_TOUCH_BATCH,
+            touch_interval=settings.SEARCH_CACHE_TOUCH_INTERVAL,
+        )
+    return _cache
@@ -1,10 +1,15 @@
 import os
 from typing import List
+
 import httpx
 
+from .http_clients import get_serper_client
+from .metrics import SERPER_LATENCY
+from .search_cache import get_search_cache
+from .throttle import RETRYABLE_STATUSES, CircuitOpenError, RetryableError, get_serper_upstream
 
 SERPER_API_KEY = os.getenv("SERPER_API_KEY", "")
-SERPER_URL = "https://google.serper.dev/search"
+SERPER_URL = os.getenv("SERPER_URL", "https://google.serper.dev/search")
 
 
 class SerperError(Exception):
@@ -17,7 +22,18 @@ async def search_domains(
 ) -> List[str]:
     """
     Делает запрос в Serper.dev и возвращает список URL из органической выдачи.
+    Повторные запросы в пределах TTL отдаются из кэша (services/search_cache.py).
     """
+    return await get_search_cache().get_or_fetch(
+        query=query,
+        num=num,
+        gl=None,
+        hl=None,
+        fetch=lambda: _search_domains_uncached(query, num),
+    )
+
+
+async def _search_domains_uncached(query: str, num: int) -> List[str]:
     if not SERPER_API_KEY:
         raise SerperError("SERPER_API_KEY is not set in environment")
 
@@ -31,12 +47,25 @@ async def search_domains(
         "num": num,
     }
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(SERPER_URL, headers=headers, json=payload)
-        if resp.status_code != 200:
-            raise SerperError(f"Serper error {resp.status_code}: {resp.text}")
+    client = get_serper_client()
+
+    async def request() -> httpx.Response:
+        with SERPER_LATENCY.time():
+            resp = await client.post(SERPER_URL, headers=headers, json=payload, timeout=30)
+        if resp.status_code in RETRYABLE_STATUSES:
+            raise RetryableError.from_response(resp, "serper")
+        return resp
+
+    # Общая квота Serper и повторы на 429/5xx (services/throttle.py)
+    try:
+        resp = await get_serper_upstream().call("serper", request)
+    except (RetryableError, CircuitOpenError, httpx.TransportError) as e:
+        raise SerperError(f"Serper unavailable: {e}") from e
+
+    if resp.status_code != 200:
+        raise SerperError(f"Serper error {resp.status_code}: {resp.text}")
 
-        data = resp.json()
+    data = resp.json()
 
     urls: List[str] = []
     for item in data.get("organic", []):
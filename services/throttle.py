@@ -0,0 +1,354 @@
+# services/throttle.py
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from config import get_settings
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Ответы, после которых имеет смысл подождать и повторить
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    """
+    Временная ошибка апстрима (429/5xx). retry_after — сколько секунд
+    просил подождать сервер (заголовок Retry-After), response — последний
+    ответ, если он был.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        *,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        response: Optional[httpx.Response] = None,
+    ) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.response = response
+
+    @classmethod
+    def from_response(cls, resp: httpx.Response, what: str) -> "RetryableError":
+        return cls(
+            f"{what}: HTTP {resp.status_code}",
+            status=resp.status_code,
+            retry_after=parse_retry_after(resp.headers.get("retry-after")),
+            response=resp,
+        )
+
+
+class CircuitOpenError(Exception):
+    """Хост временно отключён: слишком много ошибок подряд."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After: число секунд или HTTP-дата."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    Token bucket с адаптивной скоростью (AIMD): на 429 скорость
+    делится пополам, на каждый успешный запрос медленно растёт обратно
+    до max_rate.
+
+    Без asyncio.Lock: место в очереди резервируется синхронно
+    (токены могут уйти в минус), так что корутина просто спит своё время.
+    Поэтому объект не привязан к конкретному event loop.
+    """
+
+    def __init__(self, rate: float, burst: int, *, min_rate: Optional[float] = None) -> None:
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Забирает токен, возвращает сколько секунд подождать до него."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def slow_down(self) -> None:
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self) -> None:
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """
+    closed → (failure_threshold ошибок подряд) → open на reset_timeout
+    → half-open: пропускаем одну пробную попытку; успех закрывает,
+    ошибка снова открывает.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def check(self, name: str) -> None:
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing):
+            raise CircuitOpenError(f"circuit open for {name}")
+        if state == "half_open":
+            self._probing = True
+
+    def release(self) -> None:
+        """Пробная попытка закончилась без вердикта (отмена, чужая ошибка)."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+@dataclass
+class ThrottleStats:
+    calls: int = 0
+    retries: int = 0
+    throttled: int = 0  # ответы 429
+    failures: int = 0
+    rejected: int = 0  # отбито открытым breaker-ом
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Экспоненциальная задержка с full jitter: random(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# Сетевые сбои, которые могут пройти при повторе. UnsupportedProtocol
+# (tg://, intent://), LocalProtocolError и т.п. детерминированы: повтор
+# только тратит время и открывает breaker хоста.
+_RETRYABLE_ERRORS = (
+    RetryableError,
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    httpx.RemoteProtocolError,
+)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    return isinstance(exc, _RETRYABLE_ERRORS)
+
+
+class Upstream:
+    """
+    Ограничитель для одного апстрима: свой token bucket и circuit breaker
+    на каждый ключ (хост), повторы с backoff и уважением Retry-After.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        rate: float,
+        burst: int,
+        attempts: int,
+        base_delay: float,
+        max_delay: float,
+        failure_threshold: int,
+        reset_timeout: float,
+        max_keys: int = 10_000,
+    ) -> None:
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_keys = max_keys
+        self.stats = ThrottleStats()
+        self._keys: "OrderedDict[str, tuple[TokenBucket, CircuitBreaker]]" = OrderedDict()
+
+    def _state(self, key: str) -> "tuple[TokenBucket, CircuitBreaker]":
+        state = self._keys.get(key)
+        if state is None:
+            state = (
+                TokenBucket(self.rate, self.burst),
+                CircuitBreaker(self.failure_threshold, self.reset_timeout),
+            )
+            self._keys[key] = state
+            if len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        else:
+            self._keys.move_to_end(key)
+        return state
+
+    async def call(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        *,
+        attempts: Optional[int] = None,
+    ) -> T:
+        """
+        Выполняет fn() с учётом лимита, breaker-а и повторов.
+        Повторяются только RetryableError и временные сетевые ошибки httpx
+        (таймаут, обрыв соединения); остальные исключения пробрасываются
+        сразу и breaker не трогают.
+        """
+        bucket, breaker = self._state(key)
+        label = f"{self.name}:{key}"
+        attempts = max(1, attempts or self.attempts)
+
+        for attempt in range(attempts):
+            try:
+                breaker.check(label)
+            except CircuitOpenError:
+                self.stats.rejected += 1
+                raise
+
+            await bucket.acquire()
+            self.stats.calls += 1
+
+            try:
+                result = await fn()
+            except Exception as e:
+                breaker.release()
+                if not _is_retryable(e):
+                    raise
+
+                retry_after = getattr(e, "retry_after", None)
+                if getattr(e, "status", None) == 429:
+                    # Нас притормозили — это не поломка хоста, breaker не трогаем
+                    self.stats.throttled += 1
+                    bucket.slow_down()
+                else:
+                    self.stats.failures += 1
+                    breaker.record_failure()
+
+                if attempt + 1 >= attempts:
+                    raise
+                if retry_after is not None and retry_after > self.max_delay:
+                    # Просят ждать дольше, чем мы готовы, — не висим
+                    raise
+
+                delay = max(
+                    retry_after or 0.0,
+                    backoff_delay(attempt, self.base_delay, self.max_delay),
+                )
+                self.stats.retries += 1
+                logger.info("%s: %s, retry %d in %.1fs", label, e, attempt + 1, delay)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Отмена задачи — не повод держать breaker в half-open
+                breaker.release()
+                raise
+
+            breaker.record_success()
+            bucket.speed_up()
+            return result
+
+        raise RuntimeError("unreachable")
+
+    def snapshot(self) -> dict:
+        open_keys = [key for key, (_, breaker) in self._keys.items() if breaker.state != "closed"]
+        return {**asdict(self.stats), "keys": len(self._keys), "open_circuits": open_keys[:50]}
+
+
+_upstreams: Dict[str, Upstream] = {}
+
+
+def get_serper_upstream() -> Upstream:
+    """Квота Serper.dev — общая на все запросы (один ключ)."""
+    upstream = _upstreams.get("serper")
+    if upstream is None:
+        upstream = _upstreams["serper"] = Upstream(
+            "serper",
+            rate=settings.SERPER_RATE_PER_SECOND,
+            burst=settings.SERPER_BURST,
+            attempts=settings.RETRY_ATTEMPTS,
+            base_delay=settings.RETRY_BASE_DELAY,
+            max_delay=settings.RETRY_MAX_DELAY,
+            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.CIRCUIT_RESET_SECONDS,
+        )
+    return upstream
+
+
+def get_host_upstream() -> Upstream:
+    """Вежливые лимиты на каждый целевой хост (редиректоры, лендинги)."""
+    upstream = _upstreams.get("hosts")
+    if upstream is None:
+        upstream = _upstreams["hosts"] = Upstream(
+            "host",
+            rate=settings.HOST_RATE_PER_SECOND,
+            burst=settings.HOST_BURST,
+            attempts=settings.RETRY_ATTEMPTS,
+            base_delay=settings.RETRY_BASE_DELAY,
+            max_delay=settings.RETRY_MAX_DELAY,
+            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.CIRCUIT_RESET_SECONDS,
+        )
+    return upstream
+
+
+def throttle_snapshot() -> dict:
+    return {name: upstream.snapshot() for name, upstream in _upstreams.items()}
@@ -0,0 +1,350 @@
+# services/tiered_resolver.py
+
+from __future__ import annotations
+
+import logging
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from config import get_settings
+
+from .browser_resolver import resolve_url as browser_resolve_url
+from .cta import cta_texts_for
+from .http_clients import get_target_client
+from .metrics import count_error
+from .redirect_cache import get_redirect_cache
+from .redirect_probe import RedirectProbe, probe_redirects
+from .throttle import RETRYABLE_STATUSES, CircuitOpenError, RetryableError, get_host_upstream
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# Переход на другой адрес в content: "0; url=https://..."
+_REFRESH_URL_RE = re.compile(r"url\s*=", re.IGNORECASE)
+
+_LOCATION_JUMP_RE = re.compile(
+    r"(?<![\w.$])(?:(?:window|document|top|self)\.)?location"
+    r"(?:\.href\s*=(?!=)|\s*=(?!=)|\.(?:replace|assign)\s*\()"
+)
+
+# Строки и комментарии в JS: их содержимое не влияет на вложенность
+_JS_NOISE_RE = re.compile(
+    r"\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`|//[^\n]*|/\*.*?\*/",
+    re.DOTALL,
+)
+
+# Текст внутри этих тегов пользователь не видит
+_INVISIBLE_TAGS = {"script", "style", "template", "noscript", "title"}
+
+# Признаки страниц-заглушек: антибот-проверки, «включите JavaScript» и т.п.
+_INTERSTITIAL_MARKERS = [
+    "cf-browser-verification",
+    "challenge-platform",
+    "just a moment...",
+    "checking your browser",
+    "ddos protection by",
+    "enable javascript",
+    "please turn javascript on",
+    "g-recaptcha",
+    "h-captcha",
+]
+
+
+@dataclass
+class TieredResolution:
+    start_url: str
+    final_url: str
+    final_domain: str
+    redirects: List[str] = field(default_factory=list)
+    # Кто дал окончательный ответ: "http" или "browser" (None — резолва не было)
+    tier: Optional[str] = None
+    # Ответ взят из redirect_cache (tier — уровень, который его когда-то получил)
+    from_cache: bool = False
+    # Почему понадобился браузер (meta_refresh, js_redirect, interstitial, cta, http_error)
+    escalation_reason: Optional[str] = None
+    # Текст нажатой кнопки (только tier="browser")
+    cta_text: Optional[str] = None
+
+    @property
+    def cta_found(self) -> bool:
+        return self.cta_text is not None
+
+    @property
+    def is_redirector(self) -> bool:
+        start_domain = urlparse(self.start_url).netloc.lower()
+        return bool(self.final_domain) and self.final_domain != start_domain
+
+
+class _PageSignals(HTMLParser):
+    """
+    Что на странице может увести дальше без участия httpx:
+    meta refresh с адресом, inline-скрипты и подписи кликабельных
+    элементов (<a>, <button>, [role=button], кнопки <input>).
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.meta_refresh = False
+        self.scripts: List[str] = []
+        self.labels: List[str] = []
+        self._invisible: List[str] = []
+        # Открытые кликабельные элементы: [тег, вложенность того же тега, текст]
+        self._clickable: List[list] = []
+        self._script: Optional[List[str]] = None
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        attr = {k.lower(): (v or "") for k, v in attrs}
+
+        if tag == "meta" and not self._invisible:
+            if attr.get("http-equiv", "").lower() == "refresh" and _REFRESH_URL_RE.search(
+                attr.get("content", "")
+            ):
+                self.meta_refresh = True
+            return
+
+        for item in self._clickable:
+            if item[0] == tag:
+                item[1] += 1
+
+        if tag in _INVISIBLE_TAGS:
+            self._invisible.append(tag)
+            if tag == "script" and not attr.get("src"):
+                self._script = []
+            return
+
+        hidden = (
+            "hidden" in attr
+            or attr.get("aria-hidden", "").lower() == "true"
+            or "display:none" in attr.get("style", "").replace(" ", "").lower()
+        )
+        if hidden or self._invisible:
+            return
+
+        if tag == "input" and attr.get("type", "").lower() in ("button", "submit"):
+            self.labels.append(attr.get("value", ""))
+        elif tag in ("a", "button") or attr.get("role", "").lower() == "button":
+            self._clickable.append([tag, 1, []])
+
+    def handle_startendtag(self, tag: str, attrs) -> None:
+        # <meta .../>, <input .../>: без закрывающего тега
+        if tag in ("meta", "input"):
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag: str) -> None:
+        if self._invisible and self._invisible[-1] == tag:
+            self._invisible.pop()
+            if tag == "script" and self._script is not None:
+                self.scripts.append("".join(self._script))
+                self._script = None
+            return
+
+        for item in list(self._clickable):
+            if item[0] == tag:
+                item[1] -= 1
+                if item[1] == 0:
+                    self._clickable.remove(item)
+                    self.labels.append("".join(item[2]))
+
+    def handle_data(self, data: str) -> None:
+        if self._script is not None:
+            self._script.append(data)
+        elif not self._invisible:
+            for item in self._clickable:
+                item[2].append(data)
+
+    def close(self) -> None:
+        super().close()
+        # Страница обрезана на TIERED_SNIFF_BYTES: дочитываем то, что успели
+        if self._script is not None:
+            self.scripts.append("".join(self._script))
+        self.labels.extend("".join(item[2]) for item in self._clickable)
+
+
+def _normalize_label(text: str) -> str:
+    # Стрелки, кавычки и пробелы по краям («Continue →») не считаются
+    text = " ".join(text.split()).casefold()
+    return re.sub(r"^[\W_]+|[\W_]+$", "", text)
+
+
+def _has_location_jump(script: str) -> bool:
+    """
+    Безусловный переход верхнего уровня: location.href = ..., location = ...,
+    location.replace(...). Присваивание внутри функции, обработчика
+    или после if/&&/? не считается — оно может и не выполниться.
+    """
+    code = _JS_NOISE_RE.sub('""', script)
+    for match in _LOCATION_JUMP_RE.finditer(code):
+        before = code[: match.start()]
+        if before.count("{") != before.count("}") or before.count("(") != before.count(")"):
+            continue
+        # Начало инструкции: после ; { } или с начала скрипта
+        statement = re.split(r"[;{}]", before)[-1]
+        if not statement.strip():
+            return True
+    return False
+
+
+async def _sniff_html(url: str) -> Optional[str]:
+    """
+    Читает только начало страницы (TIERED_SNIFF_BYTES) — этого хватает,
+    чтобы увидеть meta refresh, JS-редирект или заглушку.
+    url — конец цепочки probe_redirects, поэтому редиректы не выполняются,
+    а запрос идёт через тот же лимит и breaker хоста (services/throttle.py).
+    """
+    client = get_target_client()
+
+    async def read() -> Optional[str]:
+        async with client.stream("GET", url, follow_redirects=False) as resp:
+            if resp.status_code in RETRYABLE_STATUSES:
+                raise RetryableError.from_response(resp, url)
+
+            content_type = resp.headers.get("content-type", "")
+            if content_type and "html" not in content_type:
+                return None
+
+            chunks: List[bytes] = []
+            size = 0
+            async for chunk in resp.aiter_bytes():
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= settings.TIERED_SNIFF_BYTES:
+                    break
+
+            encoding = resp.encoding or "utf-8"
+            return b"".join(chunks)[: settings.TIERED_SNIFF_BYTES].decode(encoding, errors="ignore")
+
+    return await get_host_upstream().call(urlparse(url).netloc.lower(), read)
+
+
+def escalation_reason(html: str, click_texts: List[str]) -> Optional[str]:
+    """
+    Эвристики «здесь нужен настоящий браузер».
+    Возвращает причину или None, если HTTP-результату можно верить.
+
+    Кнопкой считается только видимая подпись ссылки/кнопки, целиком
+    равная одному из click_texts: «Continue reading» или ссылка /login
+    в шапке браузер не вызывают.
+    """
+    signals = _PageSignals()
+    signals.feed(html)
+    signals.close()
+
+    if signals.meta_refresh:
+        return "meta_refresh"
+    if any(_has_location_jump(script) for script in signals.scripts):
+        return "js_redirect"
+    lowered = html.lower()
+    if any(marker in lowered for marker in _INTERSTITIAL_MARKERS):
+        return "interstitial"
+
+    wanted = {_normalize_label(text) for text in click_texts}
+    wanted.discard("")
+    if any(_normalize_label(label) in wanted for label in signals.labels):
+        return "cta"
+    return None
+
+
+async def resolve_tiered(
+    url: str,
+    *,
+    click_texts: List[str] | None = None,
+    wait_seconds: int = 8,
+    use_cache: bool = True,
+    country: Optional[str] = None,
+) -> TieredResolution:
+    """
+    Резолв в два уровня:
+      1) httpx: цепочка редиректов (HEAD/stream-GET) + первые килобайты
+         финальной страницы;
+      2) Playwright — только если по HTTP-ответу видно, что без браузера
+         не обойтись (JS/meta-редирект, заглушка, кнопка из click_texts)
+         или HTTP-запрос вообще не прошёл.
+    В результате видно, какой уровень дал ответ (tier) и какая кнопка
+    была нажата (cta_text). Без click_texts берётся пресет кнопок
+    для country (services/cta.py).
+    """
+    click_texts = click_texts or cta_texts_for(country)
+    cache = get_redirect_cache()
+
+    if use_cache:
+        # Если URL уже когда-то требовал браузер — сразу берём его результат
+        for kind in ("browser", "http"):
+            cached = await cache.get(kind, url)
+            if cached is not None:
+                return TieredResolution(
+                    start_url=url,
+                    final_url=cached.final_url,
+                    final_domain=cached.final_domain,
+                    redirects=cached.chain,
+                    tier=kind,
+                    from_cache=True,
+                    cta_text=cached.cta_text,
+                )
+
+    reason: Optional[str] = None
+
+    probe = await probe_redirects(url)
+    if probe.error is not None and len(probe.hops) <= 1:
+        reason = "http_error"
+    elif settings.TIERED_ESCALATION_ENABLED and not probe.leaves_web:
+        try:
+            html = await _sniff_html(probe.final_url)
+        except (httpx.HTTPError, RetryableError, CircuitOpenError):
+            html = None
+        if html:
+            reason = escalation_reason(html, click_texts)
+
+    if reason is None or not settings.TIERED_ESCALATION_ENABLED:
+        if probe.error is None:
+            await cache.put(
+                "http",
+                url,
+                final_url=probe.final_url,
+                final_domain=urlparse(probe.final_url).netloc.lower(),
+                chain=probe.chain,
+                hop_statuses=probe.statuses,
+            )
+        return _http_result(url, probe)
+
+    try:
+        final_url, redirects, cta = await browser_resolve_url(
+            url,
+            wait_seconds=wait_seconds,
+            click_texts=click_texts,
+            use_cache=False,
+        )
+    except Exception as e:
+        if reason == "http_error":
+            raise
+        # Браузер не справился — цепочка, пройденная httpx, всё равно лучше, чем ничего
+        count_error("browser", e)
+        logger.warning("browser tier failed for %s, keeping http result: %s", url, e)
+        result = _http_result(url, probe)
+        result.escalation_reason = reason
+        return result
+
+    return TieredResolution(
+        start_url=url,
+        final_url=final_url,
+        final_domain=urlparse(final_url).netloc.lower(),
+        redirects=redirects,
+        tier="browser",
+        escalation_reason=reason,
+        cta_text=cta,
+    )
+
+
+def _http_result(url: str, probe: RedirectProbe) -> TieredResolution:
+    return TieredResolution(
+        start_url=url,
+        final_url=probe.final_url,
+        final_domain=urlparse(probe.final_url).netloc.lower(),
+        redirects=probe.chain,
+        tier="http",
+    )
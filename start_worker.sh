@@ -0,0 +1,18 @@
+#!/usr/bin/env bash
+set -e
+
+# Переходим в папку проекта
+cd "$(dirname "$0")"
+
+# Активируем виртуальное окружение
+source .venv/bin/activate
+
+# Подгружаем переменные из .env (включая SERPER_API_KEY)
+if [ -f ".env" ]; then
+  set -a
+  source .env
+  set +a
+fi
+
+# Запускаем воркер, который выполняет задания из очереди collection_jobs
+python worker.py "$@"
@@ -0,0 +1,154 @@
+# worker.py
+"""
+Отдельный процесс, который выполняет задания на сбор зеркал из БД.
+
+Запуск:
+    python worker.py                 # concurrency из настроек
+    python worker.py --concurrency 4
+
+API только ставит задания в очередь (collection_jobs), поэтому
+тяжёлые прогоны не отнимают ресурсы у обработки HTTP-запросов.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+from typing import Optional, Set, Tuple
+
+from prometheus_client import start_http_server
+
+from config import get_settings
+from db import dispose_async_engines, init_db, run_in_writer
+from services.browser_pool import get_browser_pool
+from services.http_clients import close_http_clients, init_http_clients
+from services.jobs import (
+    claim_job,
+    complete_job,
+    fail_job,
+    record_progress,
+    renew_lease,
+    run_job,
+)
+
+settings = get_settings()
+
+logger = logging.getLogger("worker")
+
+
+async def _heartbeat(job_id: int, worker_id: str, task: asyncio.Task) -> None:
+    """
+    Продлевает lease, пока задание выполняется.
+    Если lease перехватил другой воркер — отменяем своё выполнение.
+    """
+    interval = max(1.0, settings.JOB_LEASE_SECONDS / 3)
+    while not task.done():
+        await asyncio.sleep(interval)
+        try:
+            if not await run_in_writer(renew_lease, job_id, worker_id):
+                logger.warning("job %s: lease lost, cancelling", job_id)
+                task.cancel()
+                return
+        except Exception:
+            logger.exception("job %s: lease renewal failed", job_id)
+
+
+def _claim(db, worker_id: str) -> Optional[Tuple[int, str, dict]]:
+    job = claim_job(db, worker_id)
+    return (job.id, job.kind, json.loads(job.params)) if job else None
+
+
+async def _execute(job_id: int, kind: str, params: dict, worker_id: str) -> None:
+    async def progress(state: dict) -> None:
+        await run_in_writer(record_progress, job_id, worker_id, state)
+
+    task = asyncio.create_task(run_job(kind, params, progress))
+    heartbeat = asyncio.create_task(_heartbeat(job_id, worker_id, task))
+
+    try:
+        result = await task
+    except asyncio.CancelledError:
+        # Либо lease потерян, либо воркер останавливается:
+        # задание не трогаем — его заберут после истечения lease.
+        return
+    except Exception as e:
+        logger.exception("job %s failed", job_id)
+        await run_in_writer(fail_job, job_id, worker_id, f"{type(e).__name__}: {e}")
+        return
+    finally:
+        heartbeat.cancel()
+
+    await run_in_writer(complete_job, job_id, worker_id, result)
+    logger.info("job %s done: %s", job_id, result)
+
+
+async def main(concurrency: int) -> None:
+    init_db()
+    await init_http_clients()
+    browser_pool = get_browser_pool()
+    await browser_pool.start()
+
+    if settings.WORKER_METRICS_PORT:
+        # Сбор идёт здесь, а не в API — метрики отдаём со своего порта
+        start_http_server(settings.WORKER_METRICS_PORT)
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    slots = asyncio.Semaphore(concurrency)
+    running: Set[asyncio.Task] = set()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info("worker %s started, concurrency=%d", worker_id, concurrency)
+
+    try:
+        while not stop.is_set():
+            await slots.acquire()
+
+            try:
+                job_args = await run_in_writer(_claim, worker_id)
+            except Exception:
+                logger.exception("claim failed")
+                job_args = None
+
+            if job_args is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(stop.wait(), settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info("job %s claimed (%s)", job_args[0], job_args[1])
+            task = asyncio.create_task(_execute(*job_args, worker_id))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+        # Даём текущим заданиям доработать
+        if running:
+            logger.info("waiting for %d running job(s)", len(running))
+            await asyncio.gather(*running, return_exceptions=True)
+    finally:
+        await close_http_clients()
+        await browser_pool.stop()
+        await dispose_async_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mirrors collection worker")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    asyncio.run(main(max(1, args.concurrency)))